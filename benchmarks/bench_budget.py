@@ -0,0 +1,204 @@
+"""
+Benchmark du module Budget en fonction de la taille du registre
+
+Génère des foyers synthétiques (1k à 1M dépenses) dans le backend en
+mémoire (services/memory_backend.py), puis mesure les chemins de budget_page.py :
+synchronisation de l'année (sync_expenses : base locale SQLite puis
+_sync_collection) à la première visite, à une nouvelle session et après un
+redémarrage du serveur, construction du registre, filtre par année,
+regroupement par catégorie, métriques du tableau de bord, première page de
+la table des dépenses (get_transactions_page) et recherche par préfixe.
+Pour chaque scénario : temps, pic mémoire et nombre de lectures Firestore.
+Les résultats sont écrits en JSON (non versionnés : les temps dépendent de
+la machine) pour comparer deux commits sur le même poste. Les lectures, elles,
+ne dépendent que du code : elles sont comparées à la référence versionnée
+reference_budget.json et toute lecture supplémentaire fait échouer le script.
+
+Usage:
+    python benchmarks/bench_budget.py [--sizes 1000,10000] [--output fichier.json]
+    python benchmarks/bench_budget.py --update-reference
+"""
+import argparse
+import json
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "services"))
+
+import budget_service  # noqa: E402
+import local_store  # noqa: E402
+from budget_service import (CATEGORIES_DEPENSES, get_transactions_page, search_expenses,  # noqa: E402
+                            sync_expenses)
+from firestore_client import get_data_access  # noqa: E402
+from ledger_store import MOIS, LedgerStore, summary_frame  # noqa: E402
+from memory_backend import MemoryClient  # noqa: E402
+
+DEFAULT_SIZES = [1_000, 10_000, 100_000, 1_000_000]
+RESULTS_DIR = Path(__file__).parent / "results"
+REFERENCE_FILE = Path(__file__).parent / "reference_budget.json"
+YEARS = list(range(2016, 2026))
+USERS = ['Margaux', 'Souliman']
+MERCHANTS = ['Carrefour Market', 'Pharmacie du Centre', 'Boulangerie Léa', 'Station Total',
+             'Crèche Les Écureuils', 'Cinéma Pathé', 'Électricien Dupont', "Café de l'Hôtel"]
+SEARCH_QUERY = "pharma cent"
+
+def generate_expenses(count, seed=42):
+    """Produit les dépenses d'un foyer synthétique sur dix ans"""
+    rng = random.Random(seed)
+    # Horodatages serveur récents, comme SERVER_TIMESTAMP (high-water mark valide)
+    written = datetime.now(timezone.utc) - timedelta(seconds=count + 60)
+    for i in range(count):
+        yield {
+            'Catégories': rng.choice(CATEGORIES_DEPENSES),
+            'Montant': round(rng.uniform(2, 900), 2),
+            'Fréquence': rng.choice(['Mensuel', 'Annuel', 'Unique']),
+            'Description': f"{MERCHANTS[i % len(MERCHANTS)]} {i}",
+            'Mois': rng.choice(MOIS),
+            'Année': rng.choice(YEARS),
+            'Utilisateur': rng.choice(USERS),
+            'Timestamp': written + timedelta(seconds=i)
+        }
+
+def dashboard_metrics(ledger, year):
+    """Reproduit le calcul des métriques du tableau de bord (registre local)"""
+    df_summary = summary_frame(ledger.summary(year))
+    total_revenus = df_summary['revenue_total'].sum()
+    total_depenses = df_summary['expense_total'].sum()
+    reste_a_vivre = total_revenus - total_depenses
+    return total_depenses, reste_a_vivre
+
+def run_steps(client, year):
+    """Exécute les étapes mesurées, retourne {étape: (secondes, lectures)}"""
+    timings = {}
+    context = {}
+
+    def step(name, function):
+        reads = client.reads
+        started = time.perf_counter()
+        context[name] = function()
+        timings[name] = (time.perf_counter() - started, client.reads - reads)
+
+    with tempfile.TemporaryDirectory() as directory:
+        # Base locale vide et aucun snapshot en mémoire : premier démarrage du serveur
+        local_store._store = local_store.LocalStore(Path(directory) / "bench.sqlite3")
+        budget_service._sync_state.clear()
+        step('sync_first_visit', lambda: sync_expenses(year=year, strict=True))
+        step('sync_new_session', lambda: sync_expenses(year=year, strict=True))
+        # Redémarrage : le snapshot est relu depuis la base locale, puis complété
+        budget_service._sync_state.clear()
+        step('sync_after_restart', lambda: sync_expenses(year=year, strict=True))
+        ledger = LedgerStore()
+        step('build_ledger', lambda: ledger.refresh(context['sync_after_restart'], [], 1))
+        step('filter_year', lambda: ledger.expenses(year))
+        step('groupby_category', lambda: context['filter_year']
+             .groupby('Catégories', observed=True)['Montant'].sum())
+        step('dashboard_metrics', lambda: dashboard_metrics(ledger, year))
+        step('transactions_page', lambda: get_transactions_page('expenses', year))
+        step('search', lambda: search_expenses(SEARCH_QUERY, year=year))
+        local_store._store._conn.close()
+        local_store._store = None
+    return timings
+
+def run_scenario(size, year=YEARS[-1]):
+    client = MemoryClient()
+    client.seed('expenses', generate_expenses(size))
+    get_data_access().set_client(client, backend='memory')
+
+    # Temps mesurés sans tracemalloc, qui ralentit fortement les allocations
+    timings = run_steps(client, year)
+
+    tracemalloc.start()
+    run_steps(client, year)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    steps = {name: {'seconds': round(seconds, 6), 'reads': reads}
+             for name, (seconds, reads) in timings.items()}
+    total = sum(seconds for seconds, _ in timings.values())
+    print(f"{size:>9} dépenses  {total:7.3f} s  pic {peak / 1e6:7.1f} Mo  "
+          + "  ".join(f"{name} {s['seconds']:.3f}s" for name, s in steps.items()))
+    return {
+        'expenses': size,
+        'total_seconds': round(total, 6),
+        'peak_memory_mb': round(peak / 1e6, 2),
+        'firestore_reads': sum(s['reads'] for s in steps.values()),
+        'steps': steps
+    }
+
+def reference_reads(scenarios):
+    """Lectures Firestore par taille et par étape : {taille: {étape: lectures}}"""
+    return {str(scenario['expenses']): {name: step['reads'] for name, step in scenario['steps'].items()}
+            for scenario in scenarios}
+
+def compare_reads(scenarios, reference):
+    """
+    Compare les lectures mesurées à la référence
+
+    Returns:
+        Liste des régressions (taille, étape, lectures de référence, lectures mesurées)
+    """
+    regressions = []
+    for size, steps in reference_reads(scenarios).items():
+        expected = reference.get(size)
+        if expected is None:
+            print(f"{size:>9} dépenses  pas de référence")
+            continue
+        for name, reads in steps.items():
+            if name not in expected:
+                print(f"{size:>9} dépenses  {name}: {reads} lectures (nouvelle étape)")
+            elif reads > expected[name]:
+                regressions.append((size, name, expected[name], reads))
+            elif reads < expected[name]:
+                print(f"{size:>9} dépenses  {name}: {reads} lectures au lieu de {expected[name]}, "
+                      "mettre à jour la référence (--update-reference)")
+    for size, name, expected, reads in regressions:
+        print(f"{size:>9} dépenses  {name}: {reads} lectures au lieu de {expected} (régression)")
+    return regressions
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                              text=True, cwd=Path(__file__).parent, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--sizes', default=','.join(map(str, DEFAULT_SIZES)),
+                        help="Nombres de dépenses séparés par des virgules")
+    parser.add_argument('--output', help="Fichier JSON (par défaut results/budget_<commit>.json)")
+    parser.add_argument('--update-reference', action='store_true',
+                        help=f"Réécrit {REFERENCE_FILE.name} avec les lectures mesurées")
+    args = parser.parse_args()
+
+    commit = git_commit()
+    results = {
+        'benchmark': 'budget',
+        'commit': commit,
+        'date': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'scenarios': [run_scenario(int(size)) for size in args.sizes.split(',')]
+    }
+
+    output = Path(args.output) if args.output else RESULTS_DIR / f"budget_{commit or 'local'}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(results, indent=2, ensure_ascii=False), encoding='utf-8')
+    print(f"Résultats écrits dans {output}")
+
+    reference = (json.loads(REFERENCE_FILE.read_text(encoding='utf-8'))
+                 if REFERENCE_FILE.exists() else {'reads': {}})
+    if args.update_reference:
+        reference = {'benchmark': 'budget', 'commit': commit,
+                     'reads': {**reference['reads'], **reference_reads(results['scenarios'])}}
+        REFERENCE_FILE.write_text(json.dumps(reference, indent=2, ensure_ascii=False) + '\n',
+                                  encoding='utf-8')
+        print(f"Référence écrite dans {REFERENCE_FILE}")
+    elif compare_reads(results['scenarios'], reference['reads']):
+        sys.exit(1)
@@ -0,0 +1,74 @@
+"""
+Benchmark du pipeline d'import de relevés bancaires
+
+Génère un relevé CSV et un relevé OFX synthétiques en flux, puis mesure le
+débit (lignes/s) et le pic mémoire de la lecture, de la catégorisation et du
+dédoublonnage (recherche des empreintes dans une base locale temporaire).
+L'écriture Firestore est remplacée par un writer sans effet.
+
+Usage:
+    python benchmarks/bench_import.py [nombre_de_lignes]
+"""
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import date, timedelta
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "services"))
+
+from import_service import (DEFAULT_IMPORT_RULES, import_transactions,  # noqa: E402
+                            iter_csv_transactions, iter_ofx_transactions)
+from local_store import LocalStore  # noqa: E402
+
+LABELS = ['CB CARREFOUR MARKET', 'PRLV ENGIE', 'CB TOTAL ENERGIES', 'VIR LOYER MARS',
+          'PRLV VEOLIA EAU', 'CB BOULANGERIE', 'PRLV FREE MOBILE', 'CB LIDL']
+
+def csv_lines(count, seed=42):
+    """Produit les lignes d'un export CSV au format français"""
+    rng = random.Random(seed)
+    start = date(2015, 1, 1)
+    yield "Date opération;Libellé;Montant\n"
+    for i in range(count):
+        day = start + timedelta(days=i // 30)
+        amount = rng.uniform(-500, 100)
+        yield f"{day:%d/%m/%Y};{rng.choice(LABELS)} {i};{amount:.2f}".replace('.', ',') + "\n"
+
+def ofx_lines(count, seed=42):
+    """Produit les lignes d'un relevé OFX en SGML"""
+    rng = random.Random(seed)
+    start = date(2015, 1, 1)
+    yield "OFXHEADER:100\n<OFX><BANKMSGSRSV1><STMTTRNRS><STMTRS><BANKTRANLIST>\n"
+    for i in range(count):
+        day = start + timedelta(days=i // 30)
+        yield "<STMTTRN>\n<TRNTYPE>DEBIT\n"
+        yield f"<DTPOSTED>{day:%Y%m%d}\n<TRNAMT>{rng.uniform(-500, 100):.2f}\n"
+        yield f"<FITID>{i}\n<NAME>{rng.choice(LABELS)} {i}\n</STMTTRN>\n"
+    yield "</BANKTRANLIST></STMTRS></STMTTRNRS></BANKMSGSRSV1></OFX>\n"
+
+def run(name, make_transactions, store):
+    def find_known(hashes):
+        return store.known_import_hashes('expenses', hashes)
+
+    # Débit mesuré sans tracemalloc, qui ralentit fortement les allocations
+    started = time.perf_counter()
+    stats = import_transactions(make_transactions(), DEFAULT_IMPORT_RULES, find_known, lambda rows: rows)
+    elapsed = time.perf_counter() - started
+
+    tracemalloc.start()
+    import_transactions(make_transactions(), DEFAULT_IMPORT_RULES, find_known, lambda rows: rows)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{name:4} {stats['read']:>8} lignes  {elapsed:6.2f} s  "
+          f"{stats['read'] / elapsed:>9,.0f} lignes/s  pic {peak / 1e6:6.1f} Mo  "
+          f"({stats['imported']} importées, {stats['ignored']} crédits)")
+
+if __name__ == "__main__":
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    with tempfile.TemporaryDirectory() as directory:
+        store = LocalStore(Path(directory) / "bench.sqlite3")
+        run("CSV", lambda: iter_csv_transactions(csv_lines(rows)), store)
+        run("OFX", lambda: iter_ofx_transactions(ofx_lines(rows)), store)
+        store._conn.close()
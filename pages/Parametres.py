@@ -1,7 +1,6 @@
 import streamlit as st
 import sys
 from pathlib import Path
-import base64
 import time
 
 # Ajouter le dossier services au path
@@ -11,14 +10,18 @@ sys.path.insert(0, str(services_dir))
 
 # Imports des services
 try:
-    from firebase import (init_firebase, save_profile_image, load_profile_image,
-                         save_user_preferences, load_user_preferences, get_db)
+    from firebase import (init_firebase, save_profile_image, load_profile_image, load_profile_images,
+                         save_user_preferences, load_user_preferences, get_db,
+                         compact_notifications)
     from parametres_service import (get_all_users, add_user, delete_user,
                                    get_family_name, set_family_name,
                                    get_expense_categories, add_expense_category, delete_expense_category,
                                    get_revenue_sources, add_revenue_source, delete_revenue_source,
-                                   get_user_theme, save_user_theme)
+                                   get_import_rules, save_import_rules, unknown_rule_categories,
+                                   get_user_theme, save_user_theme,
+                                   get_notification_policy, save_notification_policy)
     from theme_manager import apply_theme, PALETTES
+    from utils import render_debug_sidebar
     SERVICES_OK = True
 except ImportError as e:
     st.error(f"⚠️ Erreur d'import: {str(e)}")
@@ -63,7 +66,7 @@ with col_title:
 st.divider()
 
 # --- ONGLETS ---
-tabs = st.tabs(["👤 Profil", "👥 Utilisateurs", "🏠 Famille", "💰 Budget", "🎨 Thème"])
+tabs = st.tabs(["👤 Profil", "👥 Utilisateurs", "🏠 Famille", "💰 Budget", "🎨 Thème", "🔔 Notifications"])
 
 # ===== ONGLET 1: PROFIL =====
 with tabs[0]:
@@ -78,7 +81,7 @@ with tabs[0]:
     with col1:
         # Affichage photo actuelle
         st.write("**Photo de profil actuelle**")
-        current_image = load_profile_image(st.session_state.user_profile) if SERVICES_OK else None
+        current_image = load_profile_image(st.session_state.user_profile, size=320) if SERVICES_OK else None
         
         if current_image:
             st.markdown(f"""
@@ -114,11 +117,8 @@ with tabs[0]:
             if st.button("💾 Enregistrer cette photo", type="primary"):
                 if SERVICES_OK:
                     try:
-                        bytes_data = uploaded_file.read()
-                        base64_image = base64.b64encode(bytes_data).decode()
-                        image_data = f"data:image/{uploaded_file.type.split('/')[1]};base64,{base64_image}"
-                        
-                        save_profile_image(st.session_state.user_profile, image_data)
+                        # Redimensionnée et stockée par empreinte de contenu
+                        save_profile_image(st.session_state.user_profile, uploaded_file.getvalue())
                         st.success("✅ Photo de profil mise à jour !")
                         time.sleep(1)
                         st.rerun()
@@ -137,10 +137,13 @@ with tabs[1]:
         # Affichage des utilisateurs existants
         st.write("**Utilisateurs actuels:**")
         
+        # Profils de tous les utilisateurs lus en une seule requête groupée
+        user_images = load_profile_images(users)
+        
         cols = st.columns(min(len(users), 4))
         for idx, user in enumerate(users):
             with cols[idx % 4]:
-                user_image = load_profile_image(user)
+                user_image = user_images[user]
                 
                 st.markdown(f"""
                 <div class='metric-card' style='text-align: center;'>
@@ -284,6 +287,42 @@ with tabs[3]:
                             st.rerun()
         else:
             st.warning("Firebase non disponible")
+    
+    st.divider()
+    
+    # Règles de catégorisation des relevés bancaires
+    st.write("**🏦 Règles d'import bancaire**")
+    st.caption("Une règle par ligne : MOT-CLÉ => Catégorie. La première règle dont le mot-clé "
+               "apparaît dans le libellé de l'opération s'applique, sinon la catégorie 'Autre'.")
+    
+    if SERVICES_OK:
+        rules = get_import_rules()
+        
+        with st.form("import_rules_form"):
+            rules_text = st.text_area(
+                "Règles",
+                value="\n".join(f"{keyword} => {category}" for keyword, category in rules),
+                height=250
+            )
+            
+            if st.form_submit_button("💾 Enregistrer les règles"):
+                new_rules = []
+                for line in rules_text.splitlines():
+                    if '=>' in line:
+                        keyword, category = (part.strip() for part in line.split('=>', 1))
+                        if keyword and category:
+                            new_rules.append((keyword, category))
+                # Une catégorie absente du budget n'apparaîtrait ni au tableau de bord ni dans les filtres
+                unknown = unknown_rule_categories(new_rules)
+                if unknown:
+                    st.error(f"❌ Catégories inconnues : {', '.join(unknown)}. "
+                             "Utilisez une catégorie du module Budget.")
+                elif save_import_rules(new_rules):
+                    st.success(f"✅ {len(new_rules)} règles enregistrées")
+                    time.sleep(0.5)
+                    st.rerun()
+    else:
+        st.warning("Firebase non disponible")
 
 # ===== ONGLET 5: THÈME =====
 with tabs[4]:
@@ -336,6 +375,36 @@ with tabs[4]:
     
     st.info("💡 Le thème sera appliqué uniquement à votre compte")
 
+# ===== ONGLET 6: NOTIFICATIONS =====
+with tabs[5]:
+    st.subheader("🔔 Rétention des notifications")
+    
+    if SERVICES_OK:
+        policy = get_notification_policy()
+        
+        with st.form("notification_policy_form"):
+            ttl_days = st.number_input(
+                "Supprimer les notifications après (jours)",
+                min_value=7, max_value=3650, value=int(policy['ttl_days'])
+            )
+            compact_after_days = st.number_input(
+                "Résumer les notifications lues après (jours)",
+                min_value=1, max_value=365, value=int(policy['compact_after_days'])
+            )
+            
+            if st.form_submit_button("💾 Enregistrer"):
+                if save_notification_policy(ttl_days, compact_after_days):
+                    st.success("✅ Politique de rétention enregistrée")
+        
+        st.caption("La durée de conservation s'applique aux nouvelles notifications.")
+        
+        if st.button("🗜️ Compacter maintenant"):
+            with st.spinner("Compactage en cours..."):
+                compacted = compact_notifications()
+            st.success(f"✅ {compacted} notifications résumées")
+    else:
+        st.warning("Firebase non disponible")
+
 # Footer
 st.markdown("<br><br>", unsafe_allow_html=True)
 st.markdown("""
@@ -343,3 +412,7 @@ st.markdown("""
     <p>Paramètres - Famileasy v1.0.0</p>
 </div>
 """, unsafe_allow_html=True)
+
+# Coût Firestore du rerun (FAMILEASY_DEBUG=1), une fois tous les appels de la page faits
+if SERVICES_OK:
+    render_debug_sidebar()
@@ -2,6 +2,7 @@ import streamlit as st
 import pandas as pd
 import plotly.express as px
 import plotly.graph_objects as go
+import io
 import time
 from datetime import datetime
 import sys
@@ -14,11 +15,29 @@ sys.path.insert(0, str(services_dir))
 
 # Imports des services
 try:
-    from firebase import (init_firebase, get_notifications, mark_notification_as_read,
-                         get_unread_notifications_count)
-    from budget_service import (add_expense, add_revenue, fetch_expenses, fetch_revenues,
-                                delete_expense, delete_revenue, CATEGORIES_DEPENSES)
+    # Stockage local importé en premier : le mode hors ligne s'en sert si Firebase manque
+    from ledger_store import LedgerStore, TYPE_DEPENSE, TYPE_REVENU, diff_rows, summary_frame
+    from local_store import get_local_store, new_doc_id
+    from firebase import (init_firebase, get_notifications_page, mark_all_read,
+                         count_unread_notifications, cached_unread_count, remember_unread_count,
+                         unread_badge)
+    from budget_service import (add_expense, add_revenue, add_expenses_bulk, add_revenues_bulk,
+                                sync_expenses, sync_revenues, get_sync_version,
+                                get_changes_since, start_live_sync, stop_live_sync, get_live_notifications,
+                                start_replication, pending_writes,
+                                get_recurring_expenses, add_recurring_expense,
+                                end_recurring_expense, delete_recurring_expense,
+                                get_year_summary, get_all_year_summaries,
+                                save_expense_edits, save_revenue_edits,
+                                get_transactions_page, get_pending_transactions, search_expenses,
+                                sync_statement_years, find_imported_hashes, CATEGORIES_DEPENSES)
+    from parametres_service import get_all_users, get_import_rules
+    from import_service import import_transactions, iter_statement, statement_date_range
+    from recurrence import expand_rules, recurring_summary
+    from analytics import compute_analytics
     from theme_manager import apply_theme
+    from page_loader import load_page_context, prefetch
+    from utils import render_debug_sidebar
     SERVICES_OK = True
 except ImportError as e:
     st.error(f"⚠️ Erreur d'import: {str(e)}")
@@ -71,6 +90,179 @@ st.markdown("""
 MOIS = ['Janvier', 'Février', 'Mars', 'Avril', 'Mai', 'Juin', 
         'Juillet', 'Août', 'Septembre', 'Octobre', 'Novembre', 'Décembre']
 
+# Modules dont les notifications apparaissent dans le panel du Budget
+NOTIFICATION_MODULES = ['budget', 'general']
+
+# Fréquence de vérification locale des changements reçus en temps réel
+LIVE_CHECK_SECONDS = 2
+
+def apply_local_write(kind, records):
+    """Reporte des documents créés (avec leur 'doc_id') dans la session et le registre"""
+    apply_local_changes(kind, [(record['doc_id'], record) for record in records])
+
+def edit_grid(df, key, column_config, editable, save):
+    """
+    Grille éditable d'une année : modifications et suppressions envoyées ensemble
+
+    Args:
+        df: Lignes de l'année (colonne 'doc_id')
+        column_config: Configuration des colonnes affichées
+        editable: Colonnes modifiables
+        save: Fonction (updates, deleted) -> changements appliqués, ou None en cas d'échec
+
+    Returns:
+        Changements enregistrés (liste de (doc_id, document ou None)), None sinon
+    """
+    original = df.set_index('doc_id')[list(column_config)]
+    for column in original.columns:
+        if isinstance(original[column].dtype, pd.CategoricalDtype):
+            original[column] = original[column].astype(object)
+    with st.form(key):
+        edited = st.data_editor(
+            original,
+            num_rows="delete",
+            hide_index=True,
+            use_container_width=True,
+            column_config=column_config,
+            disabled=[column for column in original.columns if column not in editable],
+            key=f"{key}_editor"
+        )
+        if not st.form_submit_button("💾 Enregistrer les modifications"):
+            return None
+    updates, deleted = diff_rows(original, edited, editable)
+    if not updates and not deleted:
+        st.info("Aucune modification")
+        return None
+    return save(updates, deleted)
+
+# Tris des tables paginées (voir budget_service.TRANSACTION_SORTS)
+TABLE_SORTS = {'recent': "Plus récentes", 'oldest': "Plus anciennes", 'amount': "Montant décroissant"}
+
+def transactions_page(collection, year, filters, sort):
+    """
+    Page courante d'une table paginée, la suivante étant préchargée en arrière-plan
+
+    Les pages lues sont gardées dans la session tant que la version des
+    données ne change pas (chargement, temps réel, écriture locale).
+    """
+    version = st.session_state.get('data_version')
+    if st.session_state.get('transaction_tables_version') != version:
+        st.session_state.transaction_tables = {}
+        st.session_state.transaction_tables_version = version
+    key = (collection, year, tuple(sorted(filters.items())), sort)
+    table = st.session_state.transaction_tables.setdefault(
+        key, {'pages': [], 'cursors': [None], 'index': 0, 'prefetch': None})
+
+    def fetch(cursor):
+        return get_transactions_page(collection, year, sort=sort, start_after=cursor, **filters)
+
+    while len(table['pages']) <= table['index']:
+        position = len(table['pages'])
+        if table['prefetch'] is not None and table['prefetch'][0] == position:
+            records, cursor = table['prefetch'][1].result()
+        else:
+            records, cursor = fetch(table['cursors'][position])
+        table['prefetch'] = None
+        table['pages'].append(records)
+        table['cursors'].append(cursor)
+        if cursor is None:
+            break
+    table['index'] = min(table['index'], len(table['pages']) - 1)
+
+    next_position = len(table['pages'])
+    next_cursor = table['cursors'][next_position]
+    if next_cursor is not None and table['prefetch'] is None and next_position == table['index'] + 1:
+        table['prefetch'] = (next_position, prefetch(lambda: fetch(next_cursor)))
+    return table
+
+def transaction_table(collection, kind, category_label, category_options, column_config, editable, save):
+    """Table paginée d'une année : filtres, tri, grille éditable et navigation"""
+    year = st.session_state.selected_year
+    col_cat, col_month, col_user, col_sort = st.columns(4)
+    with col_cat:
+        category = st.selectbox(category_label, options=['Toutes'] + category_options,
+                                key=f"{collection}_filter_category")
+    with col_month:
+        month = st.selectbox("Mois", options=['Tous'] + MOIS, key=f"{collection}_filter_month")
+    with col_user:
+        user = st.selectbox("Utilisateur", options=['Tous'] + get_all_users(),
+                            key=f"{collection}_filter_user")
+    with col_sort:
+        sort = st.selectbox("Tri", options=list(TABLE_SORTS), format_func=TABLE_SORTS.get,
+                            key=f"{collection}_sort")
+    filters = {
+        'category': None if category == 'Toutes' else category,
+        'month': None if month == 'Tous' else month,
+        'user': None if user == 'Tous' else user
+    }
+
+    table = transactions_page(collection, year, filters, sort)
+    index = table['index']
+    records = table['pages'][index]
+    key = f"edit_{collection}_{year}_{hash((tuple(filters.values()), sort))}"
+
+    def grid(rows, grid_key):
+        df_rows = pd.DataFrame(rows)
+        for column in column_config:
+            if column not in df_rows:
+                df_rows[column] = None
+        # Modification en ligne : seules les lignes modifiées ou supprimées sont envoyées
+        saved = edit_grid(df_rows, grid_key, column_config, editable, save)
+        if saved:
+            apply_local_changes(kind, saved)
+            rerun_with_toast(f"✅ {len(saved)} ligne(s) mise(s) à jour")
+
+    # Saisies pas encore répliquées : à part, hors de la pagination Firestore
+    pending = get_pending_transactions(collection, year, sort=sort, **filters) if index == 0 else []
+    if pending:
+        st.caption(f"⏳ {len(pending)} ligne(s) en attente de synchronisation")
+        grid(pending, f"{key}_pending")
+
+    if records:
+        grid(records, f"{key}_{index}")
+    elif not pending:
+        st.info(f"Aucune ligne pour {year}" if index == 0 else "Aucune ligne sur cette page")
+
+    col_prev, col_page, col_next = st.columns([1, 2, 1])
+    with col_prev:
+        st.button("← Précédente", key=f"{collection}_previous", disabled=index == 0,
+                  on_click=lambda: table.update(index=index - 1))
+    with col_page:
+        # Les suppressions en attente peuvent raccourcir une page : décompte réel
+        first = sum(len(page) for page in table['pages'][:index])
+        st.caption(f"Page {index + 1} — lignes {first + 1} à {first + len(records)}" if records
+                   else f"Page {index + 1}")
+    with col_next:
+        st.button("Suivante →", key=f"{collection}_next", disabled=table['cursors'][index + 1] is None,
+                  on_click=lambda: table.update(index=index + 1))
+
+def rerun_with_toast(message):
+    """Relance la page une seule fois ; la confirmation s'affiche au rerun suivant"""
+    st.session_state.pending_toast = message
+    st.rerun()
+
+def apply_local_changes(kind, changes):
+    """
+    Reporte des écritures locales dans la session et le registre, sans relecture
+
+    Args:
+        changes: Liste de couples (doc_id, document ou None si supprimé)
+    """
+    key = 'expenses' if kind == TYPE_DEPENSE else 'revenues'
+    year = st.session_state.selected_year
+    latest = {doc_id: data if data is not None and data['Année'] == year else None
+              for doc_id, data in changes}
+    ledger.apply_changes(kind, list(latest.items()))
+    st.session_state[key] = ([r for r in st.session_state.get(key, []) if r['doc_id'] not in latest]
+                             + [data for data in latest.values() if data is not None])
+    if SERVICES_OK:
+        # Les snapshots en mémoire incluent déjà ces écritures : le registre est à jour
+        st.session_state.data_version = current_data_version(year)
+        ledger.version = st.session_state.data_version
+
+if 'pending_toast' in st.session_state:
+    st.toast(st.session_state.pop('pending_toast'))
+
 # --- EN-TÊTE ---
 col_back, col_title, col_notif = st.columns([1, 4, 1])
 
@@ -82,91 +274,192 @@ with col_title:
     st.title("💰 Budget Familial")
     st.write(f"**Connecté:** {st.session_state.user_profile}")
 
+st.divider()
+
+if 'selected_year' not in st.session_state:
+    st.session_state.selected_year = datetime.now().year
+
+# Sélection de l'année (avant le chargement : seules ses données sont lues)
+selected_year = st.selectbox("📅 Année", options=list(range(2020, 2031)), 
+                             index=list(range(2020, 2031)).index(st.session_state.selected_year))
+
+st.session_state.selected_year = selected_year
+
+# --- CHARGEMENT DES DONNÉES DEPUIS FIREBASE ---
+def current_data_version(year):
+    """Version des snapshots locaux de l'année"""
+    return (year, get_sync_version('expenses', year), get_sync_version('revenues', year))
+
+if SERVICES_OK:
+    col_refresh, col_live = st.columns([1, 3])
+    with col_refresh:
+        refresh_requested = st.button("🔄 Actualiser", key="refresh_data")
+    with col_live:
+        live_mode = st.toggle("⚡ Temps réel", key="live_mode",
+                              help="Affiche les modifications des autres membres sans actualiser")
+    if live_mode:
+        start_live_sync(selected_year)
+    else:
+        # Listeners partagés : fermés seulement si aucune autre session ne les utilise
+        stop_live_sync()
+    # Envoie les écritures locales restées en attente (session précédente, coupure réseau)
+    start_replication()
+    
+    load_year = refresh_requested or st.session_state.get('loaded_year') != selected_year
+    live_unread, _ = get_live_notifications()
+    unread_count = live_unread if live_unread is not None else cached_unread_count()
+    waiting_writes = pending_writes()
+    
+    # Lectures indépendantes lancées ensemble : la page attend seulement la plus lente
+    with st.spinner("Chargement des données..."):
+        page_data = load_page_context({
+            # Synchronisation incrémentale de l'année : seuls les changements sont relus
+            # strict : un échec est signalé (copie locale servie, nouvel essai au rerun suivant)
+            'expenses': (lambda: sync_expenses(year=selected_year, strict=True)) if load_year else None,
+            'revenues': (lambda: sync_revenues(year=selected_year, strict=True)) if load_year else None,
+            'unread_count': count_unread_notifications if unread_count is None else None,
+            # Le résumé Firestore n'inclut pas encore les écritures en attente de réplication
+            'year_summary': (lambda: get_year_summary(selected_year)) if not waiting_writes else None,
+            'year_summaries': get_all_year_summaries,
+            'recurring_rules': get_recurring_expenses
+        }, defaults={'unread_count': 0, 'year_summaries': ({}, ()), 'recurring_rules': []})
+    
+    if unread_count is None:
+        unread_count = page_data.unread_count
+        if 'unread_count' not in page_data.errors:
+            remember_unread_count(unread_count)
+    
+    if load_year:
+        if page_data.errors.keys() & {'expenses', 'revenues'}:
+            # Firestore lent ou en erreur : la copie locale est servie ; l'année n'est pas
+            # marquée chargée, la synchronisation est retentée au prochain rerun
+            local_store = get_local_store()
+            st.session_state.expenses = local_store.documents('expenses', selected_year)
+            st.session_state.revenues = local_store.documents('revenues', selected_year)
+            st.session_state.pop('loaded_year', None)
+        else:
+            st.session_state.expenses = page_data.expenses
+            st.session_state.revenues = page_data.revenues
+            st.session_state.loaded_year = selected_year
+        st.session_state.data_version = current_data_version(selected_year)
+        if refresh_requested:
+            st.toast("✅ Données chargées !")
+else:
+    # Mode hors ligne : lecture et écriture dans la base locale, répliquée au retour de Firebase
+    local_store = get_local_store()
+    st.session_state.expenses = local_store.documents('expenses', selected_year)
+    st.session_state.revenues = local_store.documents('revenues', selected_year)
+    st.session_state.data_version = ('hors-ligne', selected_year, local_store.pending_count())
+    st.warning("⚠️ Mode hors ligne - Les données sont enregistrées localement et seront "
+               "synchronisées au retour de la connexion")
+
+# Registre typé, reconstruit seulement quand la version des données change
+if 'ledger' not in st.session_state:
+    st.session_state.ledger = LedgerStore()
+ledger = st.session_state.ledger
+
+# Temps réel : les changements reçus par les listeners sont appliqués au registre
+if SERVICES_OK and live_mode and st.session_state.get('loaded_year') == selected_year:
+    live_version = current_data_version(selected_year)
+    previous_version = st.session_state.data_version
+    if live_version != previous_version:
+        expense_changes = get_changes_since('expenses', previous_version[1], selected_year)
+        revenue_changes = get_changes_since('revenues', previous_version[2], selected_year)
+        if ledger.version == previous_version and expense_changes is not None and revenue_changes is not None:
+            ledger.apply_changes(TYPE_DEPENSE, expense_changes)
+            ledger.apply_changes(TYPE_REVENU, revenue_changes)
+            ledger.version = live_version
+        # Snapshots déjà à jour en mémoire : aucune lecture Firestore
+        st.session_state.expenses = sync_expenses(year=selected_year)
+        st.session_state.revenues = sync_revenues(year=selected_year)
+        st.session_state.data_version = live_version
+
+ledger.refresh(st.session_state.expenses, st.session_state.revenues,
+               st.session_state.get('data_version'))
+
+if SERVICES_OK and live_mode:
+    @st.fragment(run_every=LIVE_CHECK_SECONDS)
+    def watch_live_changes():
+        """Relance la page quand les listeners ont reçu des changements (sans lecture Firestore)"""
+        # Renouvelle les listeners de la session (libérés quand l'onglet est fermé)
+        start_live_sync(selected_year)
+        _, notifications_version = get_live_notifications()
+        if 'live_notifications_version' not in st.session_state:
+            st.session_state.live_notifications_version = notifications_version
+        if (current_data_version(selected_year) != st.session_state.data_version
+                or notifications_version != st.session_state.live_notifications_version):
+            st.session_state.live_notifications_version = notifications_version
+            st.rerun()
+    
+    watch_live_changes()
+
+# Rempli après le chargement parallèle (le compteur de notifications en fait partie)
 with col_notif:
     if SERVICES_OK:
-        unread_count = get_unread_notifications_count()
-        
-        if st.button(f"🔔 ({unread_count})" if unread_count > 0 else "🔔"):
+        if st.button(f"🔔 ({unread_badge(unread_count)})" if unread_count > 0 else "🔔"):
             st.session_state.show_notifications = not st.session_state.get('show_notifications', False)
+            st.session_state.pop('notification_feed', None)
         
         # Panel de notifications
         if st.session_state.get('show_notifications', False):
             st.markdown("<div style='background-color: #2d3142; border-radius: 10px; padding: 15px; margin-top: 10px; max-height: 300px; overflow-y: auto;'>", unsafe_allow_html=True)
-            notifications = get_notifications()
             
-            if notifications:
-                for notif in notifications[:5]:  # Afficher les 5 dernières
-                    if notif.get('module') in ['budget', 'general']:
-                        timestamp = notif.get('timestamp', 0)
-                        time_ago = datetime.fromtimestamp(timestamp).strftime("%d/%m %H:%M")
-                        border_color = "#667eea" if notif.get('read', False) else "#ff4444"
-                        
-                        st.markdown(f"""
-                        <div style='background-color: #1f2230; padding: 10px; border-radius: 8px; margin-bottom: 8px; border-left: 3px solid {border_color};'>
-                            <div style='font-weight: bold; color: #ffffff; font-size: 14px;'>{notif.get('title', '')}</div>
-                            <div style='color: #a0a0a0; font-size: 12px;'>{notif.get('message', '')}</div>
-                            <div style='color: #707070; font-size: 11px; margin-top: 5px;'>{time_ago}</div>
-                        </div>
-                        """, unsafe_allow_html=True)
-                        
-                        if not notif.get('read', False):
-                            mark_notification_as_read(notif['doc_id'])
+            # Ouverture du panel : une requête pour la première page, un batch pour les marquer lues
+            if 'notification_feed' not in st.session_state:
+                notifications, cursor = get_notifications_page(modules=NOTIFICATION_MODULES)
+                mark_all_read(n['doc_id'] for n in notifications if not n.get('read', False))
+                st.session_state.notification_feed = {'items': notifications, 'cursor': cursor}
+            feed = st.session_state.notification_feed
+            
+            if feed['items']:
+                for notif in feed['items']:
+                    timestamp = notif.get('timestamp', 0)
+                    time_ago = datetime.fromtimestamp(timestamp).strftime("%d/%m %H:%M")
+                    border_color = "#667eea" if notif.get('read', False) else "#ff4444"
+                    
+                    st.markdown(f"""
+                    <div style='background-color: #1f2230; padding: 10px; border-radius: 8px; margin-bottom: 8px; border-left: 3px solid {border_color};'>
+                        <div style='font-weight: bold; color: #ffffff; font-size: 14px;'>{notif.get('title', '')}</div>
+                        <div style='color: #a0a0a0; font-size: 12px;'>{notif.get('message', '')}</div>
+                        <div style='color: #707070; font-size: 11px; margin-top: 5px;'>{time_ago}</div>
+                    </div>
+                    """, unsafe_allow_html=True)
+                
+                if feed['cursor'] is not None and st.button("Voir plus", key="more_notifications"):
+                    notifications, cursor = get_notifications_page(modules=NOTIFICATION_MODULES,
+                                                                   start_after=feed['cursor'])
+                    mark_all_read(n['doc_id'] for n in notifications if not n.get('read', False))
+                    feed['items'].extend(notifications)
+                    feed['cursor'] = cursor
+                    st.rerun()
             else:
                 st.info("Aucune notification")
             
             st.markdown("</div>", unsafe_allow_html=True)
 
-st.divider()
-
-# --- CHARGEMENT DES DONNÉES DEPUIS FIREBASE ---
-if SERVICES_OK:
-    if 'expenses' not in st.session_state or st.button("🔄 Actualiser", key="refresh_data"):
-        with st.spinner("Chargement des données..."):
-            st.session_state.expenses = fetch_expenses()
-            st.session_state.revenues = fetch_revenues()
-            st.success("✅ Données chargées !")
-            time.sleep(0.5)
-            st.rerun()
-else:
-    # Mode hors ligne
-    if 'expenses' not in st.session_state:
-        st.session_state.expenses = []
-    if 'revenues' not in st.session_state:
-        st.session_state.revenues = []
-    st.warning("⚠️ Mode hors ligne - Les données ne seront pas sauvegardées")
-
-if 'selected_year' not in st.session_state:
-    st.session_state.selected_year = datetime.now().year
-
 # --- ONGLETS ---
-tabs = st.tabs(["📊 Tableau de Bord", "📋 Revenus", "📋 Dépenses"])
+tabs = st.tabs(["📊 Tableau de Bord", "📋 Revenus", "📋 Dépenses", "📈 Analyses"])
 
 # ===== ONGLET 1: TABLEAU DE BORD =====
 with tabs[0]:
-    # Sélection de l'année
-    selected_year = st.selectbox("📅 Année", options=list(range(2020, 2031)), 
-                                 index=list(range(2020, 2031)).index(st.session_state.selected_year))
-    
-    st.session_state.selected_year = selected_year
-    
-    # Préparer les données
-    df_expenses = pd.DataFrame(st.session_state.expenses)
-    df_revenues = pd.DataFrame(st.session_state.revenues)
-    
-    # Filtrer par année
-    if not df_expenses.empty and 'Année' in df_expenses.columns:
-        df_expenses_filtered = df_expenses[df_expenses['Année'] == selected_year]
-    else:
-        df_expenses_filtered = pd.DataFrame()
-    
-    if not df_revenues.empty and 'Année' in df_revenues.columns:
-        df_revenues_filtered = df_revenues[df_revenues['Année'] == selected_year]
+    # Préparer les données : résumé agrégé (mois, catégorie, utilisateur) de l'année
+    # Le résumé Firestore n'inclut pas encore les écritures en attente de réplication
+    if SERVICES_OK and not waiting_writes and page_data.year_summary is not None:
+        df_summary = summary_frame(page_data.year_summary)
     else:
-        df_revenues_filtered = pd.DataFrame()
+        df_summary = summary_frame(ledger.summary(selected_year))
+    if SERVICES_OK and waiting_writes:
+        st.caption(f"⏳ {waiting_writes} modification(s) en attente de synchronisation")
+    if SERVICES_OK:
+        # Occurrences des dépenses récurrentes, calculées pour l'année sans documents stockés
+        df_summary = pd.concat([df_summary, recurring_summary(page_data.recurring_rules, selected_year)],
+                               ignore_index=True)
+    has_expenses = df_summary['expense_count'].sum() > 0
+    has_revenues = df_summary['revenue_count'].sum() > 0
     
     # Métriques
-    total_revenus = df_revenues_filtered['Montant'].sum() if not df_revenues_filtered.empty else 0
-    total_depenses = df_expenses_filtered['Montant'].sum() if not df_expenses_filtered.empty else 0
+    total_revenus = df_summary['revenue_total'].sum()
+    total_depenses = df_summary['expense_total'].sum()
     reste_a_vivre = total_revenus - total_depenses
     taux_epargne = (reste_a_vivre / total_revenus * 100) if total_revenus > 0 else 0
     
@@ -197,7 +490,7 @@ with tabs[0]:
     st.divider()
     
     # Graphiques
-    if not df_expenses_filtered.empty or not df_revenues_filtered.empty:
+    if has_expenses or has_revenues:
         col_g1, col_g2 = st.columns(2)
         
         with col_g1:
@@ -215,11 +508,12 @@ with tabs[0]:
             st.markdown("</div>", unsafe_allow_html=True)
         
         with col_g2:
-            if not df_expenses_filtered.empty:
+            if has_expenses:
                 st.markdown("<div class='metric-card'>", unsafe_allow_html=True)
                 st.subheader("Répartition des Dépenses")
-                df_cat = df_expenses_filtered.groupby('Catégories')['Montant'].sum().reset_index()
-                fig_pie = px.pie(df_cat, values='Montant', names='Catégories', hole=0.4,
+                df_cat = df_summary[df_summary['expense_count'] > 0]
+                df_cat = df_cat.groupby('Catégories')['expense_total'].sum().reset_index()
+                fig_pie = px.pie(df_cat, values='expense_total', names='Catégories', hole=0.4,
                                color_discrete_sequence=px.colors.sequential.Purples_r)
                 fig_pie.update_traces(textposition='inside', textinfo='percent+label')
                 fig_pie.update_layout(height=350, plot_bgcolor='rgba(0,0,0,0)', 
@@ -248,39 +542,83 @@ with tabs[1]:
             
             if st.form_submit_button("💾 Enregistrer"):
                 if SERVICES_OK:
-                    success = add_revenue(rev_source, rev_amount, rev_month, rev_year, 
-                                        st.session_state.user_profile)
-                    if success:
-                        st.success("✅ Revenu ajouté avec succès !")
-                        time.sleep(1)
-                        st.rerun()
+                    revenue = add_revenue(rev_source, rev_amount, rev_month, rev_year, 
+                                          st.session_state.user_profile)
+                    if revenue:
+                        apply_local_write(TYPE_REVENU, [revenue])
+                        rerun_with_toast("✅ Revenu ajouté avec succès !")
                 else:
                     # Mode hors ligne
-                    st.session_state.revenues.append({
+                    get_local_store().write('revenues', new_doc_id(), {
                         'Source': rev_source,
                         'Montant': float(rev_amount),
                         'Mois': rev_month,
                         'Année': int(rev_year),
-                        'Utilisateur': st.session_state.user_profile
+                        'Utilisateur': st.session_state.user_profile,
+                        'Timestamp': time.time()
                     })
-                    st.success("✅ Revenu ajouté (mode hors ligne)")
-                    st.rerun()
+                    rerun_with_toast("✅ Revenu ajouté (mode hors ligne)")
     
-    # Affichage des revenus
-    if st.session_state.revenues:
-        df_rev = pd.DataFrame(st.session_state.revenues)
-        if 'Année' in df_rev.columns:
-            df_rev_year = df_rev[df_rev['Année'] == st.session_state.selected_year]
+    # Saisie multiple
+    with st.expander("📥 Saisie multiple de revenus", expanded=False):
+        with st.form("add_revenues_bulk", clear_on_submit=True):
+            bulk_revenues = st.data_editor(
+                pd.DataFrame(columns=['Source', 'Montant', 'Mois']),
+                num_rows="dynamic",
+                use_container_width=True,
+                column_config={
+                    'Source': st.column_config.SelectboxColumn(
+                        "Source", options=['Salaire Principal', 'Salaire Conjoint', 'Primes', 'Autre'],
+                        required=True),
+                    'Montant': st.column_config.NumberColumn("Montant (€)", min_value=0.01, required=True),
+                    'Mois': st.column_config.SelectboxColumn("Mois", options=MOIS, required=True)
+                },
+                key="bulk_revenues_editor"
+            )
             
-            if not df_rev_year.empty:
-                st.dataframe(df_rev_year[['Source', 'Montant', 'Mois', 'Utilisateur']], 
-                            use_container_width=True, hide_index=True)
-            else:
-                st.info(f"Aucun revenu pour {st.session_state.selected_year}")
-        else:
-            st.dataframe(df_rev, use_container_width=True, hide_index=True)
+            if st.form_submit_button(f"💾 Enregistrer pour {st.session_state.selected_year}"):
+                rows = bulk_revenues.dropna(subset=['Source', 'Montant', 'Mois']).to_dict('records')
+                for row in rows:
+                    row['Année'] = st.session_state.selected_year
+                if rows and SERVICES_OK:
+                    created = add_revenues_bulk(rows, st.session_state.user_profile)
+                    if created:
+                        apply_local_write(TYPE_REVENU, created)
+                        rerun_with_toast(f"✅ {len(created)} revenus ajoutés !")
+                elif rows:
+                    # Mode hors ligne
+                    get_local_store().write_many('revenues', [
+                        (new_doc_id(), {**row, 'Montant': float(row['Montant']),
+                                        'Utilisateur': st.session_state.user_profile,
+                                        'Timestamp': time.time()})
+                        for row in rows
+                    ])
+                    rerun_with_toast(f"✅ {len(rows)} revenus ajoutés (mode hors ligne)")
+    
+    # Affichage des revenus
+    if SERVICES_OK:
+        # Lecture paginée côté serveur : le coût dépend de la taille de page, pas de l'année
+        transaction_table(
+            'revenues', TYPE_REVENU, "Source", ['Salaire Principal', 'Salaire Conjoint', 'Primes', 'Autre'],
+            {
+                'Source': st.column_config.SelectboxColumn(
+                    "Source", options=['Salaire Principal', 'Salaire Conjoint', 'Primes', 'Autre'],
+                    required=True),
+                'Montant': st.column_config.NumberColumn("Montant (€)", min_value=0.01, required=True),
+                'Mois': st.column_config.SelectboxColumn("Mois", options=MOIS, required=True),
+                'Utilisateur': st.column_config.TextColumn("Utilisateur")
+            },
+            ['Source', 'Montant', 'Mois'],
+            lambda updates, deleted: save_revenue_edits(updates, deleted, st.session_state.user_profile)
+        )
     else:
-        st.info("Aucun revenu enregistré")
+        # Mode hors ligne : registre local
+        df_rev_year = ledger.revenues(st.session_state.selected_year)
+    if not SERVICES_OK and not df_rev_year.empty:
+        st.dataframe(df_rev_year[['Source', 'Montant', 'Mois', 'Utilisateur']], 
+                    use_container_width=True, hide_index=True)
+    elif not SERVICES_OK:
+        st.info(f"Aucun revenu pour {st.session_state.selected_year}")
 
 # ===== ONGLET 3: DÉPENSES =====
 with tabs[2]:
@@ -297,48 +635,310 @@ with tabs[2]:
             with col2:
                 exp_year = st.number_input("Année", min_value=2020, max_value=2030, 
                                           value=st.session_state.selected_year)
-                exp_frequency = st.selectbox("Fréquence", 
-                    options=['Mensuel', 'Annuel', 'Unique'])
+                exp_frequency = st.selectbox("Fréquence", options=['Unique', 'Mensuel', 'Annuel'],
+                                             help="Mensuel / Annuel : crée une dépense récurrente "
+                                                  "à partir du mois choisi")
                 exp_description = st.text_input("Description")
             
             if st.form_submit_button("💾 Enregistrer"):
-                if SERVICES_OK:
-                    success = add_expense(exp_category, exp_amount, exp_frequency, 
-                                        exp_description, exp_month, exp_year, 
-                                        st.session_state.user_profile)
-                    if success:
-                        st.success("✅ Dépense ajoutée avec succès !")
-                        time.sleep(1)
-                        st.rerun()
+                if SERVICES_OK and exp_frequency != 'Unique':
+                    # Une règle plutôt qu'une seule dépense : les occurrences sont calculées
+                    if add_recurring_expense(exp_category, exp_amount, exp_frequency, exp_description,
+                                             exp_month, exp_year, st.session_state.user_profile):
+                        rerun_with_toast("✅ Dépense récurrente créée !")
+                elif SERVICES_OK:
+                    expense = add_expense(exp_category, exp_amount, exp_frequency, 
+                                          exp_description, exp_month, exp_year, 
+                                          st.session_state.user_profile)
+                    if expense:
+                        apply_local_write(TYPE_DEPENSE, [expense])
+                        rerun_with_toast("✅ Dépense ajoutée avec succès !")
+                elif exp_frequency != 'Unique':
+                    st.error("❌ Les dépenses récurrentes ne peuvent pas être créées hors ligne")
                 else:
                     # Mode hors ligne
-                    st.session_state.expenses.append({
+                    get_local_store().write('expenses', new_doc_id(), {
                         'Catégories': exp_category,
                         'Montant': float(exp_amount),
                         'Fréquence': exp_frequency,
                         'Description': exp_description,
                         'Mois': exp_month,
                         'Année': int(exp_year),
-                        'Utilisateur': st.session_state.user_profile
+                        'Utilisateur': st.session_state.user_profile,
+                        'Timestamp': time.time()
                     })
-                    st.success("✅ Dépense ajoutée (mode hors ligne)")
-                    st.rerun()
+                    rerun_with_toast("✅ Dépense ajoutée (mode hors ligne)")
+    
+    # Saisie multiple
+    with st.expander("📥 Saisie multiple de dépenses", expanded=False):
+        with st.form("add_expenses_bulk", clear_on_submit=True):
+            bulk_expenses = st.data_editor(
+                pd.DataFrame(columns=['Catégories', 'Montant', 'Mois', 'Fréquence', 'Description']),
+                num_rows="dynamic",
+                use_container_width=True,
+                column_config={
+                    'Catégories': st.column_config.SelectboxColumn(
+                        "Catégorie", options=CATEGORIES_DEPENSES if SERVICES_OK else [], required=True),
+                    'Montant': st.column_config.NumberColumn("Montant (€)", min_value=0.01, required=True),
+                    'Mois': st.column_config.SelectboxColumn("Mois", options=MOIS, required=True),
+                    'Fréquence': st.column_config.SelectboxColumn(
+                        "Fréquence", options=['Unique', 'Mensuel', 'Annuel'], default='Unique'),
+                    'Description': st.column_config.TextColumn("Description")
+                },
+                key="bulk_expenses_editor"
+            )
+            
+            if st.form_submit_button(f"💾 Enregistrer pour {st.session_state.selected_year}"):
+                rows = bulk_expenses.dropna(subset=['Catégories', 'Montant', 'Mois']).to_dict('records')
+                for row in rows:
+                    row['Année'] = st.session_state.selected_year
+                    # Cellules vides du tableau : NaN
+                    row['Fréquence'] = row['Fréquence'] if isinstance(row.get('Fréquence'), str) else 'Unique'
+                    row['Description'] = row['Description'] if isinstance(row.get('Description'), str) else ''
+                # Les lignes Mensuel / Annuel deviennent des règles récurrentes
+                recurring = [row for row in rows if row['Fréquence'] != 'Unique']
+                rows = [row for row in rows if row['Fréquence'] == 'Unique']
+                if recurring and not SERVICES_OK:
+                    st.error("❌ Les dépenses récurrentes ne peuvent pas être créées hors ligne")
+                elif (rows or recurring) and SERVICES_OK:
+                    rules_created = sum(
+                        1 for row in recurring
+                        if add_recurring_expense(row['Catégories'], row['Montant'], row['Fréquence'],
+                                                 row['Description'], row['Mois'], row['Année'],
+                                                 st.session_state.user_profile))
+                    created = add_expenses_bulk(rows, st.session_state.user_profile) if rows else []
+                    if created:
+                        apply_local_write(TYPE_DEPENSE, created)
+                    added = [f"{count} {label}" for count, label in
+                             ((len(created), "dépenses"), (rules_created, "dépenses récurrentes")) if count]
+                    if added:
+                        rerun_with_toast(f"✅ {' et '.join(added)} ajoutées !")
+                elif rows:
+                    # Mode hors ligne
+                    get_local_store().write_many('expenses', [
+                        (new_doc_id(), {**row, 'Montant': float(row['Montant']),
+                                        'Utilisateur': st.session_state.user_profile,
+                                        'Timestamp': time.time()})
+                        for row in rows
+                    ])
+                    rerun_with_toast(f"✅ {len(rows)} dépenses ajoutées (mode hors ligne)")
+    
+    # Dépenses récurrentes : une règle au lieu d'une saisie par mois
+    if SERVICES_OK:
+        with st.expander("🔁 Dépenses récurrentes", expanded=False):
+            with st.form("add_recurring_expense", clear_on_submit=True):
+                col1, col2 = st.columns(2)
+                with col1:
+                    rec_category = st.selectbox("Catégorie", options=CATEGORIES_DEPENSES)
+                    rec_amount = st.number_input("Montant (€)", min_value=0.01, step=5.0)
+                    rec_frequency = st.selectbox("Fréquence", options=['Mensuel', 'Annuel'])
+                with col2:
+                    rec_month = st.selectbox("À partir de", options=MOIS)
+                    rec_year = st.number_input("Année de début", min_value=2020, max_value=2030,
+                                               value=st.session_state.selected_year)
+                    rec_description = st.text_input("Description")
+                
+                if st.form_submit_button("💾 Créer la règle"):
+                    if add_recurring_expense(rec_category, rec_amount, rec_frequency, rec_description,
+                                             rec_month, rec_year, st.session_state.user_profile):
+                        rerun_with_toast("✅ Dépense récurrente créée !")
+            
+            rules = page_data.recurring_rules
+            for rule in rules:
+                col_rule, col_end, col_delete = st.columns([4, 1, 1])
+                with col_rule:
+                    until = (f" jusqu'à {rule['MoisFin']} {rule['AnnéeFin']}"
+                             if rule.get('AnnéeFin') else "")
+                    st.write(f"**{rule['Catégories']}** — {rule['Montant']:,.0f} € "
+                             f"({rule['Fréquence'].lower()}) depuis {rule['MoisDébut']} "
+                             f"{rule['AnnéeDébut']}{until}")
+                with col_end:
+                    if not rule.get('AnnéeFin') and st.button("⏹️ Arrêter", key=f"end_{rule['doc_id']}"):
+                        today = datetime.now()
+                        end_recurring_expense(rule['doc_id'], MOIS[today.month - 1], today.year,
+                                              st.session_state.user_profile, rule['Catégories'])
+                        st.rerun()
+                with col_delete:
+                    if st.button("🗑️", key=f"delete_rule_{rule['doc_id']}"):
+                        delete_recurring_expense(rule['doc_id'], st.session_state.user_profile,
+                                                 rule['Catégories'])
+                        st.rerun()
+            
+            df_occurrences = expand_rules(rules, st.session_state.selected_year)
+            if not df_occurrences.empty:
+                st.caption(f"{len(df_occurrences)} occurrences en {st.session_state.selected_year}, "
+                           f"{df_occurrences['Montant'].sum():,.0f} € au total")
+    
+    # Import d'un relevé bancaire
+    if SERVICES_OK:
+        with st.expander("🏦 Importer un relevé bancaire (CSV / OFX)", expanded=False):
+            statement = st.file_uploader("Relevé", type=['csv', 'ofx', 'qfx'], key="statement_upload")
+            encoding = st.selectbox("Encodage", options=['utf-8-sig', 'latin-1', 'cp1252'],
+                                    help="Les exports des banques françaises sont souvent en latin-1")
+            
+            if statement and st.button("📥 Importer les débits", key="import_statement"):
+                with st.spinner("Import en cours..."):
+                    try:
+                        # Lecture en flux : le fichier n'est jamais chargé en entier.
+                        # Un premier passage donne les dates du relevé, pour ne synchroniser
+                        # que les années concernées avant la recherche des doublons.
+                        lines = io.TextIOWrapper(statement, encoding=encoding, errors='replace',
+                                                 newline='')
+                        date_range = statement_date_range(iter_statement(lines, statement.name))
+                        lines.detach()
+                        statement.seek(0)
+                        lines = io.TextIOWrapper(statement, encoding=encoding, errors='replace',
+                                                 newline='')
+                        sync_statement_years(*(date_range or (None, None)))
+                        stats = import_transactions(
+                            iter_statement(lines, statement.name),
+                            get_import_rules(),
+                            find_imported_hashes,
+                            lambda rows: add_expenses_bulk(rows, st.session_state.user_profile)
+                        )
+                        st.success(f"✅ {stats['imported']} dépenses importées, "
+                                   f"{stats['duplicates']} doublons et {stats['ignored']} crédits ignorés "
+                                   f"sur {stats['read']} opérations")
+                        # Les nouvelles lignes seront relues par la synchronisation incrémentale
+                        st.session_state.loaded_year = None
+                    except ValueError as e:
+                        st.error(f"❌ {str(e)}")
     
+    # Recherche dans les descriptions (index local, sans parcourir les dépenses)
+    if SERVICES_OK:
+        with st.expander("🔍 Rechercher une dépense"):
+            col_text, col_cat, col_years = st.columns([3, 2, 1])
+            with col_text:
+                search_text = st.text_input("Description", placeholder="ex : carrefour, pharma...",
+                                            key="expense_search_text")
+            with col_cat:
+                search_category = st.selectbox("Catégorie", options=['Toutes'] + CATEGORIES_DEPENSES,
+                                               key="expense_search_category")
+            with col_years:
+                all_years = st.checkbox("Toutes les années", key="expense_search_all_years")
+            if search_text.strip():
+                started = time.perf_counter()
+                results = search_expenses(
+                    search_text,
+                    year=None if all_years else st.session_state.selected_year,
+                    category=None if search_category == 'Toutes' else search_category
+                )
+                elapsed_ms = (time.perf_counter() - started) * 1000
+                if results:
+                    st.caption(f"{len(results)} résultat(s) en {elapsed_ms:.1f} ms")
+                    df_results = pd.DataFrame(results)
+                    columns = [c for c in ['Description', 'Catégories', 'Montant', 'Mois', 'Année', 'Utilisateur']
+                               if c in df_results]
+                    st.dataframe(df_results[columns], use_container_width=True, hide_index=True)
+                else:
+                    st.info("Aucune dépense ne correspond à cette recherche")
+
     # Affichage des dépenses
-    if st.session_state.expenses:
-        df_exp = pd.DataFrame(st.session_state.expenses)
-        if 'Année' in df_exp.columns:
-            df_exp_year = df_exp[df_exp['Année'] == st.session_state.selected_year]
+    if SERVICES_OK:
+        # Lecture paginée côté serveur : le coût dépend de la taille de page, pas de l'année
+        transaction_table(
+            'expenses', TYPE_DEPENSE, "Catégorie", CATEGORIES_DEPENSES,
+            {
+                'Catégories': st.column_config.SelectboxColumn(
+                    "Catégorie", options=CATEGORIES_DEPENSES, required=True),
+                'Montant': st.column_config.NumberColumn("Montant (€)", min_value=0.01, required=True),
+                'Mois': st.column_config.SelectboxColumn("Mois", options=MOIS, required=True),
+                'Fréquence': st.column_config.SelectboxColumn(
+                    "Fréquence", options=['Mensuel', 'Annuel', 'Unique'], required=True),
+                'Description': st.column_config.TextColumn("Description"),
+                'Utilisateur': st.column_config.TextColumn("Utilisateur")
+            },
+            ['Catégories', 'Montant', 'Mois', 'Fréquence', 'Description'],
+            lambda updates, deleted: save_expense_edits(updates, deleted, st.session_state.user_profile)
+        )
+    else:
+        # Mode hors ligne : registre local
+        df_exp_year = ledger.expenses(st.session_state.selected_year)
+    if not SERVICES_OK and not df_exp_year.empty:
+        st.dataframe(df_exp_year[['Catégories', 'Montant', 'Mois', 'Description', 'Utilisateur']], 
+                    use_container_width=True, hide_index=True)
+    elif not SERVICES_OK:
+        st.info(f"Aucune dépense pour {st.session_state.selected_year}")
+
+# ===== ONGLET 4: ANALYSES =====
+with tabs[3]:
+    st.subheader("📈 Analyses pluriannuelles")
+    
+    if SERVICES_OK:
+        summaries, summaries_version = page_data.year_summaries
+        rules = page_data.recurring_rules
+        today = datetime.now()
+        if selected_year < today.year:
+            through_month = 12
+        elif selected_year == today.year:
+            through_month = today.month
+        else:
+            through_month = 0
+        # Calcul mémorisé : relu seulement quand un résumé ou une règle change
+        analytics_version = (summaries_version,
+                             tuple((rule['doc_id'], rule.get('Timestamp')) for rule in rules))
+        analytics = compute_analytics(analytics_version, summaries, rules, selected_year, through_month)
+        trend = analytics['trend']
+        
+        if trend.empty:
+            st.info("Aucune donnée disponible pour les analyses")
+        else:
+            col1, col2, col3 = st.columns(3)
+            with col1:
+                st.metric("💸 Dépenses projetées", f"{analytics['projected_expenses']:,.0f} €")
+            with col2:
+                st.metric("💶 Revenus projetés", f"{analytics['projected_revenues']:,.0f} €")
+            with col3:
+                projected_balance = analytics['projected_revenues'] - analytics['projected_expenses']
+                st.metric(f"✨ Solde projeté {selected_year}", f"{projected_balance:,.0f} €")
             
-            if not df_exp_year.empty:
-                st.dataframe(df_exp_year[['Catégories', 'Montant', 'Mois', 'Description', 'Utilisateur']], 
-                            use_container_width=True, hide_index=True)
+            # Tendance mensuelle sur toutes les années
+            st.markdown("<div class='metric-card'>", unsafe_allow_html=True)
+            st.subheader("Évolution mensuelle")
+            fig_trend = go.Figure([
+                go.Scatter(x=trend['date'], y=trend['revenue_total'], name='Revenus',
+                           line=dict(color='#667eea', width=1), opacity=0.5),
+                go.Scatter(x=trend['date'], y=trend['expense_total'], name='Dépenses',
+                           line=dict(color='#764ba2', width=1), opacity=0.5),
+                go.Scatter(x=trend['date'], y=trend['revenue_avg'], name='Revenus (moyenne 3 mois)',
+                           line=dict(color='#667eea', width=3)),
+                go.Scatter(x=trend['date'], y=trend['expense_avg'], name='Dépenses (moyenne 3 mois)',
+                           line=dict(color='#764ba2', width=3))
+            ])
+            forecast = analytics['forecast']
+            if not forecast.empty:
+                forecast_dates = [datetime(selected_year, MOIS.index(m) + 1, 1) for m in forecast['Mois']]
+                fig_trend.add_trace(go.Scatter(x=forecast_dates, y=forecast['expense_forecast'],
+                                               name='Dépenses (prévision)',
+                                               line=dict(color='#764ba2', width=3, dash='dot')))
+                fig_trend.add_trace(go.Scatter(x=forecast_dates, y=forecast['revenue_forecast'],
+                                               name='Revenus (prévision)',
+                                               line=dict(color='#667eea', width=3, dash='dot')))
+            fig_trend.update_layout(height=400, plot_bgcolor='rgba(0,0,0,0)',
+                                    paper_bgcolor='rgba(0,0,0,0)', font=dict(color='#e0e0e0'))
+            st.plotly_chart(fig_trend, use_container_width=True)
+            st.markdown("</div>", unsafe_allow_html=True)
+            
+            # Évolution par catégorie sur la même période que l'année précédente
+            yoy = analytics['yoy']
+            period_label = "l'année" if through_month in (0, 12) else f"janvier à {MOIS[through_month - 1].lower()}"
+            st.subheader(f"Dépenses {selected_year} vs {selected_year - 1} ({period_label})")
+            if not yoy.empty:
+                st.dataframe(
+                    yoy.rename(columns={'previous': str(selected_year - 1), 'current': str(selected_year),
+                                        'delta': 'Écart (€)', 'delta_pct': 'Écart (%)'}),
+                    use_container_width=True, hide_index=True,
+                    column_config={
+                        str(selected_year - 1): st.column_config.NumberColumn(format="%.0f €"),
+                        str(selected_year): st.column_config.NumberColumn(format="%.0f €"),
+                        'Écart (€)': st.column_config.NumberColumn(format="%+.0f €"),
+                        'Écart (%)': st.column_config.NumberColumn(format="%+.1f %%")
+                    }
+                )
             else:
-                st.info(f"Aucune dépense pour {st.session_state.selected_year}")
-        else:
-            st.dataframe(df_exp, use_container_width=True, hide_index=True)
+                st.info(f"Aucune dépense à comparer pour {selected_year}")
     else:
-        st.info("Aucune dépense enregistrée")
+        st.warning("Firebase non disponible")
 
 # Footer
 st.markdown("<br><br>", unsafe_allow_html=True)
@@ -347,3 +947,7 @@ st.markdown("""
     <p>Module Budget - Famileasy v1.0.0</p>
 </div>
 """, unsafe_allow_html=True)
+
+# Coût Firestore du rerun (FAMILEASY_DEBUG=1), une fois tous les appels de la page faits
+if SERVICES_OK:
+    render_debug_sidebar()
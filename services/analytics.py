@@ -0,0 +1,165 @@
+"""
+Analyses pluriannuelles du module Budget
+Tendances mensuelles, moyennes glissantes, évolution par catégorie et
+prévision de fin d'année, calculées sur les résumés annuels (une ligne par
+mois, catégorie et utilisateur) plutôt que sur les transactions.
+"""
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from ledger_store import MOIS, summary_frame
+from recurrence import expand_rules
+
+# Nombre de mois de la moyenne glissante et de la base de prévision
+ROLLING_MONTHS = 3
+# Résultats mémorisés (un par version des données, année et mois)
+MEMO_SIZE = 8
+
+_memo = OrderedDict()
+_memo_lock = threading.Lock()
+
+def ledger_frame(summaries, rules=()):
+    """
+    Construit le registre colonnaire de toutes les années
+
+    Args:
+        summaries: Dictionnaire {année: cellules du résumé annuel}
+        rules: Règles de dépenses récurrentes, dont les occurrences sont ajoutées
+
+    Returns:
+        DataFrame (period, Année, Mois, Catégories, expense_total, revenue_total)
+        où period = année * 12 + rang du mois
+    """
+    frames = [summary_frame(cells).assign(Année=int(year)) for year, cells in summaries.items() if cells]
+    if rules and summaries:
+        occurrences = expand_rules(rules, min(summaries), max(summaries))
+        if not occurrences.empty:
+            recurring = (occurrences.groupby(['Année', 'Mois', 'Catégories'], observed=True)['Montant']
+                         .sum().reset_index(name='expense_total'))
+            recurring['Mois'] = recurring['Mois'].astype(str)
+            recurring['revenue_total'] = 0.0
+            frames.append(recurring)
+    if not frames:
+        return pd.DataFrame({
+            'period': pd.Series(dtype='int32'), 'Année': pd.Series(dtype='int16'),
+            'Mois': pd.Categorical([], categories=MOIS, ordered=True),
+            'Catégories': pd.Categorical([]),
+            'expense_total': pd.Series(dtype='float64'), 'revenue_total': pd.Series(dtype='float64')
+        })
+
+    df = pd.concat(frames, ignore_index=True)
+    df['Mois'] = pd.Categorical(df['Mois'], categories=MOIS, ordered=True)
+    df = df[df['Mois'].notna()]
+    df['Année'] = df['Année'].astype('int16')
+    df['period'] = (df['Année'].astype('int32') * 12 + df['Mois'].cat.codes).astype('int32')
+    df['Catégories'] = df['Catégories'].astype('category')
+    for column in ('expense_total', 'revenue_total'):
+        df[column] = pd.to_numeric(df[column], errors='coerce').fillna(0.0).astype('float64')
+    return df[['period', 'Année', 'Mois', 'Catégories', 'expense_total', 'revenue_total']]
+
+def monthly_trend(df, window=ROLLING_MONTHS):
+    """
+    Totaux mois par mois sur toute la période, avec moyennes glissantes
+
+    Les mois sans transaction sont présents avec des totaux nuls.
+    """
+    totals = df.groupby('period')[['expense_total', 'revenue_total']].sum()
+    if totals.empty:
+        return totals.assign(balance=[], expense_avg=[], revenue_avg=[], date=[])
+    totals = totals.reindex(np.arange(totals.index.min(), totals.index.max() + 1), fill_value=0.0)
+    totals.index.name = 'period'
+    totals['balance'] = totals['revenue_total'] - totals['expense_total']
+    totals['expense_avg'] = totals['expense_total'].rolling(window, min_periods=1).mean()
+    totals['revenue_avg'] = totals['revenue_total'].rolling(window, min_periods=1).mean()
+    periods = totals.index.to_numpy()
+    totals['date'] = pd.to_datetime(pd.DataFrame({'year': periods // 12, 'month': periods % 12 + 1,
+                                                  'day': 1})).to_numpy()
+    return totals
+
+def yoy_by_category(df, year, through_month=12):
+    """
+    Dépenses par catégorie comparées à l'année précédente, sur la même période
+
+    Args:
+        year: Année comparée à year - 1
+        through_month: Dernier mois pris en compte (1-12), pour comparer
+            une année en cours à la même période de l'année précédente
+
+    Returns:
+        DataFrame (Catégories, previous, current, delta, delta_pct) trié par delta
+    """
+    mask = df['Année'].isin([year - 1, year]) & (df['Mois'].cat.codes < through_month)
+    pivot = df[mask].pivot_table(index='Catégories', columns='Année', values='expense_total',
+                                 aggfunc='sum', fill_value=0.0, observed=True)
+    result = pd.DataFrame(index=pivot.index)
+    result['previous'] = pivot[year - 1] if year - 1 in pivot else 0.0
+    result['current'] = pivot[year] if year in pivot else 0.0
+    result['delta'] = result['current'] - result['previous']
+    result['delta_pct'] = result['delta'] / result['previous'].replace(0.0, np.nan) * 100
+    result = result[(result['previous'] != 0) | (result['current'] != 0)]
+    return result.sort_values('delta', ascending=False).reset_index()
+
+def forecast_remaining(trend, year, through_month):
+    """
+    Prévision des mois restants de l'année
+
+    Chaque mois = moyenne glissante au dernier mois connu x saisonnalité
+    (rapport entre le même mois de l'année précédente et sa moyenne).
+
+    Returns:
+        DataFrame (Mois, expense_forecast, revenue_forecast), vide si l'année est close
+    """
+    last = year * 12 + through_month - 1
+    periods = np.arange(last + 1, year * 12 + 12)
+    if periods.size == 0 or trend.empty:
+        return pd.DataFrame(columns=['Mois', 'expense_forecast', 'revenue_forecast'])
+
+    previous_year = trend.reindex(np.arange((year - 1) * 12, year * 12))
+    forecast = pd.DataFrame({'Mois': [MOIS[p % 12] for p in periods]})
+    for kind in ('expense', 'revenue'):
+        baseline = trend[f'{kind}_avg'].get(last, 0.0)
+        reference = previous_year[f'{kind}_total']
+        seasonal = (reference.reindex(periods - 12).to_numpy() / reference.mean())
+        seasonal = np.where(np.isfinite(seasonal), seasonal, 1.0)
+        forecast[f'{kind}_forecast'] = baseline * seasonal
+    return forecast
+
+def compute_analytics(version, summaries, rules, year, through_month):
+    """
+    Calcule toutes les analyses, mémorisées par version des données
+
+    Les DataFrames retournés sont partagés entre les sessions : ne pas les modifier.
+
+    Args:
+        version: Identifiant des données (change à chaque modification des résumés ou règles)
+        summaries: Dictionnaire {année: cellules du résumé annuel}
+        rules: Règles de dépenses récurrentes
+        year: Année analysée
+        through_month: Dernier mois connu de l'année (12 pour une année passée)
+    """
+    key = (version, year, through_month)
+    with _memo_lock:
+        if key in _memo:
+            _memo.move_to_end(key)
+            return _memo[key]
+
+    df = ledger_frame(summaries, rules)
+    trend = monthly_trend(df)
+    forecast = forecast_remaining(trend, year, through_month)
+    current = df[(df['Année'] == year) & (df['Mois'].cat.codes < through_month)]
+    result = {
+        'trend': trend,
+        'yoy': yoy_by_category(df, year, through_month),
+        'forecast': forecast,
+        'projected_expenses': current['expense_total'].sum() + forecast['expense_forecast'].sum(),
+        'projected_revenues': current['revenue_total'].sum() + forecast['revenue_forecast'].sum()
+    }
+
+    with _memo_lock:
+        _memo[key] = result
+        while len(_memo) > MEMO_SIZE:
+            _memo.popitem(last=False)
+    return result
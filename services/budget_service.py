@@ -1,6 +1,18 @@
 from firebase_admin import firestore
+import threading
 import time
+from collections import defaultdict, deque
+from datetime import datetime, timedelta, timezone
+from itertools import islice
+import logging
 import streamlit as st
+from firestore_client import DATA_ERRORS, get_data_access
+from local_store import SEARCH_LIMIT, edit_time, get_local_store, new_doc_id
+from firebase import UNREAD_BADGE_LIMIT, invalidate_unread_count, notification_data, unread_notifications_query
+from instrumentation import current_session_id
+from user_context import invalidate_user_context, load_user_context
+
+logger = logging.getLogger(__name__)
 
 # Liste des catégories de dépenses
 CATEGORIES_DEPENSES = [
@@ -14,11 +26,8 @@ CATEGORIES_DEPENSES = [
 ]
 
 def get_db():
-    """Retourne l'instance Firestore"""
-    try:
-        return firestore.client()
-    except:
-        return None
+    """Retourne l'instance Firestore partagée"""
+    return get_data_access().get_client()
 
 def add_notification(title, message, user, module="budget"):
     """Ajoute une notification"""
@@ -27,28 +36,864 @@ def add_notification(title, message, user, module="budget"):
         return
     try:
         notif_ref = db.collection('notifications').document()
-        notif_ref.set({
-            'title': title,
-            'message': message,
-            'user': user,
-            'module': module,
-            'timestamp': time.time(),
-            'read': False
-        })
-    except:
-        pass
+        notif_ref.set(notification_data(title, message, user, module))
+        invalidate_unread_count()
+    except DATA_ERRORS as e:
+        logger.warning("Notification « %s » non enregistrée: %s", title, e)
 
-# ===== GESTION DES DÉPENSES =====
+# ===== SYNCHRONISATION INCRÉMENTALE =====
 
-def add_expense(category, amount, frequency, description, month, year, user):
-    """Ajoute une dépense à Firestore"""
+# Le champ 'Timestamp' reçoit l'horodatage serveur (SERVER_TIMESTAMP) à chaque
+# écriture et sert de high-water mark : les horloges des clients n'interviennent
+# pas. Les suppressions laissent une tombe dans '<collection>_tombstones' pour
+# être propagées aux autres sessions, de même qu'un changement d'année : la
+# synchronisation d'une année ne lit que ses propres documents et ne verrait
+# jamais le document partir. Les autres modifications sont relues directement.
+# Les tombes expirent (TTL Firestore sur 'expire_at') après TOMBSTONE_TTL_DAYS.
+SYNC_OVERLAP_SECONDS = 5  # Marge pour les écritures validées pendant la lecture
+TOMBSTONE_TTL_DAYS = 30  # Au-delà, un client en retard recharge tout
+SYNC_CHANGE_LOG_SIZE = 1000  # Changements conservés pour la mise à jour des registres
+SYNC_TIMEOUT_SECONDS = 5  # Au-delà, les données locales sont servies telles quelles
+
+_sync_lock = threading.Lock()
+_sync_state = {}
+# Une synchronisation à la fois par collection (lectures Firestore hors de _sync_lock)
+_fetch_locks = defaultdict(threading.Lock)
+
+def _get_sync_state(collection, year=None):
+    """Retourne l'état de synchronisation local d'une collection (ou d'une année)"""
+    return _sync_state.setdefault((collection, year), {
+        'docs': {},
+        'high_water_mark': None,
+        'version': 0,
+        # Journal (version, doc_id, données ou None si supprimé) depuis log_start
+        'changes': deque(maxlen=SYNC_CHANGE_LOG_SIZE),
+        'log_start': 0
+    })
+
+def _reset_docs(state, docs):
+    """Remplace tout le snapshot local : le journal des changements repart de zéro"""
+    state['docs'] = docs
+    state['version'] += 1
+    state['changes'].clear()
+    state['log_start'] = state['version']
+
+def _record_change(state, doc_id, data):
+    """Applique un changement au snapshot local et le consigne dans le journal"""
+    if data is None:
+        if state['docs'].pop(doc_id, None) is None:
+            return False
+    else:
+        state['docs'][doc_id] = data
+    state['changes'].append((state['version'] + 1, doc_id, data))
+    return True
+
+def _add_tombstone(batch, db, collection, doc_id):
+    """Ajoute au batch la tombe d'un document pour la synchronisation"""
+    batch.set(db.collection(f'{collection}_tombstones').document(doc_id), {
+        'doc_id': doc_id,
+        'Timestamp': firestore.SERVER_TIMESTAMP,
+        'expire_at': datetime.now(timezone.utc) + timedelta(days=TOMBSTONE_TTL_DAYS)
+    })
+
+def _normalize(data):
+    """Horodatage serveur (datetime) converti en secondes, comme les dates locales"""
+    if isinstance(data.get('Timestamp'), datetime):
+        data['Timestamp'] = data['Timestamp'].timestamp()
+    return data
+
+def _doc_data(doc):
+    """Données d'un document Firestore avec son 'doc_id'"""
+    return {**_normalize(doc.to_dict()), 'doc_id': doc.id}
+
+def _high_water_mark(docs, previous=None):
+    """Plus grand horodatage serveur lu (les horloges locales ne sont pas utilisées)"""
+    stamps = [data['Timestamp'] for data in docs if isinstance(data.get('Timestamp'), (int, float))]
+    return max(stamps + [previous if previous is not None else 0.0])
+
+def _local_doc(store, collection, doc_id, year=None):
+    """Retourne un document de la base locale s'il appartient à l'année demandée"""
+    data = store.get(collection, doc_id)
+    if data is None or (year is not None and data.get('Année') != int(year)):
+        return None
+    return {**data, 'doc_id': doc_id}
+
+def _seed_from_local(state, store, collection, year):
+    """Charge le snapshot depuis la base locale au premier accès du processus"""
+    if state['high_water_mark'] is not None or state['docs']:
+        return
+    docs = {data['doc_id']: data for data in store.documents(collection, year)}
+    if docs:
+        _reset_docs(state, docs)
+        state['high_water_mark'] = store.get_meta(f'hwm:{collection}:{year}')
+
+def _sync_collection(collection, year=None, full=False, strict=False):
+    """Synchronise le snapshot local d'une collection avec Firestore
+
+    Le snapshot est d'abord chargé depuis la base locale SQLite. Le premier
+    appel sans historique local (ou full=True) charge toute la collection, ou
+    seulement l'année demandée. Les appels suivants ne lisent que les
+    documents écrits ou supprimés depuis le dernier high-water mark.
+    Si Firestore est lent ou injoignable, les données locales sont servies
+    (ou l'erreur est levée avec strict=True, pour que l'appelant réessaie).
+    Un client dont le high-water mark est plus ancien que la durée de vie
+    des tombes recharge tout : des suppressions ont pu lui échapper.
+
+    Les lectures Firestore se font hors de _sync_lock : les collections
+    différentes se synchronisent en parallèle (chargement de page).
+    """
+    state = _get_sync_state(collection, year)
+    store = get_local_store()
+
+    with _fetch_locks[collection]:
+        with _sync_lock:
+            _seed_from_local(state, store, collection, year)
+            high_water_mark = state['high_water_mark']
+            live = _is_live(collection, year)
+        db = get_db()
+        if not db or (not full and live and high_water_mark is not None):
+            # Hors ligne, ou le listener temps réel tient déjà le snapshot à jour
+            with _sync_lock:
+                return list(state['docs'].values())
+        expired = (high_water_mark is not None
+                   and high_water_mark < time.time() - TOMBSTONE_TTL_DAYS * 86400)
+        try:
+            with get_data_access().track(f'sync_{collection}'):
+                query, client_filters = _plan_query(db, collection, year=year)
+                if full or high_water_mark is None or expired:
+                    remote = list(_run_query(query, client_filters, timeout=SYNC_TIMEOUT_SECONDS))
+                    high_water_mark = _high_water_mark(remote)
+                    store.merge_remote(collection, remote, year=year, complete=True)
+                    # Les écritures locales pas encore répliquées restent visibles
+                    docs = {data['doc_id']: data for data in store.documents(collection, year)}
+                    with _sync_lock:
+                        _reset_docs(state, docs)
+                else:
+                    since = datetime.fromtimestamp(high_water_mark - SYNC_OVERLAP_SECONDS, timezone.utc)
+                    # Les tombes sont appliquées avant les documents modifiés :
+                    # un document déplacé vers une autre année est retiré puis
+                    # ré-ajouté seulement dans le snapshot de sa nouvelle année.
+                    tombstones = [_doc_data(t) for t in db.collection(f'{collection}_tombstones')
+                                  .where('Timestamp', '>=', since).stream(timeout=SYNC_TIMEOUT_SECONDS)]
+                    deleted = [t['doc_id'] for t in tombstones]
+                    updated = list(_run_query(query.where('Timestamp', '>=', since), client_filters,
+                                              timeout=SYNC_TIMEOUT_SECONDS))
+                    high_water_mark = _high_water_mark(tombstones + updated, high_water_mark)
+                    store.merge_remote(collection, updated, deleted, year=year)
+                    changes = [(doc_id, _local_doc(store, collection, doc_id, year))
+                               for doc_id in dict.fromkeys(deleted + [data['doc_id'] for data in updated])]
+                    with _sync_lock:
+                        changed = False
+                        for doc_id, data in changes:
+                            changed = _record_change(state, doc_id, data) or changed
+                        if changed:
+                            state['version'] += 1
+                with _sync_lock:
+                    state['high_water_mark'] = high_water_mark
+                store.set_meta(f'hwm:{collection}:{year}', high_water_mark)
+        except Exception as e:
+            # Les données locales restent servies ; le high-water mark n'avance pas
+            logger.warning("Synchronisation de %s (%s) impossible: %s", collection, year, e)
+            if strict:
+                raise
+        with _sync_lock:
+            return list(state['docs'].values())
+
+def _update_snapshots(collection, doc_ids):
+    """Reporte dans les snapshots en mémoire l'état local de documents modifiés"""
+    store = get_local_store()
+    docs = {doc_id: store.get(collection, doc_id) for doc_id in doc_ids}
+    with _sync_lock:
+        for (name, year), state in _sync_state.items():
+            if name != collection:
+                continue
+            changed = False
+            for doc_id, data in docs.items():
+                in_scope = data is not None and (year is None or data.get('Année') == year)
+                if not in_scope and doc_id not in state['docs']:
+                    continue
+                changed = _record_change(state, doc_id, {**data, 'doc_id': doc_id} if in_scope else None) or changed
+            if changed:
+                state['version'] += 1
+
+def sync_expenses(year=None, full=False, strict=False):
+    """Récupère les dépenses (d'une année si précisée) via la synchronisation incrémentale"""
+    return _sync_collection('expenses', year=year, full=full, strict=strict)
+
+def sync_revenues(year=None, full=False, strict=False):
+    """Récupère les revenus (d'une année si précisée) via la synchronisation incrémentale"""
+    return _sync_collection('revenues', year=year, full=full, strict=strict)
+
+def get_sync_version(collection, year=None):
+    """Retourne le numéro de version du snapshot local d'une collection"""
+    return _get_sync_state(collection, year)['version']
+
+def get_changes_since(collection, version, year=None):
+    """
+    Retourne les changements du snapshot local postérieurs à une version
+
+    Returns:
+        Liste de couples (doc_id, données ou None si supprimé), dans l'ordre,
+        ou None si le journal ne remonte pas jusqu'à cette version
+        (un rechargement complet est alors nécessaire)
+    """
+    state = _get_sync_state(collection, year)
+    with _sync_lock:
+        if version < state['log_start']:
+            return None
+        changes = state['changes']
+        if changes and changes[0][0] > version + 1:
+            return None
+        return [(doc_id, data) for v, doc_id, data in changes if v > version]
+
+# Documents écrits avant SERVER_TIMESTAMP : 'Timestamp' numérique (time.time())
+TIMESTAMP_MIGRATION_BATCH_SIZE = 400
+
+def migrate_legacy_timestamps():
+    """
+    Convertit en horodatages Firestore les 'Timestamp' numériques des dépenses,
+    revenus et tombes écrits avant SERVER_TIMESTAMP
+
+    Firestore ne compare pas un nombre à une date : sans conversion, ces documents
+    échappent à la synchronisation incrémentale et sont triés à part dans les
+    tables paginées. Un filtre numérique ne renvoie que les documents à convertir,
+    chaque lot converti sort donc de la requête. Les anciennes tombes reçoivent
+    aussi leur 'expire_at'. Le drapeau 'server_timestamps' de config/budget
+    évite ensuite de recommencer.
+
+    Returns:
+        Nombre de documents convertis
+    """
+    db = get_db()
+    if not db:
+        return 0
+    context = load_user_context()
+    if context and (context['budget'] or {}).get('server_timestamps'):
+        return 0
+    converted = 0
+    for collection in ('expenses', 'revenues', 'expenses_tombstones', 'revenues_tombstones'):
+        query = (db.collection(collection).where('Timestamp', '>=', 0)
+                 .select(['Timestamp']).limit(TIMESTAMP_MIGRATION_BATCH_SIZE))
+        while True:
+            with get_data_access().track('migrate_legacy_timestamps'):
+                docs = list(query.stream())
+            if not docs:
+                break
+            batch = db.batch()
+            for doc in docs:
+                written = datetime.fromtimestamp(doc.to_dict()['Timestamp'], timezone.utc)
+                changes = {'Timestamp': written}
+                if collection.endswith('_tombstones'):
+                    changes['expire_at'] = written + timedelta(days=TOMBSTONE_TTL_DAYS)
+                batch.update(doc.reference, changes)
+            batch.commit()
+            converted += len(docs)
+    db.collection('config').document('budget').set({'server_timestamps': True}, merge=True)
+    invalidate_user_context()
+    return converted
+
+# ===== TEMPS RÉEL =====
+
+# Les listeners sont partagés par toutes les sessions du processus. Chaque session
+# en mode temps réel détient ses listeners et les renouvelle ; un listener est
+# fermé dès qu'aucune session ne le détient plus.
+LIVE_SESSION_TIMEOUT_SECONDS = 60
+
+_listeners = {}
+# Session -> (clés des listeners détenus, dernier renouvellement)
+_live_sessions = {}
+_live_notifications = {'unread': None, 'version': 0}
+
+def _is_live(collection, scope):
+    watch = _listeners.get((collection, scope))
+    return watch is not None and watch.is_active
+
+def _on_collection_snapshot(collection, year):
+    """Construit le callback qui reporte les changements dans le snapshot local"""
+    first = [True]
+
+    def callback(docs, changes, read_time):
+        state = _get_sync_state(collection, year)
+        store = get_local_store()
+        with _sync_lock:
+            if first[0]:
+                # Premier snapshot : état complet de la requête
+                first[0] = False
+                remote = [_doc_data(doc) for doc in docs]
+                store.merge_remote(collection, remote, year=year, complete=True)
+                state['high_water_mark'] = _high_water_mark(remote)
+                _reset_docs(state, {data['doc_id']: data for data in store.documents(collection, year)})
+            else:
+                upserts = [_doc_data(change.document)
+                           for change in changes if change.type.name != 'REMOVED']
+                state['high_water_mark'] = _high_water_mark(upserts, state['high_water_mark'])
+                removed = [change.document.id for change in changes if change.type.name == 'REMOVED']
+                store.merge_remote(collection, upserts, removed, year=year)
+                changed = False
+                for change in changes:
+                    doc_id = change.document.id
+                    changed = _record_change(state, doc_id, _local_doc(store, collection, doc_id, year)) or changed
+                if changed:
+                    state['version'] += 1
+                    # Le résumé de l'année a été modifié par une autre session
+                    _summary_cache.pop(year, None)
+                    _summary_cache.pop('all', None)
+    return callback
+
+def _on_notifications_snapshot(docs, changes, read_time):
+    _live_notifications['unread'] = len(docs)
+    _live_notifications['version'] += 1
+
+def _open_listener(db, key):
+    collection, scope = key
+    if collection == 'notifications':
+        # Le badge s'arrête à UNREAD_BADGE_LIMIT : inutile de suivre davantage de documents
+        query = unread_notifications_query(db).limit(UNREAD_BADGE_LIMIT + 1)
+        return query.on_snapshot(_on_notifications_snapshot)
+    query, _ = _plan_query(db, collection, year=scope)
+    return query.on_snapshot(_on_collection_snapshot(collection, scope))
+
+def _release_listeners(now):
+    """Oublie les sessions muettes et ferme les listeners qui ne servent plus (sous _sync_lock)"""
+    for session_id, (_, renewed) in list(_live_sessions.items()):
+        if now - renewed > LIVE_SESSION_TIMEOUT_SECONDS:
+            del _live_sessions[session_id]
+    held = set().union(*(keys for keys, _ in _live_sessions.values()))
+    for key in [key for key in _listeners if key not in held]:
+        _listeners.pop(key).unsubscribe()
+        if key[0] == 'notifications':
+            _live_notifications['unread'] = None
+
+def start_live_sync(year):
+    """
+    Ouvre, ou renouvelle pour la session courante, les listeners temps réel
+    des dépenses et revenus d'une année et des notifications non lues du foyer
+
+    À rappeler au moins toutes les LIVE_SESSION_TIMEOUT_SECONDS secondes : au-delà,
+    la session est considérée comme terminée et ses listeners sont libérés.
+    """
     db = get_db()
     if not db:
         return False
-    
+
+    keys = {('expenses', year), ('revenues', year), ('notifications', None)}
+    with _sync_lock:
+        _live_sessions[current_session_id()] = (keys, time.time())
+        for key in keys:
+            watch = _listeners.get(key)
+            if watch is None or not watch.is_active:
+                if watch is not None:
+                    watch.unsubscribe()
+                _listeners[key] = _open_listener(db, key)
+        # Listeners de l'année précédente de cette session, ou de sessions terminées
+        _release_listeners(time.time())
+    return True
+
+def stop_live_sync():
+    """Libère les listeners de la session courante (fermés s'ils ne servent plus à personne)"""
+    with _sync_lock:
+        _live_sessions.pop(current_session_id(), None)
+        _release_listeners(time.time())
+
+def release_idle_live_sync():
+    """Ferme les listeners des sessions qui ne les renouvellent plus (onglet fermé)"""
+    with _sync_lock:
+        _release_listeners(time.time())
+
+def get_live_notifications():
+    """Retourne (nombre de non lues, version) suivis en temps réel, nombre None sinon"""
+    if not _is_live('notifications', None):
+        return None, _live_notifications['version']
+    return _live_notifications['unread'], _live_notifications['version']
+
+# ===== REQUÊTES FILTRÉES =====
+
+# Firestore limite le nombre de valeurs d'un filtre 'in' et n'accepte
+# qu'un seul filtre 'in' par requête : le reste est filtré côté client.
+MAX_IN_VALUES = 10
+
+def _plan_query(db, collection, year=None, months=None, categories=None, user=None,
+                category_field='Catégories'):
+    """Construit la requête Firestore et la liste des filtres à appliquer côté client
+
+    Returns:
+        Tuple (query, client_filters) où client_filters est une liste de
+        couples (champ, valeurs autorisées)
+    """
+    query = db.collection(collection)
+    client_filters = []
+
+    if year is not None:
+        query = query.where('Année', '==', int(year))
+    if user:
+        query = query.where('Utilisateur', '==', user)
+
+    in_filter_used = False
+    for field, values in (('Mois', months), (category_field, categories)):
+        if not values:
+            continue
+        values = list(dict.fromkeys(values))
+        if len(values) == 1:
+            query = query.where(field, '==', values[0])
+        elif not in_filter_used and len(values) <= MAX_IN_VALUES:
+            query = query.where(field, 'in', values)
+            in_filter_used = True
+        else:
+            client_filters.append((field, set(values)))
+
+    return query, client_filters
+
+def _run_query(query, client_filters, timeout=None):
+    """Exécute une requête et applique les filtres non délégués à Firestore"""
+    for doc in query.stream(timeout=timeout):
+        data = _doc_data(doc)
+        if all(data.get(field) in values for field, values in client_filters):
+            yield data
+
+def query_expenses(year=None, months=None, categories=None, user=None):
+    """Récupère les dépenses filtrées par année, mois, catégories et utilisateur"""
+    db = get_db()
+    if not db:
+        return []
+
+    try:
+        query, client_filters = _plan_query(db, 'expenses', year=year, months=months,
+                                            categories=categories, user=user)
+        with get_data_access().track('query_expenses'):
+            return list(_run_query(query, client_filters))
+    except DATA_ERRORS as e:
+        logger.warning("Lecture des dépenses (%s) impossible: %s", year, e)
+        return []
+
+def query_revenues(year=None, months=None, sources=None, user=None):
+    """Récupère les revenus filtrés par année, mois, sources et utilisateur"""
+    db = get_db()
+    if not db:
+        return []
+
+    try:
+        query, client_filters = _plan_query(db, 'revenues', year=year, months=months,
+                                            categories=sources, user=user,
+                                            category_field='Source')
+        with get_data_access().track('query_revenues'):
+            return list(_run_query(query, client_filters))
+    except DATA_ERRORS as e:
+        logger.warning("Lecture des revenus (%s) impossible: %s", year, e)
+        return []
+
+# ===== TABLES PAGINÉES =====
+
+TRANSACTIONS_PAGE_SIZE = 50
+# Tris proposés : (champ, direction) ; chacun a ses index composites
+TRANSACTION_SORTS = {
+    'recent': ('Timestamp', firestore.Query.DESCENDING),
+    'oldest': ('Timestamp', firestore.Query.ASCENDING),
+    'amount': ('Montant', firestore.Query.DESCENDING)
+}
+
+def _matches(data, year, category_field, category, month, user):
+    return (data.get('Année') == int(year)
+            and (not category or data.get(category_field) == category)
+            and (not month or data.get('Mois') == month)
+            and (not user or data.get('Utilisateur') == user))
+
+def _sort_records(records, sort):
+    field, direction = TRANSACTION_SORTS[sort]
+    return sorted(records, key=lambda data: data.get(field) or 0,
+                  reverse=direction == firestore.Query.DESCENDING)
+
+def _local_page(collection, year, matches, sort, page_size, start_after=None):
+    """
+    Page lue dans la base locale (hors ligne) : le curseur suivant est un décalage
+
+    start_after peut aussi être le curseur Firestore de la page précédente,
+    quand la lecture paginée échoue en cours de route.
+    """
+    store = get_local_store()
+    # Les créations en attente sont présentées à part (get_pending_transactions)
+    pending = store.pending_creations(collection)
+    records = _sort_records([data for data in store.documents(collection, year)
+                             if data['doc_id'] not in pending and matches(data)], sort)
+    if start_after is None or isinstance(start_after, int):
+        offset = start_after or 0
+    else:
+        ids = [data['doc_id'] for data in records]
+        offset = ids.index(start_after.id) + 1 if start_after.id in ids else len(records)
+    end = offset + page_size
+    return records[offset:end], end if end < len(records) else None
+
+def get_transactions_page(collection, year, category=None, month=None, user=None, sort='recent',
+                          page_size=TRANSACTIONS_PAGE_SIZE, start_after=None):
+    """
+    Récupère une page de dépenses ou de revenus d'une année, filtrée et triée par Firestore
+
+    Seuls page_size + 1 documents sont lus, quelle que soit la taille de l'année.
+    Les modifications et suppressions locales pas encore répliquées sont
+    reportées sur la page ; les créations sont renvoyées à part par
+    get_pending_transactions, une page ne dépasse donc jamais page_size.
+
+    Args:
+        collection: 'expenses' ou 'revenues'
+        category: Catégorie (dépenses) ou source (revenus), toutes si None
+        sort: Clé de TRANSACTION_SORTS
+        start_after: Curseur retourné par l'appel précédent
+
+    Returns:
+        Tuple (documents avec 'doc_id', curseur de la page suivante ou None)
+    """
+    category_field = 'Catégories' if collection == 'expenses' else 'Source'
+
+    def matches(data):
+        return _matches(data, year, category_field, category, month, user)
+
+    db = get_db()
+    if not db or isinstance(start_after, int):
+        return _local_page(collection, year, matches, sort, page_size, start_after)
+    try:
+        query, _ = _plan_query(db, collection, year=year, months=[month] if month else None,
+                               categories=[category] if category else None, user=user,
+                               category_field=category_field)
+        field, direction = TRANSACTION_SORTS[sort]
+        query = query.order_by(field, direction=direction)
+        if start_after is not None:
+            query = query.start_after(start_after)
+        # Un document de plus pour savoir s'il existe une page suivante
+        with get_data_access().track(f'page_{collection}'):
+            docs = list(query.limit(page_size + 1).stream(timeout=SYNC_TIMEOUT_SECONDS))
+    except Exception as e:
+        # Index manquant, délai dépassé, hors ligne : la pagination continue sur la base locale
+        logger.warning("Lecture paginée de %s (%s, tri %s) impossible, page lue dans la base locale: %s",
+                       collection, year, sort, e)
+        return _local_page(collection, year, matches, sort, page_size, start_after)
+
+    records = [_doc_data(doc) for doc in docs[:page_size]]
+    next_cursor = docs[page_size - 1] if len(docs) > page_size else None
+
+    pending = get_local_store().pending_documents(collection)
+    if pending:
+        records = [{**pending[data['doc_id']], 'doc_id': data['doc_id']}
+                   if data['doc_id'] in pending else data
+                   for data in records if pending.get(data['doc_id'], data) is not None]
+        records = [data for data in records if matches(data)]
+    return records, next_cursor
+
+def get_pending_transactions(collection, year, category=None, month=None, user=None, sort='recent'):
+    """Créations locales pas encore répliquées, avec 'doc_id', filtrées et triées comme les pages"""
+    category_field = 'Catégories' if collection == 'expenses' else 'Source'
+    created = get_local_store().pending_creations(collection)
+    return _sort_records([{**data, 'doc_id': doc_id} for doc_id, data in created.items()
+                          if data is not None
+                          and _matches(data, year, category_field, category, month, user)], sort)
+
+# ===== RECHERCHE =====
+
+def search_expenses(text, year=None, category=None, limit=SEARCH_LIMIT):
+    """
+    Recherche des dépenses par mots de leur description
+
+    La recherche porte sur l'index local, tenu à jour à chaque synchronisation
+    et écriture : seules les années déjà synchronisées sur ce serveur sont
+    couvertes, sans lecture Firestore.
+
+    Args:
+        text: Mots ou débuts de mots, sans accents ni casse imposés
+        year: Année, toutes si None
+        category: Catégorie, toutes si None
+
+    Returns:
+        Liste de dépenses avec 'doc_id', les plus récentes d'abord
+    """
+    try:
+        return get_local_store().search('expenses', text, year=year, category=category, limit=limit)
+    except Exception as e:
+        logger.warning("Recherche de dépenses impossible: %s", e)
+        return []
+
+# ===== RÉSUMÉS ANNUELS =====
+
+# Un document 'budget_summaries/<année>' agrège les transactions par
+# (mois, catégorie ou source, utilisateur). Il est tenu à jour par
+# incréments à chaque écriture, dans le même batch que la transaction.
+SUMMARY_CACHE_SECONDS = 30
+
+_summary_cache = {}
+
+def _summary_key(month, category, user):
+    """Clé d'une cellule du résumé annuel"""
+    return f"{month}|{category}|{user}"
+
+def _add_summary_delta(deltas, kind, record, sign=1):
+    """Accumule l'effet d'une transaction sur les résumés annuels
+
+    Args:
+        deltas: Dictionnaire {année: {clé: {champ: incrément}}} à compléter
+        kind: 'expense' ou 'revenue'
+        record: Document de la transaction
+        sign: 1 pour un ajout, -1 pour un retrait
+    """
+    category = record.get('Catégories') if kind == 'expense' else record.get('Source')
+    key = _summary_key(record.get('Mois'), category, record.get('Utilisateur'))
+    cell = deltas.setdefault(int(record.get('Année', 0)), {}).setdefault(key, {})
+    cell[f'{kind}_total'] = cell.get(f'{kind}_total', 0.0) + sign * float(record.get('Montant', 0))
+    cell[f'{kind}_count'] = cell.get(f'{kind}_count', 0) + sign
+
+def _apply_summary_deltas(batch, db, deltas):
+    """Ajoute au batch les incréments des résumés annuels"""
+    for year, cells in deltas.items():
+        batch.set(db.collection('budget_summaries').document(str(year)), {
+            'cells': {
+                key: {field: firestore.Increment(value) for field, value in fields.items()}
+                for key, fields in cells.items()
+            },
+            'updated_at': time.time()
+        }, merge=True)
+        _summary_cache.pop(year, None)
+        _summary_cache.pop('all', None)
+
+def rebuild_year_summary(year):
+    """Recalcule entièrement le résumé d'une année à partir des transactions"""
+    db = get_db()
+    if not db:
+        return {}
+
+    try:
+        deltas = {}
+        for expense in query_expenses(year=year):
+            _add_summary_delta(deltas, 'expense', expense)
+        for revenue in query_revenues(year=year):
+            _add_summary_delta(deltas, 'revenue', revenue)
+        cells = deltas.get(int(year), {})
+        db.collection('budget_summaries').document(str(year)).set({
+            'cells': cells,
+            'updated_at': time.time()
+        })
+        _summary_cache[int(year)] = (time.time(), cells)
+        _summary_cache.pop('all', None)
+        return cells
+    except DATA_ERRORS as e:
+        logger.warning("Reconstruction du résumé %s impossible: %s", year, e)
+        return {}
+
+def get_year_summary(year):
+    """Récupère les cellules du résumé d'une année (construit au premier accès)"""
+    year = int(year)
+    cached = _summary_cache.get(year)
+    if cached and time.time() - cached[0] < SUMMARY_CACHE_SECONDS:
+        return cached[1]
+
+    db = get_db()
+    if not db:
+        return {}
+
+    try:
+        doc = db.collection('budget_summaries').document(str(year)).get()
+        if not doc.exists:
+            return rebuild_year_summary(year)
+        cells = doc.to_dict().get('cells', {})
+        _summary_cache[year] = (time.time(), cells)
+        return cells
+    except DATA_ERRORS as e:
+        logger.warning("Lecture du résumé %s impossible: %s", year, e)
+        return {}
+
+def get_all_year_summaries():
+    """
+    Récupère les résumés de toutes les années en une requête
+
+    Returns:
+        Tuple ({année: cellules}, version) où version change dès qu'un résumé est modifié
+    """
+    cached = _summary_cache.get('all')
+    if cached and time.time() - cached[0] < SUMMARY_CACHE_SECONDS:
+        return cached[1]
+
+    db = get_db()
+    if not db:
+        return {}, None
+
     try:
-        expense_ref = db.collection('expenses').document()
-        expense_ref.set({
+        with get_data_access().track('get_all_year_summaries'):
+            docs = list(db.collection('budget_summaries').stream(timeout=SYNC_TIMEOUT_SECONDS))
+        summaries = {}
+        version = []
+        for doc in docs:
+            data = doc.to_dict()
+            summaries[int(doc.id)] = data.get('cells', {})
+            version.append((int(doc.id), data.get('updated_at')))
+        result = (summaries, tuple(sorted(version)))
+        _summary_cache['all'] = (time.time(), result)
+        return result
+    except DATA_ERRORS as e:
+        logger.warning("Lecture des résumés annuels impossible: %s", e)
+        return {}, None
+
+# ===== RÉPLICATION =====
+
+# Les écritures sont d'abord enregistrées dans la base locale (outbox),
+# puis envoyées à Firestore par un thread unique du processus.
+REPLICATION_INTERVAL_SECONDS = 30
+# Écritures de l'outbox lues par envoi (et taille des lots de la saisie en masse)
+OUTBOX_BATCH_SIZE = 500
+# Limite Firestore d'opérations par batch : document, tombe et notification de
+# chaque écriture, plus un incrément par résumé annuel touché
+FIRESTORE_BATCH_LIMIT = 500
+
+_replication_wakeup = threading.Event()
+# Un seul envoi à la fois : deux envois du même lot appliqueraient deux fois les deltas des résumés
+_push_lock = threading.Lock()
+_replication_lock = threading.Lock()
+_replication_thread = None
+
+def _write_local(collection, writes, notification=None):
+    """
+    Enregistre des écritures dans la base locale et réveille la réplication
+
+    Args:
+        collection: 'expenses' ou 'revenues'
+        writes: Liste de couples (doc_id, document complet ou None pour une suppression)
+        notification: (titre, message, utilisateur, module) publiée avec la dernière écriture
+    """
+    get_local_store().write_many(collection, writes, notification)
+    _update_snapshots(collection, [doc_id for doc_id, _ in writes])
+    start_replication()
+
+def push_outbox(limit=OUTBOX_BATCH_SIZE):
+    """
+    Envoie à Firestore un lot d'écritures en attente, en un seul batch
+
+    Les documents distants sont relus en une requête groupée : une écriture
+    locale plus ancienne que la dernière modification distante est abandonnée
+    (la version distante l'emporte et remplace la version locale).
+    Les envois sont sérialisés : un lot n'est relu qu'une fois confirmé ou remis en attente.
+    Le batch s'arrête avant FIRESTORE_BATCH_LIMIT opérations ; les écritures
+    restantes partent à l'envoi suivant.
+
+    Returns:
+        Nombre d'écritures traitées (0 si rien à envoyer ou en cas d'échec)
+    """
+    with _push_lock:
+        return _push_pending(limit)
+
+def _push_pending(limit):
+    db = get_db()
+    if not db:
+        return 0
+    store = get_local_store()
+    entries = store.pending(limit)
+    if not entries:
+        return 0
+
+    refs = {(e['collection'], e['doc_id']): db.collection(e['collection']).document(e['doc_id'])
+            for e in entries}
+    try:
+        with get_data_access().track('push_outbox_read'):
+            snapshots = {snap.reference.path: snap for snap in db.get_all(list(refs.values()))}
+    except Exception as e:
+        store.retry(entries, e)
+        return 0
+    current = {}
+    for key, ref in refs.items():
+        snap = snapshots.get(ref.path)
+        current[key] = _normalize(snap.to_dict()) if snap is not None and snap.exists else None
+
+    batch = db.batch()
+    deltas = {}
+    conflicts = {}
+    operations = 0
+    sent = []
+    for entry in entries:
+        collection, doc_id = key = (entry['collection'], entry['doc_id'])
+        kind = 'expense' if collection == 'expenses' else 'revenue'
+        remote = current[key]
+        if remote is not None and edit_time(remote) > entry['modified']:
+            # Conflit : la modification distante est plus récente
+            conflicts.setdefault(collection, {})[doc_id] = {**remote, 'doc_id': doc_id}
+            sent.append(entry)
+            continue
+        moved = (remote is not None and entry['op'] != 'delete'
+                 and entry['data'].get('Année', remote.get('Année')) != remote.get('Année'))
+        tombstone = remote is not None and (entry['op'] == 'delete' or moved)
+        years = {int(record.get('Année', 0)) for record in (remote, entry['data']) if record is not None}
+        cost = 1 + tombstone + bool(entry['notification']) + len(years - deltas.keys())
+        if operations + cost > FIRESTORE_BATCH_LIMIT:
+            break
+        operations += cost
+        sent.append(entry)
+        if remote is not None:
+            _add_summary_delta(deltas, kind, remote, sign=-1)
+            if tombstone:
+                _add_tombstone(batch, db, collection, doc_id)
+        if entry['op'] == 'delete':
+            if remote is not None:
+                batch.delete(refs[key])
+            current[key] = None
+        else:
+            # Timestamp = arrivée dans Firestore (horloge serveur), pour la synchronisation
+            # incrémentale des autres sessions ; DateModification = date de la saisie locale
+            data = {**(remote or {}), **entry['data'],
+                    'DateModification': entry['modified'], 'Timestamp': firestore.SERVER_TIMESTAMP}
+            batch.set(refs[key], data)
+            _add_summary_delta(deltas, kind, data)
+            current[key] = data
+        if entry['notification']:
+            title, message, user, module = entry['notification']
+            batch.set(db.collection('notifications').document(),
+                      notification_data(title, message, user, module))
+    _apply_summary_deltas(batch, db, deltas)
+
+    try:
+        with get_data_access().track('push_outbox'):
+            batch.commit()
+    except Exception as e:
+        store.retry(sent, e)
+        return 0
+    store.complete([entry['id'] for entry in sent])
+    for collection, docs in conflicts.items():
+        store.merge_remote(collection, list(docs.values()))
+        _update_snapshots(collection, list(docs))
+    return len(sent)
+
+def _replication_loop():
+    migrated = False
+    while True:
+        _replication_wakeup.wait(REPLICATION_INTERVAL_SECONDS)
+        _replication_wakeup.clear()
+        try:
+            while push_outbox():
+                pass
+        except Exception as e:
+            logger.warning("Réplication interrompue: %s", e)
+        # Conversion unique des anciens horodatages, reprise au réveil suivant en cas d'échec
+        if not migrated:
+            try:
+                migrate_legacy_timestamps()
+                migrated = True
+            except Exception as e:
+                logger.warning("Conversion des horodatages interrompue: %s", e)
+        # Une session fermée ne renouvelle plus ses listeners temps réel
+        release_idle_live_sync()
+
+def start_replication():
+    """Démarre (une fois par processus) et réveille le thread de réplication"""
+    global _replication_thread
+    with _replication_lock:
+        if _replication_thread is None or not _replication_thread.is_alive():
+            _replication_thread = threading.Thread(target=_replication_loop,
+                                                   name='famileasy-replication', daemon=True)
+            _replication_thread.start()
+    _replication_wakeup.set()
+
+def pending_writes():
+    """Nombre d'écritures locales pas encore envoyées à Firestore"""
+    return get_local_store().pending_count()
+
+# ===== GESTION DES DÉPENSES =====
+
+def add_expense(category, amount, frequency, description, month, year, user):
+    """Ajoute une dépense (répliquée en arrière-plan), retourne la dépense créée avec son 'doc_id' (None en cas d'échec)"""
+    try:
+        doc_id = new_doc_id()
+        expense = {
             'Catégories': category,
             'Montant': float(amount),
             'Fréquence': frequency,
@@ -57,28 +902,22 @@ def add_expense(category, amount, frequency, description, month, year, user):
             'Année': int(year),
             'Utilisateur': user,
             'Timestamp': time.time()
-        })
-        
-        # Notification
-        add_notification(
-            "Dépense ajoutée", 
-            f"{user} a ajouté {amount:.0f}€ dans {category} pour {month} {year}", 
-            user
-        )
-        return True
+        }
+        _write_local('expenses', [(doc_id, expense)], (
+            "Dépense ajoutée",
+            f"{user} a ajouté {amount:.0f}€ dans {category} pour {month} {year}",
+            user, "budget"
+        ))
+        return {**expense, 'doc_id': doc_id}
     except Exception as e:
         st.error(f"Erreur lors de l'ajout: {str(e)}")
-        return False
+        return None
 
 def update_expense(doc_id, category, amount, frequency, description, month, year, user):
     """Met à jour une dépense"""
-    db = get_db()
-    if not db:
-        return False
-    
     try:
-        expense_ref = db.collection('expenses').document(doc_id)
-        expense_ref.update({
+        previous = get_local_store().get('expenses', doc_id) or {}
+        changes = {
             'Catégories': category,
             'Montant': float(amount),
             'Fréquence': frequency,
@@ -86,145 +925,362 @@ def update_expense(doc_id, category, amount, frequency, description, month, year
             'Mois': month,
             'Année': int(year),
             'ModifiéPar': user,
-            'DateModification': time.time()
-        })
-        
-        # Notification
-        add_notification(
-            "Dépense modifiée", 
-            f"{user} a modifié une dépense de {amount:.0f}€ dans {category}", 
-            user
-        )
+            'DateModification': time.time(),
+            'Timestamp': time.time()
+        }
+        _write_local('expenses', [(doc_id, {**previous, **changes})], (
+            "Dépense modifiée",
+            f"{user} a modifié une dépense de {amount:.0f}€ dans {category}",
+            user, "budget"
+        ))
         return True
-    except:
+    except DATA_ERRORS as e:
+        logger.warning("Modification de la dépense %s impossible: %s", doc_id, e)
         return False
 
 def delete_expense(doc_id, user, category, amount):
     """Supprime une dépense"""
-    db = get_db()
-    if not db:
-        return False
-    
-    try:
-        db.collection('expenses').document(doc_id).delete()
-        
-        # Notification
-        add_notification(
-            "Dépense supprimée", 
-            f"{user} a supprimé une dépense de {amount:.0f}€ dans {category}", 
-            user
-        )
+    try:
+        _write_local('expenses', [(doc_id, None)], (
+            "Dépense supprimée",
+            f"{user} a supprimé une dépense de {amount:.0f}€ dans {category}",
+            user, "budget"
+        ))
         return True
-    except:
+    except DATA_ERRORS as e:
+        logger.warning("Suppression de la dépense %s impossible: %s", doc_id, e)
         return False
 
-def fetch_expenses():
-    """Récupère toutes les dépenses avec leurs IDs"""
-    db = get_db()
-    if not db:
+def _save_edits(collection, updates, deleted, user):
+    """
+    Enregistre les modifications d'une grille en une seule écriture groupée
+
+    Les documents modifiés et supprimés passent dans la même transaction
+    locale, puis dans le même batch Firestore. Seuls les résumés des années
+    touchées sont recalculés (deltas appliqués à la réplication).
+
+    Args:
+        collection: 'expenses' ou 'revenues'
+        updates: Dictionnaire {doc_id: champs modifiés}
+        deleted: doc_ids supprimés
+        user: Utilisateur qui effectue la modification
+
+    Returns:
+        Liste de couples (doc_id, document complet avec 'doc_id' ou None si supprimé)
+    """
+    store = get_local_store()
+    now = time.time()
+    writes = []
+    for doc_id, fields in updates.items():
+        previous = store.get(collection, doc_id)
+        if previous is None:
+            continue
+        if 'Montant' in fields:
+            fields = {**fields, 'Montant': float(fields['Montant'])}
+        writes.append((doc_id, {**previous, **fields, 'ModifiéPar': user,
+                                'DateModification': now, 'Timestamp': now}))
+    writes += [(doc_id, None) for doc_id in deleted]
+    if not writes:
         return []
-    
+
+    label = 'dépense(s)' if collection == 'expenses' else 'revenu(s)'
+    modified = len(writes) - len(deleted)
+    _write_local(collection, writes, (
+        "Dépenses modifiées" if collection == 'expenses' else "Revenus modifiés",
+        f"{user} a modifié {modified} et supprimé {len(deleted)} {label}",
+        user, "budget"
+    ))
+    return [(doc_id, {**data, 'doc_id': doc_id} if data is not None else None) for doc_id, data in writes]
+
+def save_expense_edits(updates, deleted, user):
+    """Enregistre les dépenses modifiées et supprimées depuis la grille (voir _save_edits)"""
     try:
-        expenses_ref = db.collection('expenses')
-        docs = expenses_ref.stream()
-        expenses = []
-        for doc in docs:
-            data = doc.to_dict()
-            data['doc_id'] = doc.id
-            expenses.append(data)
-        return expenses
-    except:
-        return []
+        return _save_edits('expenses', updates, deleted, user)
+    except Exception as e:
+        st.error(f"Erreur lors de l'enregistrement: {str(e)}")
+        return None
 
 # ===== GESTION DES REVENUS =====
 
 def add_revenue(source, amount, month, year, user):
-    """Ajoute un revenu à Firestore"""
-    db = get_db()
-    if not db:
-        return False
-    
+    """Ajoute un revenu (répliqué en arrière-plan), retourne le revenu créé avec son 'doc_id' (None en cas d'échec)"""
     try:
-        revenue_ref = db.collection('revenues').document()
-        revenue_ref.set({
+        doc_id = new_doc_id()
+        revenue = {
             'Source': source,
             'Montant': float(amount),
             'Mois': month,
             'Année': int(year),
             'Utilisateur': user,
             'Timestamp': time.time()
-        })
-        
-        # Notification
-        add_notification(
-            "Revenu ajouté", 
-            f"{user} a ajouté {amount:.0f}€ de {source} pour {month} {year}", 
-            user
-        )
-        return True
-    except:
-        return False
+        }
+        _write_local('revenues', [(doc_id, revenue)], (
+            "Revenu ajouté",
+            f"{user} a ajouté {amount:.0f}€ de {source} pour {month} {year}",
+            user, "budget"
+        ))
+        return {**revenue, 'doc_id': doc_id}
+    except DATA_ERRORS as e:
+        logger.warning("Ajout du revenu %s (%s %s) impossible: %s", source, month, year, e)
+        return None
 
 def update_revenue(doc_id, source, amount, month, year, user):
     """Met à jour un revenu"""
-    db = get_db()
-    if not db:
-        return False
-    
     try:
-        revenue_ref = db.collection('revenues').document(doc_id)
-        revenue_ref.update({
+        previous = get_local_store().get('revenues', doc_id) or {}
+        changes = {
             'Source': source,
             'Montant': float(amount),
             'Mois': month,
             'Année': int(year),
             'ModifiéPar': user,
-            'DateModification': time.time()
-        })
-        
-        # Notification
-        add_notification(
-            "Revenu modifié", 
-            f"{user} a modifié un revenu de {amount:.0f}€ de {source}", 
-            user
-        )
+            'DateModification': time.time(),
+            'Timestamp': time.time()
+        }
+        _write_local('revenues', [(doc_id, {**previous, **changes})], (
+            "Revenu modifié",
+            f"{user} a modifié un revenu de {amount:.0f}€ de {source}",
+            user, "budget"
+        ))
         return True
-    except:
+    except DATA_ERRORS as e:
+        logger.warning("Modification du revenu %s impossible: %s", doc_id, e)
         return False
 
 def delete_revenue(doc_id, user, source, amount):
     """Supprime un revenu"""
+    try:
+        _write_local('revenues', [(doc_id, None)], (
+            "Revenu supprimé",
+            f"{user} a supprimé un revenu de {amount:.0f}€ de {source}",
+            user, "budget"
+        ))
+        return True
+    except DATA_ERRORS as e:
+        logger.warning("Suppression du revenu %s impossible: %s", doc_id, e)
+        return False
+
+def save_revenue_edits(updates, deleted, user):
+    """Enregistre les revenus modifiés et supprimés depuis la grille (voir _save_edits)"""
+    try:
+        return _save_edits('revenues', updates, deleted, user)
+    except Exception as e:
+        st.error(f"Erreur lors de l'enregistrement: {str(e)}")
+        return None
+
+# ===== DÉPENSES RÉCURRENTES =====
+
+# Les règles changent rarement : elles sont gardées en mémoire par processus
+RULES_CACHE_SECONDS = 60
+
+_rules_cache = {}
+
+def get_recurring_expenses():
+    """Récupère les règles de dépenses récurrentes (voir recurrence.expand_rules)"""
+    cached = _rules_cache.get('rules')
+    if cached and time.time() - cached[0] < RULES_CACHE_SECONDS:
+        return cached[1]
+
+    db = get_db()
+    if not db:
+        return cached[1] if cached else []
+
+    try:
+        with get_data_access().track('get_recurring_expenses'):
+            docs = db.collection('recurring_expenses').stream(timeout=SYNC_TIMEOUT_SECONDS)
+            rules = [{**doc.to_dict(), 'doc_id': doc.id} for doc in docs]
+        _rules_cache['rules'] = (time.time(), rules)
+        return rules
+    except DATA_ERRORS as e:
+        logger.warning("Lecture des dépenses récurrentes impossible: %s", e)
+        return cached[1] if cached else []
+
+def _write_rule(rule_ref, data, title, message, user, delete=False):
+    """Écrit une règle et sa notification en un seul batch"""
     db = get_db()
     if not db:
         return False
-    
-    try:
-        db.collection('revenues').document(doc_id).delete()
-        
-        # Notification
-        add_notification(
-            "Revenu supprimé", 
-            f"{user} a supprimé un revenu de {amount:.0f}€ de {source}", 
-            user
-        )
+    try:
+        batch = db.batch()
+        if delete:
+            batch.delete(rule_ref)
+        else:
+            batch.set(rule_ref, data, merge=True)
+        batch.set(db.collection('notifications').document(),
+                  notification_data(title, message, user, "budget"))
+        batch.commit()
+        _rules_cache.clear()
+        invalidate_unread_count()
         return True
-    except:
+    except DATA_ERRORS as e:
+        logger.warning("Enregistrement de la règle récurrente %s impossible: %s", rule_ref.id, e)
         return False
 
-def fetch_revenues():
-    """Récupère tous les revenus avec leurs IDs"""
+def add_recurring_expense(category, amount, frequency, description, month, year, user):
+    """
+    Crée une règle de dépense récurrente ('Mensuel' ou 'Annuel')
+
+    Aucune dépense n'est écrite : les occurrences à partir de (month, year)
+    sont calculées à l'affichage.
+
+    Returns:
+        ID de la règle, ou False en cas d'échec
+    """
     db = get_db()
     if not db:
+        return False
+    rule_ref = db.collection('recurring_expenses').document()
+    rule = {
+        'Catégories': category,
+        'Montant': float(amount),
+        'Fréquence': frequency,
+        'Description': description,
+        'MoisDébut': month,
+        'AnnéeDébut': int(year),
+        'MoisFin': None,
+        'AnnéeFin': None,
+        'Utilisateur': user,
+        'Timestamp': time.time()
+    }
+    if _write_rule(rule_ref, rule, "Dépense récurrente ajoutée",
+                   f"{user} a ajouté {amount:.0f}€ ({frequency.lower()}) dans {category}", user):
+        return rule_ref.id
+    return False
+
+def end_recurring_expense(rule_id, month, year, user, category):
+    """Arrête une règle après le mois donné (les occurrences passées sont conservées)"""
+    db = get_db()
+    if not db:
+        return False
+    return _write_rule(db.collection('recurring_expenses').document(rule_id), {
+        'MoisFin': month,
+        'AnnéeFin': int(year),
+        'ModifiéPar': user,
+        'Timestamp': time.time()
+    }, "Dépense récurrente arrêtée", f"{user} a arrêté {category} après {month} {year}", user)
+
+def delete_recurring_expense(rule_id, user, category):
+    """Supprime une règle et toutes ses occurrences"""
+    db = get_db()
+    if not db:
+        return False
+    return _write_rule(db.collection('recurring_expenses').document(rule_id), None,
+                       "Dépense récurrente supprimée", f"{user} a supprimé la dépense récurrente {category}",
+                       user, delete=True)
+
+# ===== SAISIE EN MASSE =====
+
+def _write_in_batches(collection, records, notify):
+    """Enregistre des transactions par lots de OUTBOX_BATCH_SIZE
+
+    Chaque lot est répliqué en un seul batch Firestore contenant les
+    documents, les incréments des résumés annuels et une seule
+    notification récapitulative.
+
+    Args:
+        collection: 'expenses' ou 'revenues'
+        records: Itérable de documents complets
+        notify: Fonction (records du lot) -> (titre, message) de la notification
+
+    Returns:
+        Liste des documents enregistrés, avec leur 'doc_id'
+    """
+    written = []
+    records = iter(records)
+    while True:
+        chunk = [(new_doc_id(), record) for record in islice(records, OUTBOX_BATCH_SIZE)]
+        if not chunk:
+            break
+        title, message = notify([record for _, record in chunk])
+        _write_local(collection, chunk, (title, message, chunk[0][1]['Utilisateur'], "budget"))
+        written.extend({**record, 'doc_id': doc_id} for doc_id, record in chunk)
+    return written
+
+def add_expenses_bulk(rows, user):
+    """Ajoute plusieurs dépenses en batchs
+
+    Args:
+        rows: Itérable de dictionnaires avec les clés 'Catégories', 'Montant',
+            'Mois', 'Année' et optionnellement 'Fréquence', 'Description'
+            et 'ImportHash' (empreinte d'une ligne de relevé bancaire)
+        user: Utilisateur qui effectue la saisie
+
+    Returns:
+        Liste des dépenses créées, avec leur 'doc_id'
+    """
+    records = ({
+        'Catégories': row['Catégories'],
+        'Montant': float(row['Montant']),
+        'Fréquence': row.get('Fréquence') or 'Unique',
+        'Description': row.get('Description') or '',
+        'Mois': row['Mois'],
+        'Année': int(row['Année']),
+        'Utilisateur': user,
+        'Timestamp': time.time(),
+        **({'ImportHash': row['ImportHash']} if row.get('ImportHash') else {})
+    } for row in rows)
+
+    def notify(batch_records):
+        total = sum(r['Montant'] for r in batch_records)
+        return ("Dépenses ajoutées",
+                f"{user} a ajouté {len(batch_records)} dépenses pour un total de {total:.0f}€")
+
+    try:
+        return _write_in_batches('expenses', records, notify)
+    except Exception as e:
+        st.error(f"Erreur lors de l'ajout: {str(e)}")
         return []
-    
+
+def add_revenues_bulk(rows, user):
+    """Ajoute plusieurs revenus en batchs
+
+    Args:
+        rows: Itérable de dictionnaires avec les clés 'Source', 'Montant', 'Mois' et 'Année'
+        user: Utilisateur qui effectue la saisie
+
+    Returns:
+        Liste des revenus créés, avec leur 'doc_id'
+    """
+    records = ({
+        'Source': row['Source'],
+        'Montant': float(row['Montant']),
+        'Mois': row['Mois'],
+        'Année': int(row['Année']),
+        'Utilisateur': user,
+        'Timestamp': time.time()
+    } for row in rows)
+
+    def notify(batch_records):
+        total = sum(r['Montant'] for r in batch_records)
+        return ("Revenus ajoutés",
+                f"{user} a ajouté {len(batch_records)} revenus pour un total de {total:.0f}€")
+
     try:
-        revenues_ref = db.collection('revenues')
-        docs = revenues_ref.stream()
-        revenues = []
-        for doc in docs:
-            data = doc.to_dict()
-            data['doc_id'] = doc.id
-            revenues.append(data)
-        return revenues
-    except:
+        return _write_in_batches('revenues', records, notify)
+    except Exception as e:
+        st.error(f"Erreur lors de l'ajout: {str(e)}")
         return []
+
+def sync_statement_years(start=None, end=None):
+    """
+    Synchronise les dépenses des années d'un relevé bancaire avant son import
+
+    Seuls les changements sont relus ; les doublons sont ensuite recherchés
+    dans la base locale par find_imported_hashes.
+
+    Args:
+        start, end: Dates extrêmes du relevé ; rien à synchroniser si None
+    """
+    if start is None or end is None:
+        return
+    for year in range(start.year, end.year + 1):
+        _sync_collection('expenses', year=year)
+
+def find_imported_hashes(hashes):
+    """
+    Retourne les empreintes de relevé déjà importées parmi celles données
+
+    La recherche passe par un index de la base locale (imports pas encore
+    répliqués compris) : le coût ne dépend pas du nombre de dépenses importées.
+    """
+    return get_local_store().known_import_hashes('expenses', hashes)
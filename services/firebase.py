@@ -1,10 +1,27 @@
 import streamlit as st
 import firebase_admin
 from firebase_admin import credentials, firestore
+import logging
+import sys
+import threading
 import time
+from pathlib import Path
+from datetime import datetime, timedelta, timezone
+from firestore_client import DATA_ERRORS, get_backend_name, get_data_access
+from instrumentation import get_call_recorder
+from image_store import DEFAULT_SIZE, get_image_data_uri, store_image
+from user_context import invalidate_user_context, load_user_context, load_user_profiles
+from parametres_service import get_notification_policy
+
+logger = logging.getLogger(__name__)
 
 def init_firebase():
-    """Initialise Firebase si ce n'est pas déjà fait"""
+    """Initialise Firebase si ce n'est pas déjà fait (appelé au début de chaque rerun de page)"""
+    # Les appels Firestore suivants sont comptés pour ce rerun de la page appelante
+    get_call_recorder().start_rerun(page=Path(sys._getframe(1).f_code.co_filename).stem)
+    # L'émulateur et le backend mémoire n'utilisent pas d'identifiants
+    if get_backend_name() != 'firestore':
+        return True
     if not firebase_admin._apps:
         try:
             firebase_secrets = st.secrets["firebase"]
@@ -29,22 +46,15 @@ def init_firebase():
     return True
 
 def get_db():
-    """Retourne l'instance Firestore"""
-    try:
-        return firestore.client()
-    except:
-        return None
+    """Retourne l'instance Firestore partagée"""
+    return get_data_access().get_client()
 
 def get_user_profile(user):
     """Récupère le profil complet d'un utilisateur"""
-    db = get_db()
-    if not db:
+    context = load_user_context(user)
+    if not context:
         return None
-    profile_ref = db.collection('user_profiles').document(user)
-    doc = profile_ref.get()
-    if doc.exists:
-        return doc.to_dict()
-    return None
+    return context['profile']
 
 def save_user_profile(user, data):
     """Sauvegarde le profil utilisateur"""
@@ -54,17 +64,46 @@ def save_user_profile(user, data):
     profile_ref = db.collection('user_profiles').document(user)
     data['last_update'] = time.time()
     profile_ref.set(data, merge=True)
+    invalidate_user_context(user)
 
-def load_profile_image(user):
-    """Charge l'image de profil d'un utilisateur"""
-    profile = get_user_profile(user)
+def _profile_image(profile, size):
     if profile:
+        if profile.get('profile_image_hash'):
+            return get_image_data_uri(profile['profile_image_hash'], size)
+        # Anciens profils : image base64 stockée dans le document
         return profile.get('profile_image')
     return None
 
-def save_profile_image(user, image_data):
-    """Sauvegarde l'image de profil"""
-    save_user_profile(user, {'profile_image': image_data})
+def load_profile_image(user, size=DEFAULT_SIZE):
+    """Charge l'image de profil d'un utilisateur (data URI de la miniature la plus proche)"""
+    return _profile_image(get_user_profile(user), size)
+
+def load_profile_images(users, size=DEFAULT_SIZE):
+    """Charge les images de profil de plusieurs utilisateurs (profils lus en une requête groupée)"""
+    profiles = load_user_profiles(users)
+    return {user: _profile_image(profiles.get(user), size) for user in users}
+
+def save_profile_image(user, image_bytes):
+    """Sauvegarde l'image de profil (octets bruts du fichier envoyé)"""
+    image_hash = store_image(image_bytes)
+    if image_hash:
+        save_user_profile(user, {
+            'profile_image_hash': image_hash,
+            'profile_image': firestore.DELETE_FIELD
+        })
+
+def notification_data(title, message, user, module="general"):
+    """Construit le document d'une notification, avec sa date d'expiration (TTL)"""
+    ttl_days = get_notification_policy()['ttl_days']
+    return {
+        'title': title,
+        'message': message,
+        'user': user,
+        'module': module,
+        'timestamp': time.time(),
+        'read': False,
+        'expire_at': datetime.now(timezone.utc) + timedelta(days=ttl_days)
+    }
 
 def add_notification(title, message, user, module="general"):
     """Ajoute une notification"""
@@ -72,14 +111,8 @@ def add_notification(title, message, user, module="general"):
     if not db:
         return
     notif_ref = db.collection('notifications').document()
-    notif_ref.set({
-        'title': title,
-        'message': message,
-        'user': user,
-        'module': module,
-        'timestamp': time.time(),
-        'read': False
-    })
+    notif_ref.set(notification_data(title, message, user, module))
+    invalidate_unread_count()
 
 def get_notifications(limit=50):
     """Récupère les notifications récentes"""
@@ -95,127 +128,262 @@ def get_notifications(limit=50):
             data['doc_id'] = doc.id
             notifications.append(data)
         return notifications
-    except:
+    except DATA_ERRORS as e:
+        logger.warning("Lecture des notifications impossible: %s", e)
         return []
 
-def mark_notification_as_read(doc_id):
-    """Marque une notification comme lue"""
+def get_notifications_page(modules=None, page_size=5, start_after=None):
+    """
+    Récupère une page de notifications, les plus récentes d'abord
+    
+    Args:
+        modules: Modules à inclure (filtre appliqué par Firestore), tous si None
+        page_size: Nombre de notifications par page
+        start_after: Curseur retourné par l'appel précédent
+    
+    Returns:
+        Tuple (notifications, curseur de la page suivante ou None)
+    """
     db = get_db()
     if not db:
+        return [], None
+    try:
+        query = db.collection('notifications')
+        if modules:
+            query = query.where('module', 'in', list(modules))
+        query = query.order_by('timestamp', direction=firestore.Query.DESCENDING)
+        if start_after is not None:
+            query = query.start_after(start_after)
+        # Un document de plus pour savoir s'il existe une page suivante
+        with get_data_access().track('get_notifications_page'):
+            docs = list(query.limit(page_size + 1).stream())
+        notifications = []
+        for doc in docs[:page_size]:
+            data = doc.to_dict()
+            data['doc_id'] = doc.id
+            notifications.append(data)
+        next_cursor = docs[page_size - 1] if len(docs) > page_size else None
+        return notifications, next_cursor
+    except DATA_ERRORS as e:
+        logger.warning("Lecture d'une page de notifications impossible: %s", e)
+        return [], None
+
+def mark_all_read(doc_ids):
+    """Marque plusieurs notifications comme lues en un seul batch"""
+    doc_ids = list(doc_ids)
+    db = get_db()
+    if not db or not doc_ids:
         return
     try:
-        db.collection('notifications').document(doc_id).update({'read': True})
-    except:
-        pass
+        # Un batch Firestore est limité à 500 opérations
+        for start in range(0, len(doc_ids), 500):
+            batch = db.batch()
+            for doc_id in doc_ids[start:start + 500]:
+                batch.update(db.collection('notifications').document(doc_id), {'read': True})
+            batch.commit()
+        invalidate_unread_count()
+    except DATA_ERRORS as e:
+        logger.warning("Marquage des notifications comme lues impossible: %s", e)
 
-def get_unread_notifications_count():
-    """Compte les notifications non lues"""
+def compact_notifications(policy=None):
+    """
+    Résume les notifications lues anciennes en documents quotidiens
+    
+    Les notifications lues depuis plus de 'compact_after_days' jours sont
+    supprimées et comptabilisées dans 'notification_digests/<AAAA-MM-JJ>'.
+    
+    Returns:
+        Nombre de notifications compactées
+    """
     db = get_db()
     if not db:
         return 0
+    policy = policy or get_notification_policy()
+    cutoff = time.time() - policy['compact_after_days'] * 86400
+    expire_at = datetime.now(timezone.utc) + timedelta(days=policy['ttl_days'])
+    compacted = 0
     try:
-        notifs_ref = db.collection('notifications').where('read', '==', False)
-        docs = list(notifs_ref.stream())
-        return len(docs)
-    except:
-        return 0
+        query = (db.collection('notifications')
+                 .where('read', '==', True)
+                 .where('timestamp', '<', cutoff)
+                 .limit(400))
+        while True:
+            with get_data_access().track('compact_notifications'):
+                docs = list(query.stream())
+            if not docs:
+                break
+            digests = {}
+            batch = db.batch()
+            for doc in docs:
+                data = doc.to_dict()
+                day = datetime.fromtimestamp(data.get('timestamp', 0)).strftime('%Y-%m-%d')
+                modules = digests.setdefault(day, {})
+                module = data.get('module', 'general')
+                modules[module] = modules.get(module, 0) + 1
+                batch.delete(doc.reference)
+            for day, modules in digests.items():
+                batch.set(db.collection('notification_digests').document(day), {
+                    'date': day,
+                    'count': firestore.Increment(sum(modules.values())),
+                    'modules': {m: firestore.Increment(n) for m, n in modules.items()},
+                    'expire_at': expire_at
+                }, merge=True)
+            batch.commit()
+            compacted += len(docs)
+        return compacted
+    except DATA_ERRORS as e:
+        logger.warning("Compactage des notifications impossible: %s", e)
+        return compacted
 
-def save_user_preferences(user, preferences):
-    """Sauvegarde les préférences utilisateur"""
+BACKFILL_BATCH_SIZE = 400
+
+def backfill_notification_expiry(policy=None):
+    """
+    Ajoute 'expire_at' aux notifications écrites avant la mise en place du TTL
+
+    Les notifications sont parcourues par pages, en projection sur deux champs ;
+    l'échéance est calculée depuis leur date. Le drapeau 'expiry_backfilled'
+    de config/notifications évite ensuite de recommencer.
+
+    Returns:
+        Nombre de notifications complétées
+    """
     db = get_db()
     if not db:
-        return
-    pref_ref = db.collection('user_preferences').document(user)
-    preferences['last_update'] = time.time()
-    pref_ref.set(preferences, merge=True)
+        return 0
+    policy = policy or get_notification_policy()
+    if policy.get('expiry_backfilled'):
+        return 0
+    ttl = timedelta(days=policy['ttl_days'])
+    query = (db.collection('notifications')
+             .order_by('timestamp')
+             .select(['timestamp', 'expire_at'])
+             .limit(BACKFILL_BATCH_SIZE))
+    updated = 0
+    last = None
+    while True:
+        with get_data_access().track('backfill_notification_expiry'):
+            docs = list((query.start_after(last) if last is not None else query).stream())
+        batch = db.batch()
+        missing = 0
+        for doc in docs:
+            data = doc.to_dict()
+            if 'expire_at' not in data:
+                created = datetime.fromtimestamp(data.get('timestamp') or time.time(), timezone.utc)
+                batch.update(doc.reference, {'expire_at': created + ttl})
+                missing += 1
+        if missing:
+            batch.commit()
+            updated += missing
+        if len(docs) < BACKFILL_BATCH_SIZE:
+            break
+        last = docs[-1]
+    db.collection('config').document('notifications').set({'expiry_backfilled': True}, merge=True)
+    invalidate_user_context()
+    return updated
 
-def load_user_preferences(user):
-    """Charge les préférences utilisateur"""
+# Maintenance (échéances manquantes, compactage) au plus une fois par jour et par
+# processus, dans un thread : les pages ne l'attendent jamais
+COMPACTION_INTERVAL_SECONDS = 86400
+_maintenance_lock = threading.Lock()
+_maintenance_thread = None
+
+def _maintenance_loop():
+    while True:
+        try:
+            backfill_notification_expiry()
+            compact_notifications()
+        except Exception as e:
+            logger.warning("Maintenance des notifications interrompue: %s", e)
+        time.sleep(COMPACTION_INTERVAL_SECONDS)
+
+def start_notification_maintenance():
+    """Démarre (une fois par processus) le thread de maintenance des notifications"""
+    global _maintenance_thread
+    with _maintenance_lock:
+        if _maintenance_thread is None or not _maintenance_thread.is_alive():
+            _maintenance_thread = threading.Thread(target=_maintenance_loop,
+                                                   name='famileasy-notifications', daemon=True)
+            _maintenance_thread.start()
+
+def mark_notification_as_read(doc_id):
+    """Marque une notification comme lue"""
     db = get_db()
     if not db:
-        return None
-    pref_ref = db.collection('user_preferences').document(user)
-    doc = pref_ref.get()
-    if doc.exists:
-        return doc.to_dict()
-    return None
-
-def get_user_profile(user):
-    """Récupère le profil complet d'un utilisateur"""
-    db = firestore.client()
-    profile_ref = db.collection('user_profiles').document(user)
-    doc = profile_ref.get()
-    if doc.exists:
-        return doc.to_dict()
-    return None
+        return
+    try:
+        db.collection('notifications').document(doc_id).update({'read': True})
+        invalidate_unread_count()
+    except DATA_ERRORS as e:
+        logger.warning("Marquage de la notification %s impossible: %s", doc_id, e)
 
-def save_user_profile(user, data):
-    """Sauvegarde le profil utilisateur"""
-    db = firestore.client()
-    profile_ref = db.collection('user_profiles').document(user)
-    data['last_update'] = time.time()
-    profile_ref.set(data, merge=True)
+# Durée pendant laquelle le compteur reste en cache dans la session
+UNREAD_COUNT_CACHE_SECONDS = 15
+# Au-delà, le badge affiche « 99+ » : les comptages s'arrêtent à la valeur suivante
+UNREAD_BADGE_LIMIT = 99
 
-def load_profile_image(user):
-    """Charge l'image de profil d'un utilisateur"""
-    profile = get_user_profile(user)
-    if profile:
-        return profile.get('profile_image')
-    return None
+def unread_notifications_query(db):
+    """Requête des notifications non lues du foyer (comptage et listener temps réel)"""
+    return db.collection('notifications').where('read', '==', False)
 
-def save_profile_image(user, image_data):
-    """Sauvegarde l'image de profil"""
-    save_user_profile(user, {'profile_image': image_data})
+def unread_badge(count):
+    """Libellé du compteur de non lues (« 99+ » au-delà de UNREAD_BADGE_LIMIT)"""
+    return f"{UNREAD_BADGE_LIMIT}+" if count > UNREAD_BADGE_LIMIT else str(count)
 
-def add_notification(title, message, user, module="general"):
-    """Ajoute une notification"""
-    db = firestore.client()
-    notif_ref = db.collection('notifications').document()
-    notif_ref.set({
-        'title': title,
-        'message': message,
-        'user': user,
-        'module': module,
-        'timestamp': time.time(),
-        'read': False
-    })
+def count_unread_notifications():
+    """
+    Compte les notifications non lues du foyer par une requête d'agrégation
+    (sans lire les documents), au plus UNREAD_BADGE_LIMIT + 1
+    """
+    db = get_db()
+    if not db:
+        return 0
+    try:
+        query = unread_notifications_query(db).limit(UNREAD_BADGE_LIMIT + 1)
+        with get_data_access().track('count_unread_notifications'):
+            result = query.count(alias='unread').get()
+        return int(result[0][0].value)
+    except DATA_ERRORS as e:
+        logger.warning("Comptage des notifications non lues impossible: %s", e)
+        return 0
 
-def get_notifications(limit=50):
-    """Récupère les notifications récentes"""
-    db = firestore.client()
-    notifs_ref = db.collection('notifications').order_by('timestamp', direction=firestore.Query.DESCENDING).limit(limit)
-    docs = notifs_ref.stream()
-    notifications = []
-    for doc in docs:
-        data = doc.to_dict()
-        data['doc_id'] = doc.id
-        notifications.append(data)
-    return notifications
+def cached_unread_count():
+    """Compteur de notifications non lues de la session s'il est encore frais, sinon None"""
+    cached = st.session_state.get('unread_notifications_count')
+    if cached and time.time() - cached[0] < UNREAD_COUNT_CACHE_SECONDS:
+        return cached[1]
+    return None
 
-def mark_notification_as_read(doc_id):
-    """Marque une notification comme lue"""
-    db = firestore.client()
-    db.collection('notifications').document(doc_id).update({'read': True})
+def remember_unread_count(count):
+    """Mémorise dans la session un compteur lu hors du script (chargement parallèle)"""
+    st.session_state['unread_notifications_count'] = (time.time(), count)
 
 def get_unread_notifications_count():
-    """Compte les notifications non lues"""
-    db = firestore.client()
-    notifs_ref = db.collection('notifications').where('read', '==', False)
-    docs = list(notifs_ref.stream())
-    return len(docs)
+    """Compte les notifications non lues (mis en cache brièvement dans la session)"""
+    cached = cached_unread_count()
+    if cached is not None:
+        return cached
+    count = count_unread_notifications()
+    remember_unread_count(count)
+    return count
+
+def invalidate_unread_count():
+    """Force le recalcul du compteur de notifications non lues de la session"""
+    st.session_state.pop('unread_notifications_count', None)
 
 def save_user_preferences(user, preferences):
     """Sauvegarde les préférences utilisateur"""
-    db = firestore.client()
+    db = get_db()
+    if not db:
+        return
     pref_ref = db.collection('user_preferences').document(user)
     preferences['last_update'] = time.time()
     pref_ref.set(preferences, merge=True)
+    invalidate_user_context(user)
 
 def load_user_preferences(user):
     """Charge les préférences utilisateur"""
-    db = firestore.client()
-    pref_ref = db.collection('user_preferences').document(user)
-    doc = pref_ref.get()
-    if doc.exists:
-        return doc.to_dict()
-    return None
+    context = load_user_context(user)
+    if not context:
+        return None
+    return context['preferences']
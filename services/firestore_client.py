@@ -0,0 +1,161 @@
+"""
+Accès partagé à Firestore pour Famileasy
+Un seul client par processus, réutilisé par toutes les sessions Streamlit
+
+Le backend est choisi par la variable d'environnement FAMILEASY_BACKEND :
+- 'firestore' (défaut) : Firestore de production, identifiants de st.secrets["firebase"]
+- 'emulator' : émulateur Firestore local (FIRESTORE_EMULATOR_HOST, sans identifiants)
+- 'memory' : stockage en mémoire du processus (tests, benchmarks, démonstration)
+"""
+import logging
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+import streamlit as st
+import firebase_admin
+from firebase_admin import firestore
+from google.api_core.exceptions import GoogleAPIError
+
+from instrumentation import instrument
+
+logger = logging.getLogger(__name__)
+
+BACKENDS = ('firestore', 'emulator', 'memory')
+DEFAULT_EMULATOR_HOST = 'localhost:8080'
+DEFAULT_EMULATOR_PROJECT = 'famileasy-dev'
+
+# Erreurs attendues lors d'un accès aux données : Firestore (réseau, quota, index
+# manquant), base locale SQLite et documents mal formés. Les services les
+# journalisent et servent une valeur par défaut ; les autres erreurs remontent.
+DATA_ERRORS = (GoogleAPIError, OSError, sqlite3.Error, KeyError, TypeError, ValueError)
+
+def get_backend_name():
+    """Retourne le backend configuré ('firestore', 'emulator' ou 'memory')"""
+    backend = os.environ.get('FAMILEASY_BACKEND', 'firestore').strip().lower()
+    if backend not in BACKENDS:
+        logger.warning("Backend inconnu '%s', utilisation de Firestore", backend)
+        return 'firestore'
+    return backend
+
+def _create_client(backend):
+    """Crée le client du backend demandé"""
+    if backend == 'memory':
+        from memory_backend import MemoryClient
+        return MemoryClient()
+    if backend == 'emulator':
+        from google.auth.credentials import AnonymousCredentials
+        from google.cloud import firestore as gcloud_firestore
+        os.environ.setdefault('FIRESTORE_EMULATOR_HOST', DEFAULT_EMULATOR_HOST)
+        project = os.environ.get('FIRESTORE_PROJECT_ID', DEFAULT_EMULATOR_PROJECT)
+        return gcloud_firestore.Client(project=project, credentials=AnonymousCredentials())
+    # Firebase doit avoir été initialisé par init_firebase()
+    if not firebase_admin._apps:
+        return None
+    return firestore.client()
+
+class DataAccess:
+    """
+    Client Firestore unique du processus et compteurs de santé
+
+    Le client gRPC est thread-safe et multiplexe les appels de toutes les
+    sessions sur le même canal : il est créé une seule fois, à la demande.
+    """
+
+    def __init__(self, backend=None):
+        self.backend = backend or get_backend_name()
+        self._client = None
+        self._lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self.stats = {
+            'calls': 0,
+            'errors': 0,
+            'total_latency': 0.0,
+            'max_latency': 0.0,
+            'last_latency': None,
+            'last_error': None,
+            'client_created_at': None
+        }
+
+    def get_client(self):
+        """Retourne le client Firestore instrumenté, créé au premier appel"""
+        if self._client is not None:
+            return self._client
+
+        with self._lock:
+            if self._client is None:
+                try:
+                    client = _create_client(self.backend)
+                except Exception as e:
+                    logger.warning("Création du client Firestore impossible: %s", e)
+                    self.stats['last_error'] = str(e)
+                    return None
+                if client is None:
+                    return None
+                self._client = instrument(client)
+                self.stats['client_created_at'] = time.time()
+        return self._client
+
+    def set_client(self, client, backend=None):
+        """Remplace le client (ex : MemoryClient pré-rempli pour un test ou un benchmark)"""
+        with self._lock:
+            self._client = instrument(client)
+            if backend is not None:
+                self.backend = backend
+            self.stats['client_created_at'] = time.time() if client is not None else None
+
+    def record(self, latency, error=None):
+        """Enregistre la latence (en secondes) d'un appel Firestore"""
+        with self._stats_lock:
+            self.stats['calls'] += 1
+            self.stats['total_latency'] += latency
+            self.stats['max_latency'] = max(self.stats['max_latency'], latency)
+            self.stats['last_latency'] = latency
+            if error is not None:
+                self.stats['errors'] += 1
+                self.stats['last_error'] = str(error)
+
+    @contextmanager
+    def track(self, operation):
+        """Mesure la durée d'un bloc d'appels Firestore"""
+        started = time.perf_counter()
+        try:
+            yield
+        except Exception as e:
+            self.record(time.perf_counter() - started, error=e)
+            logger.warning("Erreur Firestore (%s): %s", operation, e)
+            raise
+        self.record(time.perf_counter() - started)
+
+    def ping(self):
+        """Vérifie la connexion par une lecture légère, retourne la latence ou None"""
+        db = self.get_client()
+        if db is None:
+            return None
+        try:
+            with self.track('ping'):
+                started = time.perf_counter()
+                db.collection('config').document('users').get()
+                return time.perf_counter() - started
+        except Exception:
+            return None
+
+    def health(self):
+        """Retourne un résumé de l'état du client et des latences observées"""
+        with self._stats_lock:
+            stats = dict(self.stats)
+        stats['connected'] = self._client is not None
+        stats['backend'] = self.backend
+        stats['avg_latency'] = stats['total_latency'] / stats['calls'] if stats['calls'] else None
+        return stats
+
+@st.cache_resource
+def get_data_access():
+    """Retourne la couche d'accès partagée par toutes les sessions du processus"""
+    return DataAccess()
+
+def get_db():
+    """Retourne l'instance Firestore partagée (None si indisponible)"""
+    return get_data_access().get_client()
@@ -0,0 +1,154 @@
+"""
+Stockage des images de profil pour Famileasy
+Les images sont redimensionnées en miniatures de tailles fixes et stockées
+par empreinte de contenu ; un cache disque LRU évite de les retélécharger.
+"""
+import base64
+import hashlib
+import io
+import logging
+import os
+import threading
+from pathlib import Path
+
+from firestore_client import get_db
+
+logger = logging.getLogger(__name__)
+
+# Côté (en pixels) des miniatures carrées générées à l'upload
+THUMBNAIL_SIZES = (64, 160, 320)
+DEFAULT_SIZE = 160
+JPEG_QUALITY = 85
+
+CACHE_DIR = Path(__file__).parent.parent / ".cache" / "images"
+MAX_CACHE_BYTES = 50 * 1024 * 1024
+
+_cache_lock = threading.Lock()
+
+def _blob_id(image_hash, size):
+    return f"{image_hash}_{size}"
+
+def _closest_size(size):
+    """Retourne la plus petite miniature au moins aussi grande que demandé"""
+    for candidate in THUMBNAIL_SIZES:
+        if candidate >= size:
+            return candidate
+    return THUMBNAIL_SIZES[-1]
+
+def make_thumbnails(image_bytes):
+    """
+    Recadre l'image en carré et génère une miniature JPEG par taille
+
+    Returns:
+        Dictionnaire {taille: octets JPEG}
+    """
+    from PIL import Image, ImageOps
+
+    with Image.open(io.BytesIO(image_bytes)) as image:
+        image = ImageOps.exif_transpose(image).convert('RGB')
+        side = min(image.size)
+        left = (image.width - side) // 2
+        top = (image.height - side) // 2
+        square = image.crop((left, top, left + side, top + side))
+
+        thumbnails = {}
+        for size in THUMBNAIL_SIZES:
+            thumbnail = square.resize((min(size, side), min(size, side)), Image.LANCZOS)
+            buffer = io.BytesIO()
+            thumbnail.save(buffer, format='JPEG', quality=JPEG_QUALITY, optimize=True)
+            thumbnails[size] = buffer.getvalue()
+        return thumbnails
+
+# ===== CACHE DISQUE =====
+
+def _cache_path(image_hash, size):
+    return CACHE_DIR / f"{_blob_id(image_hash, size)}.jpg"
+
+def _read_cache(image_hash, size):
+    path = _cache_path(image_hash, size)
+    try:
+        data = path.read_bytes()
+        os.utime(path)  # Marque l'entrée comme récemment utilisée
+        return data
+    except OSError:
+        return None
+
+def _write_cache(image_hash, size, data):
+    with _cache_lock:
+        try:
+            CACHE_DIR.mkdir(parents=True, exist_ok=True)
+            _cache_path(image_hash, size).write_bytes(data)
+            _evict()
+        except OSError as e:
+            logger.warning("Écriture du cache d'images impossible: %s", e)
+
+def _evict():
+    """Supprime les entrées les moins récemment utilisées au-delà de MAX_CACHE_BYTES"""
+    entries = [(entry.stat().st_mtime, entry.stat().st_size, entry)
+               for entry in CACHE_DIR.glob('*.jpg')]
+    total = sum(size for _, size, _ in entries)
+    for _, size, entry in sorted(entries, key=lambda e: e[0]):
+        if total <= MAX_CACHE_BYTES:
+            break
+        entry.unlink(missing_ok=True)
+        total -= size
+
+# ===== STOCKAGE =====
+
+def store_image(image_bytes):
+    """
+    Enregistre une image et ses miniatures
+
+    Les miniatures sont stockées dans 'image_blobs/<empreinte>_<taille>'.
+    Une image déjà connue n'est pas réécrite.
+
+    Returns:
+        Empreinte SHA-256 du contenu original, ou None en cas d'échec
+    """
+    db = get_db()
+    if not db:
+        return None
+
+    image_hash = hashlib.sha256(image_bytes).hexdigest()
+    thumbnails = make_thumbnails(image_bytes)
+    blobs = db.collection('image_blobs')
+    if not blobs.document(_blob_id(image_hash, THUMBNAIL_SIZES[0])).get().exists:
+        batch = db.batch()
+        for size, data in thumbnails.items():
+            batch.set(blobs.document(_blob_id(image_hash, size)), {
+                'data': data,
+                'mime': 'image/jpeg',
+                'size': size
+            })
+        batch.commit()
+    for size, data in thumbnails.items():
+        _write_cache(image_hash, size, data)
+    return image_hash
+
+def get_image_bytes(image_hash, size=DEFAULT_SIZE):
+    """Retourne les octets JPEG d'une miniature, depuis le cache disque si possible"""
+    size = _closest_size(size)
+    data = _read_cache(image_hash, size)
+    if data is not None:
+        return data
+
+    db = get_db()
+    if not db:
+        return None
+    try:
+        doc = db.collection('image_blobs').document(_blob_id(image_hash, size)).get()
+        if not doc.exists:
+            return None
+        data = doc.to_dict().get('data')
+        _write_cache(image_hash, size, data)
+        return data
+    except Exception as e:
+        logger.warning("Lecture de l'image %s impossible: %s", image_hash, e)
+        return None
+
+def get_image_data_uri(image_hash, size=DEFAULT_SIZE):
+    """Retourne une miniature sous forme de data URI pour l'affichage HTML"""
+    data = get_image_bytes(image_hash, size)
+    if data is None:
+        return None
+    return f"data:image/jpeg;base64,{base64.b64encode(data).decode()}"
@@ -0,0 +1,317 @@
+"""
+Import de relevés bancaires (CSV / OFX) pour le module Budget
+Les fichiers sont lus ligne par ligne : la mémoire reste constante
+quelle que soit la taille de l'export.
+"""
+import csv
+import hashlib
+import re
+import unicodedata
+from datetime import date
+from itertools import islice
+
+MOIS = ['Janvier', 'Février', 'Mars', 'Avril', 'Mai', 'Juin',
+        'Juillet', 'Août', 'Septembre', 'Octobre', 'Novembre', 'Décembre']
+
+# Règles par défaut : mot-clé du libellé => catégorie de dépense
+DEFAULT_IMPORT_RULES = [
+    ('LOYER', 'Loyer'),
+    ('ENGIE', 'Engie (chauffage + élec)'),
+    ('VEOLIA', 'Veolia (eau)'),
+    ('TOTAL', 'Essence'),
+    ('ESSO', 'Essence'),
+    ('CARBURANT', 'Essence'),
+    ('CARREFOUR', 'Courses'),
+    ('LECLERC', 'Courses'),
+    ('AUCHAN', 'Courses'),
+    ('LIDL', 'Courses'),
+    ('INTERMARCHE', 'Courses'),
+    ('FREE MOBILE', 'Forfait Mobile'),
+    ('FREEBOX', 'Forfait Internet'),
+]
+
+DEFAULT_CATEGORY = 'Autre'
+
+# En-têtes reconnus dans les exports CSV des banques
+DATE_HEADERS = ('date', 'date operation', 'date de operation', 'date comptable', 'dateop')
+LABEL_HEADERS = ('libelle', 'label', 'description', 'libelle operation', 'intitule')
+AMOUNT_HEADERS = ('montant', 'amount', 'montant eur')
+DEBIT_HEADERS = ('debit', 'debit eur')
+CREDIT_HEADERS = ('credit', 'credit eur')
+
+def normalize_text(text):
+    """Met un texte en majuscules sans accents pour la comparaison"""
+    text = text or ''
+    if not text.isascii():
+        text = unicodedata.normalize('NFKD', text)
+        text = ''.join(c for c in text if not unicodedata.combining(c))
+    return text.upper().strip()
+
+def _normalize_header(header):
+    return re.sub(r'[^a-z ]', ' ', normalize_text(header).lower()).strip()
+
+def parse_amount(value):
+    """Convertit un montant au format français ou anglais ('1 234,56', '-12.50')"""
+    value = (value or '').strip().replace('\xa0', '').replace(' ', '').replace('€', '')
+    if not value:
+        return None
+    if ',' in value and '.' in value:
+        # Le dernier séparateur est le séparateur décimal
+        if value.rfind(',') > value.rfind('.'):
+            value = value.replace('.', '').replace(',', '.')
+        else:
+            value = value.replace(',', '')
+    else:
+        value = value.replace(',', '.')
+    try:
+        return float(value)
+    except ValueError:
+        return None
+
+_DATE_FORMATS = [
+    (re.compile(r'(\d{2})/(\d{2})/(\d{4})'), (3, 2, 1)),
+    (re.compile(r'(\d{4})-(\d{2})-(\d{2})'), (1, 2, 3)),
+    (re.compile(r'(\d{2})/(\d{2})/(\d{2})$'), (3, 2, 1)),
+    (re.compile(r'(\d{4})(\d{2})(\d{2})'), (1, 2, 3)),
+]
+
+def parse_date(value):
+    """Convertit une date 'JJ/MM/AAAA', 'AAAA-MM-JJ', 'JJ/MM/AA' ou OFX 'AAAAMMJJ...'"""
+    value = (value or '').strip()
+    for pattern, (y, m, d) in _DATE_FORMATS:
+        match = pattern.match(value)
+        if match:
+            year = int(match.group(y))
+            if year < 100:
+                year += 2000
+            try:
+                return date(year, int(match.group(m)), int(match.group(d)))
+            except ValueError:
+                return None
+    return None
+
+def transaction_hash(day, amount, label, normalized=False, occurrence=0, fitid=None):
+    """
+    Empreinte d'une transaction, utilisée pour détecter les doublons
+
+    Args:
+        occurrence: Rang de la transaction parmi celles de même date, montant et
+            libellé du relevé : deux achats identiques le même jour restent
+            distincts, et une réimportation du relevé reste dédoublonnée.
+            La première occurrence garde l'empreinte des imports antérieurs.
+        fitid: Identifiant de transaction OFX (FITID), utilisé s'il est présent
+    """
+    if not normalized:
+        label = normalize_text(label)
+    key = f"{day.isoformat()}|{amount:.2f}|{label}"
+    if fitid:
+        key += f"|FITID:{fitid}"
+    elif occurrence:
+        key += f"|{occurrence}"
+    return hashlib.sha1(key.encode('utf-8')).hexdigest()
+
+# ===== LECTURE DES FICHIERS =====
+
+def iter_csv_transactions(lines, delimiter=None):
+    """
+    Lit un export CSV ligne par ligne
+
+    Args:
+        lines: Itérable de lignes de texte (fichier ouvert en mode texte)
+        delimiter: Séparateur, détecté sur l'en-tête si None
+
+    Yields:
+        Dictionnaires {'date', 'label', 'amount'} (amount négatif pour un débit)
+    """
+    lines = iter(lines)
+    header_line = next(lines, None)
+    if header_line is None:
+        return
+    if delimiter is None:
+        delimiter = max((';', ',', '\t'), key=header_line.count)
+    header = [_normalize_header(h) for h in next(csv.reader([header_line], delimiter=delimiter))]
+
+    def find(candidates):
+        for index, name in enumerate(header):
+            if name in candidates:
+                return index
+        return None
+
+    date_col = find(DATE_HEADERS)
+    label_col = find(LABEL_HEADERS)
+    amount_col = find(AMOUNT_HEADERS)
+    debit_col = find(DEBIT_HEADERS)
+    credit_col = find(CREDIT_HEADERS)
+    if date_col is None or label_col is None or (amount_col is None and debit_col is None):
+        raise ValueError("En-tête CSV non reconnu (colonnes date, libellé et montant attendues)")
+
+    for row in csv.reader(lines, delimiter=delimiter):
+        if len(row) <= max(c for c in (date_col, label_col, amount_col, debit_col, credit_col)
+                           if c is not None):
+            continue
+        day = parse_date(row[date_col])
+        if amount_col is not None:
+            amount = parse_amount(row[amount_col])
+        else:
+            debit = parse_amount(row[debit_col])
+            credit = parse_amount(row[credit_col]) if credit_col is not None else None
+            amount = -abs(debit) if debit else credit
+        if day is None or amount is None:
+            continue
+        yield {'date': day, 'label': row[label_col].strip(), 'amount': amount}
+
+_OFX_TAG = re.compile(r'<(/?)([A-Z0-9.]+)>([^<\r\n]*)', re.IGNORECASE)
+
+def iter_ofx_transactions(lines):
+    """
+    Lit un relevé OFX (SGML ou XML) ligne par ligne
+
+    Yields:
+        Dictionnaires {'date', 'label', 'amount', 'fitid'} (amount négatif pour un débit)
+    """
+    current = None
+    for line in lines:
+        for closing, tag, value in _OFX_TAG.findall(line):
+            tag = tag.upper()
+            if tag == 'STMTTRN':
+                if not closing:
+                    current = {}
+                elif current is not None:
+                    transaction = _ofx_transaction(current)
+                    if transaction:
+                        yield transaction
+                    current = None
+            elif current is not None and not closing:
+                current[tag] = value.strip()
+
+def _ofx_transaction(fields):
+    day = parse_date(fields.get('DTPOSTED'))
+    amount = parse_amount(fields.get('TRNAMT'))
+    if day is None or amount is None:
+        return None
+    label = fields.get('NAME') or fields.get('MEMO') or ''
+    if fields.get('MEMO') and fields.get('NAME') and fields['MEMO'] != fields['NAME']:
+        label = f"{fields['NAME']} {fields['MEMO']}"
+    return {'date': day, 'label': label, 'amount': amount, 'fitid': fields.get('FITID')}
+
+def statement_date_range(transactions):
+    """Première et dernière date d'un relevé (None s'il est vide), lu en flux"""
+    first = last = None
+    for transaction in transactions:
+        day = transaction['date']
+        first = day if first is None or day < first else first
+        last = day if last is None or day > last else last
+    return (first, last) if first is not None else None
+
+# ===== CATÉGORISATION ET DÉDOUBLONNAGE =====
+
+def compile_rules(rules):
+    """Prépare les règles (mot-clé, catégorie) pour la catégorisation"""
+    return [(normalize_text(keyword), category) for keyword, category in rules if keyword]
+
+def categorize(label, compiled_rules, default=DEFAULT_CATEGORY, normalized=False):
+    """Retourne la catégorie de la première règle dont le mot-clé apparaît dans le libellé"""
+    if not normalized:
+        label = normalize_text(label)
+    for keyword, category in compiled_rules:
+        if keyword in label:
+            return category
+    return default
+
+def iter_expense_rows(transactions, rules, stats):
+    """
+    Transforme les transactions en lignes de dépenses, avec leurs empreintes
+
+    Seuls les débits sont importés. Les transactions identiques d'un même
+    relevé sont numérotées (voir transaction_hash). Une transaction OFX
+    est identifiée par son FITID ; l'empreinte sans FITID reste reconnue
+    pour les relevés importés avant sa prise en compte.
+
+    Le relevé doit être trié par date (croissante ou décroissante, comme
+    les exports des banques) : seules les occurrences du jour en cours
+    sont comptées, la mémoire ne dépend pas de la taille du fichier.
+
+    Yields:
+        Couples (ligne de dépense, empreintes qui en font un doublon)
+    """
+    compiled = compile_rules(rules)
+    # Occurrences du jour en cours, par empreinte de (date, montant, libellé)
+    occurrences = {}
+    current_day = None
+    descending = None
+    for transaction in transactions:
+        stats['read'] += 1
+        day = transaction['date']
+        if day != current_day:
+            if current_day is not None:
+                if descending is None:
+                    descending = day < current_day
+                elif (day < current_day) != descending:
+                    raise ValueError("Relevé non trié par date : triez les opérations avant l'import")
+            current_day = day
+            occurrences.clear()
+        if transaction['amount'] >= 0:
+            stats['ignored'] += 1
+            continue
+        amount = -transaction['amount']
+        label = normalize_text(transaction['label'])
+        first = transaction_hash(day, amount, label, normalized=True)
+        occurrence = occurrences.get(first, 0)
+        occurrences[first] = occurrence + 1
+        ranked = first if not occurrence else transaction_hash(day, amount, label, normalized=True,
+                                                               occurrence=occurrence)
+        fitid = transaction.get('fitid')
+        digest = transaction_hash(day, amount, label, normalized=True, fitid=fitid) if fitid else ranked
+        yield {
+            'Catégories': categorize(label, compiled, normalized=True),
+            'Montant': amount,
+            'Fréquence': 'Unique',
+            'Description': transaction['label'],
+            'Mois': MOIS[day.month - 1],
+            'Année': day.year,
+            'ImportHash': digest
+        }, {digest, ranked}
+
+def import_transactions(transactions, rules, find_known, writer, chunk_size=500):
+    """
+    Importe un flux de transactions par paquets
+
+    Les doublons sont recherchés paquet par paquet : seules les empreintes
+    du paquet en cours sont en mémoire.
+
+    Args:
+        transactions: Itérable produit par iter_csv_transactions / iter_ofx_transactions
+        rules: Liste de couples (mot-clé, catégorie)
+        find_known: Fonction (empreintes) -> sous-ensemble déjà importé,
+            par exemple find_imported_hashes
+        writer: Fonction (liste de lignes) -> liste des lignes écrites, visibles
+            ensuite par find_known, par exemple lambda rows: add_expenses_bulk(rows, user)
+        chunk_size: Nombre de lignes transmises au writer à la fois
+
+    Returns:
+        Statistiques {'read', 'imported', 'duplicates', 'ignored'}
+    """
+    stats = {'read': 0, 'imported': 0, 'duplicates': 0, 'ignored': 0}
+    rows = iter_expense_rows(transactions, rules, stats)
+    while True:
+        window = list(islice(rows, chunk_size))
+        if not window:
+            break
+        known = set(find_known({digest for _, hashes in window for digest in hashes}))
+        chunk = []
+        for row, hashes in window:
+            if known & hashes:
+                stats['duplicates'] += 1
+                continue
+            # Un FITID répété dans le paquet est aussi un doublon
+            known.add(row['ImportHash'])
+            chunk.append(row)
+        if chunk:
+            stats['imported'] += len(writer(chunk))
+    return stats
+
+def iter_statement(lines, filename):
+    """Choisit le lecteur selon l'extension du fichier"""
+    if filename.lower().endswith(('.ofx', '.qfx')):
+        return iter_ofx_transactions(lines)
+    return iter_csv_transactions(lines)
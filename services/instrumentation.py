@@ -0,0 +1,364 @@
+"""
+Instrumentation des appels Firestore de Famileasy
+Le client renvoyé par get_db() est enveloppé : chaque appel (opération,
+collection, documents renvoyés, lectures facturées, latence, fonction
+appelante) est agrégé par rerun Streamlit et par session, et journalisé
+en JSON sur le logger 'famileasy.firestore'.
+"""
+import json
+import logging
+import math
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+
+import streamlit as st
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+
+logger = logging.getLogger('famileasy.firestore')
+
+# Sessions suivies (les plus anciennes sont oubliées)
+MAX_SESSIONS = 50
+# Appels conservés en détail pour le rerun en cours
+MAX_RERUN_CALLS = 200
+# Reruns conservés par session
+RERUN_HISTORY = 20
+# Session des appels faits hors d'un script Streamlit (réplication, listeners)
+BACKGROUND_SESSION = 'background'
+
+READ_OPERATIONS = ('get', 'stream', 'get_all', 'count', 'listen')
+
+_INTERNAL_FILES = (os.path.abspath(__file__),)
+
+# Session imposée aux appels faits depuis un thread de travail (chargement parallèle)
+_attribution = threading.local()
+
+def debug_panel_enabled():
+    """Le panneau de coût Firestore s'affiche si FAMILEASY_DEBUG est défini"""
+    return os.environ.get('FAMILEASY_DEBUG', '').strip().lower() in ('1', 'true', 'yes')
+
+def current_session_id():
+    """Identifiant de la session Streamlit du thread courant"""
+    session_id = getattr(_attribution, 'session_id', None)
+    if session_id is not None:
+        return session_id
+    ctx = get_script_run_ctx(suppress_warning=True)
+    return ctx.session_id if ctx is not None else BACKGROUND_SESSION
+
+@contextmanager
+def attributed_to(session_id):
+    """Attribue à une session les appels faits par le thread courant dans le bloc"""
+    previous = getattr(_attribution, 'session_id', None)
+    _attribution.session_id = session_id
+    try:
+        yield
+    finally:
+        _attribution.session_id = previous
+
+def _caller():
+    """Première fonction appelante hors de l'instrumentation et des bibliothèques"""
+    frame = sys._getframe(1)
+    while frame is not None:
+        filename = frame.f_code.co_filename
+        if filename not in _INTERNAL_FILES and 'site-packages' not in filename:
+            module = os.path.splitext(os.path.basename(filename))[0]
+            return f"{module}.{frame.f_code.co_name}"
+        frame = frame.f_back
+    return 'inconnu'
+
+def billed_reads(operation, docs):
+    """Lectures facturées : une par document, au moins une par requête"""
+    if operation not in READ_OPERATIONS:
+        return 0
+    if operation == 'count':
+        return max(1, math.ceil(docs / 1000))
+    return max(1, docs)
+
+def _new_rerun(page):
+    return {'page': page, 'started_at': time.time(), 'calls': [], 'dropped': 0,
+            'count': 0, 'reads': 0, 'writes': 0, 'latency': 0.0}
+
+class CallRecorder:
+    """Agrégats des appels Firestore par session et par rerun"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._sessions = OrderedDict()
+
+    def _session(self, session_id):
+        session = self._sessions.get(session_id)
+        if session is None:
+            session = {'current': _new_rerun(None), 'reruns': deque(maxlen=RERUN_HISTORY), 'totals': {}}
+            self._sessions[session_id] = session
+            while len(self._sessions) > MAX_SESSIONS:
+                self._sessions.popitem(last=False)
+        self._sessions.move_to_end(session_id)
+        return session
+
+    def start_rerun(self, page=None, session_id=None):
+        """Clôt le rerun précédent de la session et en ouvre un nouveau"""
+        session_id = session_id or current_session_id()
+        with self._lock:
+            session = self._session(session_id)
+            previous = session['current']
+            if previous['count']:
+                session['reruns'].append(previous)
+            session['current'] = _new_rerun(page)
+        if previous['count']:
+            logger.info(json.dumps({
+                'event': 'firestore_rerun', 'session': session_id, 'page': previous['page'],
+                'calls': previous['count'], 'reads': previous['reads'], 'writes': previous['writes'],
+                'latency_ms': round(previous['latency'] * 1000, 2)
+            }, ensure_ascii=False))
+
+    def record(self, operation, collection, docs, latency, caller, error=None, session_id=None):
+        """Enregistre un appel et l'écrit dans les logs structurés"""
+        session_id = session_id or current_session_id()
+        call = {
+            'op': operation,
+            'collection': collection,
+            'docs': docs,
+            'reads': billed_reads(operation, docs),
+            'writes': 0 if operation in READ_OPERATIONS else docs,
+            'latency_ms': round(latency * 1000, 2),
+            'caller': caller,
+            'at': time.time()
+        }
+        if error is not None:
+            call['error'] = str(error)
+
+        with self._lock:
+            session = self._session(session_id)
+            rerun = session['current']
+            rerun['count'] += 1
+            rerun['reads'] += call['reads']
+            rerun['writes'] += call['writes']
+            rerun['latency'] += latency
+            if len(rerun['calls']) < MAX_RERUN_CALLS:
+                rerun['calls'].append(call)
+            else:
+                rerun['dropped'] += 1
+
+            key = (operation, collection, caller)
+            totals = session['totals'].setdefault(key, {'calls': 0, 'docs': 0, 'reads': 0, 'writes': 0,
+                                                        'latency': 0.0})
+            totals['calls'] += 1
+            totals['docs'] += docs
+            totals['reads'] += call['reads']
+            totals['writes'] += call['writes']
+            totals['latency'] += latency
+
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(json.dumps({'event': 'firestore_call', 'session': session_id, **call},
+                                    ensure_ascii=False))
+
+    def rerun_report(self, session_id=None):
+        """Retourne (rerun en cours, dernier rerun terminé) de la session"""
+        session_id = session_id or current_session_id()
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None:
+                return None, None
+            current = dict(session['current'], calls=list(session['current']['calls']))
+            previous = session['reruns'][-1] if session['reruns'] else None
+        return current, previous
+
+    def session_report(self, session_id=None):
+        """Totaux de la session par (opération, collection, appelant), du plus coûteux au moins coûteux"""
+        session_id = session_id or current_session_id()
+        with self._lock:
+            session = self._sessions.get(session_id)
+            rows = [] if session is None else [
+                {'op': op, 'collection': collection, 'caller': caller, **values}
+                for (op, collection, caller), values in session['totals'].items()
+            ]
+            reruns = 0 if session is None else len(session['reruns']) + 1
+        rows.sort(key=lambda row: (row['reads'], row['writes']), reverse=True)
+        return rows, reruns
+
+@st.cache_resource
+def get_call_recorder():
+    """Retourne les agrégats partagés par toutes les sessions du processus"""
+    return CallRecorder()
+
+def _unwrap(value):
+    return getattr(value, '_wrapped', value)
+
+def _collection_of(reference):
+    return getattr(reference, 'path', '').split('/', 1)[0] or 'inconnu'
+
+class _Instrumented:
+    """Base des enveloppes : délègue tout attribut non instrumenté à l'objet Firestore"""
+
+    def __init__(self, wrapped, collection, recorder):
+        self._wrapped = wrapped
+        self._collection = collection
+        self._recorder = recorder
+
+    def __getattr__(self, name):
+        return getattr(self._wrapped, name)
+
+    def _call(self, operation, function, docs_of, caller):
+        started = time.perf_counter()
+        try:
+            result = function()
+        except Exception as e:
+            self._recorder.record(operation, self._collection, 0, time.perf_counter() - started, caller, e)
+            raise
+        self._recorder.record(operation, self._collection, docs_of(result),
+                              time.perf_counter() - started, caller)
+        return result
+
+class InstrumentedQuery(_Instrumented):
+    def _chain(self, query):
+        return InstrumentedQuery(query, self._collection, self._recorder)
+
+    def where(self, *args, **kwargs):
+        return self._chain(self._wrapped.where(*args, **kwargs))
+
+    def order_by(self, *args, **kwargs):
+        return self._chain(self._wrapped.order_by(*args, **kwargs))
+
+    def limit(self, *args, **kwargs):
+        return self._chain(self._wrapped.limit(*args, **kwargs))
+
+    def start_after(self, *args, **kwargs):
+        return self._chain(self._wrapped.start_after(*args, **kwargs))
+
+    def select(self, *args, **kwargs):
+        return self._chain(self._wrapped.select(*args, **kwargs))
+
+    def count(self, *args, **kwargs):
+        return InstrumentedAggregation(self._wrapped.count(*args, **kwargs), self._collection, self._recorder)
+
+    def stream(self, *args, **kwargs):
+        caller = _caller()
+        return self._stream(caller, *args, **kwargs)
+
+    def _stream(self, caller, *args, **kwargs):
+        started = time.perf_counter()
+        docs = 0
+        error = None
+        try:
+            for snapshot in self._wrapped.stream(*args, **kwargs):
+                docs += 1
+                yield snapshot
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            self._recorder.record('stream', self._collection, docs, time.perf_counter() - started,
+                                  caller, error)
+
+    def get(self, *args, **kwargs):
+        return self._call('stream', lambda: self._wrapped.get(*args, **kwargs), len, _caller())
+
+    def on_snapshot(self, callback):
+        caller = _caller()
+        collection, recorder = self._collection, self._recorder
+
+        def instrumented_callback(docs, changes, read_time):
+            # Les listeners sont partagés entre les sessions : lectures attribuées au processus
+            recorder.record('listen', collection, len(changes), 0.0, caller, session_id=BACKGROUND_SESSION)
+            return callback(docs, changes, read_time)
+
+        return self._wrapped.on_snapshot(instrumented_callback)
+
+class InstrumentedAggregation(_Instrumented):
+    def get(self, *args, **kwargs):
+        return self._call('count', lambda: self._wrapped.get(*args, **kwargs),
+                          lambda result: result[0][0].value, _caller())
+
+class InstrumentedCollection(InstrumentedQuery):
+    def document(self, *args, **kwargs):
+        return InstrumentedDocument(self._wrapped.document(*args, **kwargs), self._collection, self._recorder)
+
+    def add(self, *args, **kwargs):
+        return self._call('add', lambda: self._wrapped.add(*args, **kwargs), lambda _: 1, _caller())
+
+class InstrumentedDocument(_Instrumented):
+    def get(self, *args, **kwargs):
+        return self._call('get', lambda: self._wrapped.get(*args, **kwargs),
+                          lambda snapshot: int(snapshot.exists), _caller())
+
+    def set(self, *args, **kwargs):
+        return self._call('set', lambda: self._wrapped.set(*args, **kwargs), lambda _: 1, _caller())
+
+    def update(self, *args, **kwargs):
+        return self._call('update', lambda: self._wrapped.update(*args, **kwargs), lambda _: 1, _caller())
+
+    def delete(self, *args, **kwargs):
+        return self._call('delete', lambda: self._wrapped.delete(*args, **kwargs), lambda _: 1, _caller())
+
+class InstrumentedBatch(_Instrumented):
+    def __init__(self, wrapped, recorder):
+        super().__init__(wrapped, None, recorder)
+        self._collections = set()
+        self._writes = 0
+
+    def _add(self, reference):
+        self._collections.add(_collection_of(reference))
+        self._writes += 1
+
+    def set(self, reference, *args, **kwargs):
+        self._add(reference)
+        return self._wrapped.set(_unwrap(reference), *args, **kwargs)
+
+    def update(self, reference, *args, **kwargs):
+        self._add(reference)
+        return self._wrapped.update(_unwrap(reference), *args, **kwargs)
+
+    def delete(self, reference, *args, **kwargs):
+        self._add(reference)
+        return self._wrapped.delete(_unwrap(reference), *args, **kwargs)
+
+    def commit(self, *args, **kwargs):
+        self._collection = ','.join(sorted(self._collections))
+        writes = self._writes
+        result = self._call('commit', lambda: self._wrapped.commit(*args, **kwargs), lambda _: writes,
+                            _caller())
+        self._collections = set()
+        self._writes = 0
+        return result
+
+class InstrumentedClient(_Instrumented):
+    """Client Firestore (ou émulateur, ou mémoire) dont chaque appel est enregistré"""
+
+    def __init__(self, wrapped, recorder):
+        super().__init__(wrapped, None, recorder)
+
+    def collection(self, name):
+        return InstrumentedCollection(self._wrapped.collection(name), name, self._recorder)
+
+    def document(self, path):
+        collection = path.split('/', 1)[0]
+        return InstrumentedDocument(self._wrapped.document(path), collection, self._recorder)
+
+    def batch(self):
+        return InstrumentedBatch(self._wrapped.batch(), self._recorder)
+
+    def get_all(self, references, *args, **kwargs):
+        references = list(references)
+        caller = _caller()
+        collections = sorted({_collection_of(ref) for ref in references})
+        started = time.perf_counter()
+        snapshots = []
+        error = None
+        try:
+            snapshots = list(self._wrapped.get_all([_unwrap(ref) for ref in references], *args, **kwargs))
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            self._recorder.record('get_all', ','.join(collections), len(snapshots),
+                                  time.perf_counter() - started, caller, error)
+        return iter(snapshots)
+
+def instrument(client):
+    """Enveloppe un client pour enregistrer ses appels (None reste None)"""
+    if client is None or isinstance(client, InstrumentedClient):
+        return client
+    return InstrumentedClient(client, get_call_recorder())
@@ -0,0 +1,147 @@
+"""
+Registre des transactions du budget
+Dépenses et revenus dans un seul DataFrame colonnaire typé
+"""
+import pandas as pd
+
+MOIS = ['Janvier', 'Février', 'Mars', 'Avril', 'Mai', 'Juin',
+        'Juillet', 'Août', 'Septembre', 'Octobre', 'Novembre', 'Décembre']
+
+TYPE_DEPENSE = 'Dépense'
+TYPE_REVENU = 'Revenu'
+
+# Les revenus rangent leur 'Source' dans la colonne 'Catégories'
+COLUMNS = ['doc_id', 'Type', 'Catégories', 'Montant', 'Mois', 'Année',
+           'Utilisateur', 'Fréquence', 'Description', 'Timestamp']
+
+CATEGORICAL_COLUMNS = ['Type', 'Catégories', 'Utilisateur', 'Fréquence']
+
+# Colonnes des cellules du résumé annuel (voir budget_service.get_year_summary)
+SUMMARY_COLUMNS = ['Mois', 'Catégories', 'Utilisateur',
+                   'expense_total', 'expense_count', 'revenue_total', 'revenue_count']
+
+def _typed_frame(rows):
+    """Construit un DataFrame aux types explicites à partir de dictionnaires"""
+    df = pd.DataFrame(rows, columns=COLUMNS)
+    for column in CATEGORICAL_COLUMNS:
+        df[column] = df[column].astype('category')
+    df['Mois'] = pd.Categorical(df['Mois'], categories=MOIS, ordered=True)
+    df['Année'] = pd.to_numeric(df['Année'], errors='coerce').fillna(0).astype('int16')
+    df['Montant'] = pd.to_numeric(df['Montant'], errors='coerce').fillna(0.0).astype('float64')
+    df['Timestamp'] = pd.to_numeric(df['Timestamp'], errors='coerce').astype('float64')
+    df['doc_id'] = df['doc_id'].astype('object')
+    df['Description'] = df['Description'].astype('object')
+    return df
+
+def _to_row(kind, record):
+    """Convertit un document Firestore en ligne du registre"""
+    row = {column: record.get(column) for column in COLUMNS}
+    row['Type'] = kind
+    if kind == TYPE_REVENU:
+        row['Catégories'] = record.get('Source')
+    return row
+
+def summary_frame(cells):
+    """Convertit les cellules d'un résumé annuel en DataFrame"""
+    rows = []
+    for key, values in cells.items():
+        month, category, user = key.split('|', 2)
+        rows.append({'Mois': month, 'Catégories': category, 'Utilisateur': user, **values})
+    df = pd.DataFrame(rows, columns=SUMMARY_COLUMNS)
+    for column in SUMMARY_COLUMNS[3:]:
+        df[column] = pd.to_numeric(df[column], errors='coerce').fillna(0)
+    return df
+
+class LedgerStore:
+    """
+    Registre en mémoire des dépenses et revenus
+
+    Le DataFrame n'est reconstruit que lorsque la version des données
+    source change ; les écritures locales et les changements synchronisés
+    sont appliqués directement (apply_changes).
+    """
+
+    def __init__(self):
+        self.df = _typed_frame([])
+        self.version = None
+
+    def refresh(self, expenses, revenues, version):
+        """Reconstruit le registre si la version des données a changé"""
+        if version == self.version:
+            return False
+        rows = [_to_row(TYPE_DEPENSE, e) for e in expenses]
+        rows += [_to_row(TYPE_REVENU, r) for r in revenues]
+        self.df = _typed_frame(rows)
+        self.version = version
+        return True
+
+    def extend(self, kind, records):
+        """Ajoute plusieurs transactions sans reconstruire le registre"""
+        if not records:
+            return
+        new_row = _typed_frame([_to_row(kind, record) for record in records])
+        for column in CATEGORICAL_COLUMNS:
+            categories = self.df[column].cat.categories.union(new_row[column].cat.categories)
+            self.df[column] = self.df[column].cat.set_categories(categories)
+            new_row[column] = new_row[column].cat.set_categories(categories)
+        self.df = pd.concat([self.df, new_row], ignore_index=True)
+
+    def apply_changes(self, kind, changes):
+        """
+        Applique des changements reçus de la synchronisation
+
+        Args:
+            kind: TYPE_DEPENSE ou TYPE_REVENU
+            changes: Liste de couples (doc_id, données ou None si supprimé)
+        """
+        if not changes:
+            return
+        latest = dict(changes)
+        self.df = self.df[~self.df['doc_id'].isin(list(latest))].reset_index(drop=True)
+        self.extend(kind, [data for data in latest.values() if data is not None])
+
+    def _select(self, kind, year=None):
+        mask = self.df['Type'] == kind
+        if year is not None:
+            mask &= self.df['Année'] == year
+        return self.df[mask]
+
+    def summary(self, year):
+        """Calcule localement les cellules du résumé d'une année"""
+        df = self.df[self.df['Année'] == year]
+        grouped = df.groupby(['Type', 'Mois', 'Catégories', 'Utilisateur'], observed=True)['Montant']
+        totals = grouped.agg(['sum', 'count']).reset_index()
+        cells = {}
+        for row in totals.itertuples(index=False):
+            kind = 'expense' if row.Type == TYPE_DEPENSE else 'revenue'
+            cell = cells.setdefault(f"{row.Mois}|{row.Catégories}|{row.Utilisateur}", {})
+            cell[f'{kind}_total'] = float(row.sum)
+            cell[f'{kind}_count'] = int(row.count)
+        return cells
+
+    def expenses(self, year=None):
+        """Retourne les dépenses (d'une année si précisée)"""
+        return self._select(TYPE_DEPENSE, year)
+
+    def revenues(self, year=None):
+        """Retourne les revenus (d'une année si précisée), avec leur colonne 'Source'"""
+        return self._select(TYPE_REVENU, year).rename(columns={'Catégories': 'Source'})
+
+def diff_rows(original, edited, columns):
+    """
+    Compare une grille éditée à son contenu initial (index = doc_id)
+
+    Returns:
+        (updates, deleted) : {doc_id: {colonne: nouvelle valeur}} pour les lignes
+        modifiées, et liste des doc_id retirés de la grille
+    """
+    deleted = [doc_id for doc_id in original.index if doc_id not in edited.index]
+    common = original.index.intersection(edited.index)
+    before = original.loc[common, columns].astype(object)
+    after = edited.loc[common, columns].astype(object)
+    changed = (before != after) & ~(before.isna() & after.isna())
+    updates = {}
+    for doc_id in changed.index[changed.any(axis=1)]:
+        fields = changed.columns[changed.loc[doc_id]]
+        updates[doc_id] = {column: after.at[doc_id, column] for column in fields}
+    return updates, deleted
@@ -0,0 +1,432 @@
+"""
+Stockage local SQLite pour Famileasy
+Miroir des dépenses, revenus et de la configuration : les lectures sont
+servies depuis le disque local et les écritures passent par une file
+d'attente (outbox) rejouée vers Firestore en arrière-plan.
+"""
+import json
+import logging
+import re
+import secrets
+import sqlite3
+import string
+import threading
+import time
+import unicodedata
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+LOCAL_DB_PATH = Path(__file__).parent.parent / ".cache" / "famileasy.sqlite3"
+
+# Délai avant une nouvelle tentative : 2, 4, 8... secondes, plafonné
+RETRY_BASE_SECONDS = 2
+RETRY_MAX_SECONDS = 300
+
+_ID_ALPHABET = string.ascii_letters + string.digits
+
+# Champ texte indexé pour la recherche, par collection
+SEARCH_FIELDS = {'expenses': 'Description'}
+# À incrémenter si la tokenisation change : l'index est alors reconstruit
+SEARCH_INDEX_VERSION = 1
+SEARCH_LIMIT = 100
+# Mots trop fréquents pour être utiles (élisions comprises : l'épicerie → épicerie)
+STOP_WORDS = {
+    'au', 'aux', 'avec', 'ce', 'ces', 'dans', 'de', 'des', 'du', 'en', 'et', 'la', 'le',
+    'les', 'leur', 'ou', 'par', 'pour', 'sa', 'se', 'ses', 'son', 'sur', 'un', 'une'
+}
+_WORD_RE = re.compile(r'[a-z0-9]+')
+_LIGATURES = str.maketrans({'œ': 'oe', 'æ': 'ae', 'ß': 'ss'})
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS documents (
+    collection TEXT NOT NULL,
+    doc_id TEXT NOT NULL,
+    year INTEGER,
+    data TEXT NOT NULL,
+    modified REAL NOT NULL,
+    deleted INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (collection, doc_id)
+);
+CREATE INDEX IF NOT EXISTS documents_year ON documents (collection, year, deleted);
+CREATE INDEX IF NOT EXISTS documents_import_hash ON documents (collection, json_extract(data, '$.ImportHash'));
+CREATE TABLE IF NOT EXISTS outbox (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    collection TEXT NOT NULL,
+    doc_id TEXT NOT NULL,
+    op TEXT NOT NULL,
+    data TEXT,
+    modified REAL NOT NULL,
+    notification TEXT,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt REAL NOT NULL DEFAULT 0,
+    last_error TEXT
+);
+CREATE INDEX IF NOT EXISTS outbox_doc ON outbox (collection, doc_id);
+CREATE TABLE IF NOT EXISTS search_terms (
+    collection TEXT NOT NULL,
+    term TEXT NOT NULL,
+    doc_id TEXT NOT NULL,
+    year INTEGER,
+    category TEXT,
+    timestamp REAL,
+    PRIMARY KEY (collection, term, doc_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS search_terms_doc ON search_terms (collection, doc_id);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+def new_doc_id():
+    """Génère un identifiant de document au format Firestore (20 caractères)"""
+    return ''.join(secrets.choice(_ID_ALPHABET) for _ in range(20))
+
+def edit_time(data):
+    """Date de la dernière modification d'un document, utilisée pour les conflits"""
+    return float(data.get('DateModification') or data.get('Timestamp') or 0)
+
+def normalize(text):
+    """Minuscules sans accents ni ligatures : « Crème brûlée » → « creme brulee »"""
+    text = unicodedata.normalize('NFKD', str(text).lower().translate(_LIGATURES))
+    return ''.join(char for char in text if not unicodedata.combining(char))
+
+def tokenize(text):
+    """Mots indexés d'un texte français : normalisés, sans lettres isolées ni mots vides"""
+    return {word for word in _WORD_RE.findall(normalize(text or ''))
+            if (len(word) > 1 or word.isdigit()) and word not in STOP_WORDS}
+
+def query_terms(text):
+    """Préfixes recherchés : comme tokenize, mais le dernier mot (en cours de saisie) est gardé"""
+    words = _WORD_RE.findall(normalize(text or ''))
+    terms = tokenize(' '.join(words[:-1]))
+    if words and (len(words[-1]) > 1 or words[-1].isdigit()):
+        terms.add(words[-1])
+    # Un préfixe qui en prolonge un autre rend ce dernier redondant
+    return sorted(term for term in terms if not any(other != term and other.startswith(term)
+                                                    for other in terms))
+
+class LocalStore:
+    """
+    Base SQLite locale partagée par toutes les sessions du processus
+
+    Une seule connexion protégée par un verrou : les écritures SQLite sont
+    de toute façon sérialisées, et le mode WAL laisse les lectures rapides.
+    """
+
+    def __init__(self, path=LOCAL_DB_PATH):
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(path), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+        self._build_search_index()
+
+    # ===== LECTURES =====
+
+    def documents(self, collection, year=None):
+        """Retourne les documents d'une collection (d'une année si précisée), avec 'doc_id'"""
+        sql = "SELECT doc_id, data FROM documents WHERE collection = ? AND deleted = 0"
+        params = [collection]
+        if year is not None:
+            sql += " AND year = ?"
+            params.append(int(year))
+        with self._lock:
+            rows = self._conn.execute(sql, params).fetchall()
+        return [{**json.loads(data), 'doc_id': doc_id} for doc_id, data in rows]
+
+    def get(self, collection, doc_id):
+        """Retourne un document (sans 'doc_id'), ou None s'il est absent ou supprimé"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT data FROM documents WHERE collection = ? AND doc_id = ? AND deleted = 0",
+                (collection, doc_id)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def known_import_hashes(self, collection, hashes):
+        """Retourne les empreintes d'import (ImportHash) déjà présentes parmi celles données (index)"""
+        hashes = list(hashes)
+        if not hashes:
+            return set()
+        sql = ("SELECT json_extract(data, '$.ImportHash') FROM documents "
+               "WHERE collection = ? AND json_extract(data, '$.ImportHash') IN ({}) AND deleted = 0")
+        known = set()
+        # SQLite limite le nombre de paramètres d'une requête
+        for start in range(0, len(hashes), 500):
+            part = hashes[start:start + 500]
+            with self._lock:
+                rows = self._conn.execute(sql.format(', '.join('?' * len(part))),
+                                          [collection, *part]).fetchall()
+            known.update(value for (value,) in rows)
+        return known
+
+    def search(self, collection, text, year=None, category=None, limit=SEARCH_LIMIT):
+        """
+        Recherche plein texte par préfixes dans l'index inversé
+
+        Chaque mot de la requête doit être le début d'un mot du texte indexé
+        (« carr sup » trouve « Supermarché Carrefour »), sans tenir compte
+        des accents ni de la casse. Seules les entrées de l'index et les
+        documents trouvés sont lus : le coût ne dépend pas de la collection.
+
+        Args:
+            text: Mots recherchés
+            year: Année des documents, toutes si None
+            category: Valeur du champ 'Catégories', toutes si None
+            limit: Nombre maximal de résultats, les plus récents d'abord
+
+        Returns:
+            Liste de documents avec 'doc_id' (vide si la requête n'a aucun mot indexable)
+        """
+        words = query_terms(text)
+        if not words:
+            return []
+        # Chaque préfixe est un intervalle de la clé primaire (collection, term).
+        # Le mot le plus long, a priori le plus sélectif, porte les filtres ;
+        # année, catégorie et date sont recopiées dans l'index : seuls les
+        # documents retenus sont lus.
+        driver, *others = sorted(words, key=len, reverse=True)
+        sql = ("SELECT DISTINCT t.doc_id, t.timestamp FROM search_terms t "
+               "WHERE t.collection = ? AND t.term >= ? AND t.term < ?")
+        params = [collection, driver, driver + '\uffff']
+        if year is not None:
+            sql += " AND t.year = ?"
+            params.append(int(year))
+        if category:
+            sql += " AND t.category = ?"
+            params.append(category)
+        if others:
+            # Documents contenant les autres mots : ensemble calculé une seule fois
+            sql += " AND t.doc_id IN ({})".format(" INTERSECT ".join(
+                "SELECT doc_id FROM search_terms WHERE collection = ? AND term >= ? AND term < ?"
+                for _ in others))
+            params.extend(value for word in others for value in (collection, word, word + '\uffff'))
+        sql += " ORDER BY t.timestamp DESC LIMIT ?"
+        params.append(int(limit))
+        with self._lock:
+            hits = [doc_id for doc_id, _ in self._conn.execute(sql, params).fetchall()]
+            rows = dict(self._conn.execute(
+                f"SELECT doc_id, data FROM documents WHERE collection = ? AND deleted = 0 "
+                f"AND doc_id IN ({', '.join('?' * len(hits))})", [collection, *hits]).fetchall())
+        return [{**json.loads(rows[doc_id]), 'doc_id': doc_id} for doc_id in hits if doc_id in rows]
+
+    # ===== ÉCRITURES LOCALES =====
+
+    def write(self, collection, doc_id, data, notification=None):
+        """
+        Enregistre une écriture locale et la place dans l'outbox
+
+        Args:
+            collection: Collection Firestore cible
+            doc_id: Identifiant du document
+            data: Document complet, ou None pour une suppression
+            notification: (titre, message, utilisateur, module) à publier avec l'écriture
+        """
+        self.write_many(collection, [(doc_id, data)], notification)
+
+    def write_many(self, collection, writes, notification=None):
+        """Enregistre plusieurs écritures locales en une transaction (notification sur la dernière)"""
+        with self._lock, self._conn:
+            last = len(writes) - 1
+            for index, (doc_id, data) in enumerate(writes):
+                modified = edit_time(data) if data else time.time()
+                self._upsert(collection, doc_id, data, modified)
+                self._conn.execute(
+                    "INSERT INTO outbox (collection, doc_id, op, data, modified, notification) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    (collection, doc_id, 'delete' if data is None else 'set',
+                     None if data is None else json.dumps(data, default=str), modified,
+                     json.dumps(notification) if notification and index == last else None))
+
+    def _upsert(self, collection, doc_id, data, modified):
+        if collection in SEARCH_FIELDS:
+            self._index_terms(collection, doc_id, data)
+        if data is None:
+            self._conn.execute(
+                "UPDATE documents SET deleted = 1, modified = ? WHERE collection = ? AND doc_id = ?",
+                (modified, collection, doc_id))
+            return
+        year = data.get('Année')
+        self._conn.execute(
+            "INSERT OR REPLACE INTO documents (collection, doc_id, year, data, modified, deleted) "
+            "VALUES (?, ?, ?, ?, ?, 0)",
+            (collection, doc_id, int(year) if year is not None else None,
+             json.dumps({k: v for k, v in data.items() if k != 'doc_id'}, default=str), modified))
+
+    # ===== INDEX DE RECHERCHE =====
+
+    def _index_terms(self, collection, doc_id, data):
+        """Remplace les mots indexés d'un document (aucun s'il est supprimé)"""
+        self._conn.execute("DELETE FROM search_terms WHERE collection = ? AND doc_id = ?",
+                           (collection, doc_id))
+        if data is not None:
+            year = data.get('Année')
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO search_terms (collection, term, doc_id, year, category, timestamp) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                [(collection, term, doc_id, int(year) if year is not None else None,
+                  data.get('Catégories'), float(data.get('Timestamp') or 0))
+                 for term in tokenize(data.get(SEARCH_FIELDS[collection]))])
+
+    def _build_search_index(self):
+        """Indexe les documents déjà présents (base antérieure à l'index ou tokenisation modifiée)"""
+        if self.get_meta('search_index_version') == SEARCH_INDEX_VERSION:
+            return
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM search_terms")
+            for collection in SEARCH_FIELDS:
+                rows = self._conn.execute(
+                    "SELECT doc_id, data FROM documents WHERE collection = ? AND deleted = 0",
+                    (collection,)).fetchall()
+                for doc_id, data in rows:
+                    self._index_terms(collection, doc_id, json.loads(data))
+        self.set_meta('search_index_version', SEARCH_INDEX_VERSION)
+        logger.info("Index de recherche reconstruit")
+
+    # ===== RÉPLICATION =====
+
+    def merge_remote(self, collection, docs, deleted_ids=(), year=None, complete=False):
+        """
+        Reporte localement des documents lus dans Firestore
+
+        Un document modifié localement et pas encore répliqué n'est pas écrasé :
+        le conflit est résolu au moment de l'envoi. Sinon la version la plus
+        récente (DateModification, à défaut Timestamp) l'emporte.
+
+        Args:
+            docs: Documents Firestore, avec 'doc_id'
+            deleted_ids: Identifiants supprimés dans Firestore
+            year: Année couverte par la lecture (None pour toute la collection)
+            complete: True si docs est le contenu complet de la collection / année :
+                les documents locaux absents sont alors supprimés
+        """
+        with self._lock, self._conn:
+            pending = {doc_id for (doc_id,) in self._conn.execute(
+                "SELECT DISTINCT doc_id FROM outbox WHERE collection = ?", (collection,))}
+            local = {}
+            if complete:
+                sql = "SELECT doc_id, modified FROM documents WHERE collection = ? AND deleted = 0"
+                params = [collection]
+                if year is not None:
+                    sql += " AND year = ?"
+                    params.append(int(year))
+                local = dict(self._conn.execute(sql, params).fetchall())
+            seen = set()
+            for data in docs:
+                doc_id = data['doc_id']
+                seen.add(doc_id)
+                if doc_id in pending:
+                    continue
+                row = self._conn.execute(
+                    "SELECT modified FROM documents WHERE collection = ? AND doc_id = ?",
+                    (collection, doc_id)).fetchone()
+                if row is None or edit_time(data) >= row[0]:
+                    self._upsert(collection, doc_id, data, edit_time(data))
+            # Une tombe signale aussi un document déplacé vers une autre année :
+            # il n'est retiré que s'il appartient encore localement à l'année lue
+            removed = set(deleted_ids) - seen
+            if complete:
+                removed |= set(local) - seen
+            for doc_id in removed - pending:
+                row = self._conn.execute(
+                    "SELECT year FROM documents WHERE collection = ? AND doc_id = ?",
+                    (collection, doc_id)).fetchone()
+                if row is not None and (year is None or row[0] == int(year)):
+                    # Date nulle : toute version ultérieure du document l'emporte
+                    self._upsert(collection, doc_id, None, 0)
+
+    def put_snapshot(self, collection, doc_id, data):
+        """Remplace un document de configuration par sa version Firestore (None si absent)"""
+        with self._lock, self._conn:
+            if data is None:
+                self._conn.execute("DELETE FROM documents WHERE collection = ? AND doc_id = ?",
+                                   (collection, doc_id))
+            else:
+                self._upsert(collection, doc_id, data, time.time())
+
+    def pending(self, limit=100):
+        """Retourne les écritures en attente dont la prochaine tentative est due"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id, collection, doc_id, op, data, modified, notification, attempts "
+                "FROM outbox WHERE next_attempt <= ? ORDER BY id LIMIT ?",
+                (time.time(), limit)).fetchall()
+        return [{
+            'id': row[0],
+            'collection': row[1],
+            'doc_id': row[2],
+            'op': row[3],
+            'data': json.loads(row[4]) if row[4] else None,
+            'modified': row[5],
+            'notification': json.loads(row[6]) if row[6] else None,
+            'attempts': row[7]
+        } for row in rows]
+
+    def pending_documents(self, collection):
+        """Dernier état en attente de réplication de chaque document : {doc_id: données ou None}"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT doc_id, data FROM outbox WHERE collection = ? ORDER BY id",
+                (collection,)).fetchall()
+        return {doc_id: json.loads(data) if data else None for doc_id, data in rows}
+
+    def pending_creations(self, collection):
+        """Documents créés localement et pas encore répliqués : {doc_id: dernier état ou None}"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT doc_id, data FROM outbox WHERE collection = ? ORDER BY id",
+                (collection,)).fetchall()
+        created = {}
+        for doc_id, data in rows:
+            data = json.loads(data) if data else None
+            if doc_id in created:
+                created[doc_id] = data
+            elif data is not None and 'DateModification' not in data:
+                # Première écriture sans DateModification : une création
+                created[doc_id] = data
+        return created
+
+    def pending_count(self):
+        """Nombre d'écritures locales pas encore répliquées"""
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM outbox").fetchone()[0]
+
+    def complete(self, entry_ids):
+        """Retire de l'outbox les écritures répliquées (ou abandonnées après conflit)"""
+        with self._lock, self._conn:
+            self._conn.executemany("DELETE FROM outbox WHERE id = ?", [(i,) for i in entry_ids])
+
+    def retry(self, entries, error):
+        """Reporte des écritures après un échec, avec un délai exponentiel"""
+        now = time.time()
+        with self._lock, self._conn:
+            for entry in entries:
+                delay = min(RETRY_BASE_SECONDS * 2 ** entry['attempts'], RETRY_MAX_SECONDS)
+                self._conn.execute(
+                    "UPDATE outbox SET attempts = attempts + 1, next_attempt = ?, last_error = ? "
+                    "WHERE id = ?", (now + delay, str(error), entry['id']))
+
+    def get_meta(self, key, default=None):
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return json.loads(row[0]) if row else default
+
+    def set_meta(self, key, value):
+        with self._lock, self._conn:
+            self._conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)",
+                               (key, json.dumps(value)))
+
+_store = None
+_store_lock = threading.Lock()
+
+def get_local_store():
+    """Retourne la base locale du processus, ouverte au premier appel"""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = LocalStore()
+    return _store
@@ -0,0 +1,412 @@
+"""
+Backend de stockage en mémoire pour Famileasy
+Reproduit la partie de l'API du client Firestore utilisée par les services
+(collections, documents, requêtes, batchs, agrégation count, listeners)
+pour les tests et les benchmarks, sans identifiants ni réseau.
+"""
+import copy
+import itertools
+import math
+import queue
+import secrets
+import string
+import threading
+from datetime import datetime, timezone
+from enum import Enum
+
+from google.api_core.exceptions import InvalidArgument
+from google.cloud.firestore_v1.transforms import DELETE_FIELD, SERVER_TIMESTAMP, Increment
+
+_ID_ALPHABET = string.ascii_letters + string.digits
+MAX_BATCH_WRITES = 500  # Limite d'opérations d'un batch Firestore
+
+_OPERATORS = {
+    '==': lambda a, b: a == b,
+    '!=': lambda a, b: a != b,
+    '<': lambda a, b: a < b,
+    '<=': lambda a, b: a <= b,
+    '>': lambda a, b: a > b,
+    '>=': lambda a, b: a >= b,
+    'in': lambda a, b: a in b,
+    'not-in': lambda a, b: a not in b,
+    'array_contains': lambda a, b: isinstance(a, list) and b in a,
+    'array_contains_any': lambda a, b: isinstance(a, list) and any(v in a for v in b)
+}
+
+class ChangeType(Enum):
+    ADDED = 1
+    REMOVED = 2
+    MODIFIED = 3
+
+class DocumentChange:
+    def __init__(self, type, document):
+        self.type = type
+        self.document = document
+
+def _type_order(value):
+    """Clé de tri Firestore : les valeurs de types différents sont ordonnées par type"""
+    if value is None:
+        return (0, 0)
+    if isinstance(value, bool):
+        return (1, value)
+    if isinstance(value, (int, float)):
+        return (2, value)
+    if isinstance(value, datetime):
+        return (3, value)
+    if isinstance(value, str):
+        return (4, value)
+    return (5, str(value))
+
+def _apply_value(current, value):
+    """Applique une valeur écrite, en interprétant Increment et SERVER_TIMESTAMP"""
+    if value is SERVER_TIMESTAMP:
+        return datetime.now(timezone.utc)
+    if isinstance(value, Increment):
+        base = current if isinstance(current, (int, float)) else 0
+        return base + value.value
+    if isinstance(value, dict):
+        return {k: _apply_value(None, v) for k, v in value.items() if v is not DELETE_FIELD}
+    return copy.deepcopy(value)
+
+def _merge(target, data):
+    """Fusion récursive d'un set(merge=True), avec DELETE_FIELD et Increment"""
+    for key, value in data.items():
+        if value is DELETE_FIELD:
+            target.pop(key, None)
+        elif isinstance(value, dict) and isinstance(target.get(key), dict):
+            _merge(target[key], value)
+        else:
+            target[key] = _apply_value(target.get(key), value)
+
+def _update(target, data):
+    """Mise à jour par chemins de champs ('a.b'), comme DocumentReference.update"""
+    for path, value in data.items():
+        parts = path.split('.')
+        node = target
+        for part in parts[:-1]:
+            node = node.setdefault(part, {})
+        if value is DELETE_FIELD:
+            node.pop(parts[-1], None)
+        else:
+            node[parts[-1]] = _apply_value(node.get(parts[-1]), value)
+
+class DocumentSnapshot:
+    def __init__(self, reference, data):
+        self.reference = reference
+        self.id = reference.id
+        self._data = data
+        self.exists = data is not None
+
+    def to_dict(self):
+        return copy.deepcopy(self._data) if self._data is not None else None
+
+    def get(self, field):
+        node = self._data or {}
+        for part in field.split('.'):
+            node = node.get(part) if isinstance(node, dict) else None
+        return node
+
+class DocumentReference:
+    def __init__(self, client, collection, doc_id):
+        self._client = client
+        self.id = doc_id
+        self.path = f"{collection}/{doc_id}"
+        self._collection = collection
+
+    def get(self, timeout=None):
+        with self._client._lock:
+            self._client.reads += 1
+            data = self._client._collection(self._collection).get(self.id)
+            return DocumentSnapshot(self, copy.deepcopy(data))
+
+    def set(self, data, merge=False):
+        batch = self._client.batch()
+        batch.set(self, data, merge=merge)
+        batch.commit()
+
+    def update(self, data):
+        batch = self._client.batch()
+        batch.update(self, data)
+        batch.commit()
+
+    def delete(self):
+        batch = self._client.batch()
+        batch.delete(self)
+        batch.commit()
+
+class AggregationResult:
+    def __init__(self, alias, value):
+        self.alias = alias
+        self.value = value
+
+class CountQuery:
+    def __init__(self, query, alias):
+        self._query = query
+        self._alias = alias
+
+    def get(self, timeout=None):
+        count = sum(1 for _ in self._query._results())
+        # Facturation Firestore : une lecture par tranche de 1000 entrées d'index
+        with self._query._client._lock:
+            self._query._client.reads += max(1, math.ceil(count / 1000))
+        return [[AggregationResult(self._alias, count)]]
+
+class Query:
+    DESCENDING = 'DESCENDING'
+    ASCENDING = 'ASCENDING'
+
+    def __init__(self, client, collection, filters=(), orders=(), limit=None,
+                 start_after=None, fields=None):
+        self._client = client
+        self._collection_name = collection
+        self._filters = tuple(filters)
+        self._orders = tuple(orders)
+        self._limit = limit
+        self._start_after = start_after
+        self._fields = fields
+
+    def _copy(self, **changes):
+        params = {
+            'filters': self._filters, 'orders': self._orders, 'limit': self._limit,
+            'start_after': self._start_after, 'fields': self._fields
+        }
+        params.update(changes)
+        return Query(self._client, self._collection_name, **params)
+
+    def where(self, field_path=None, op_string=None, value=None, filter=None):
+        if filter is not None:
+            field_path, op_string, value = filter.field_path, filter.op_string, filter.value
+        if op_string not in _OPERATORS:
+            raise ValueError(f"Opérateur non supporté: {op_string}")
+        return self._copy(filters=self._filters + ((field_path, op_string, value),))
+
+    def order_by(self, field_path, direction=ASCENDING):
+        return self._copy(orders=self._orders + ((field_path, direction),))
+
+    def limit(self, count):
+        return self._copy(limit=count)
+
+    def start_after(self, snapshot):
+        return self._copy(start_after=snapshot)
+
+    def select(self, field_paths):
+        return self._copy(fields=list(field_paths))
+
+    def count(self, alias=None):
+        return CountQuery(self, alias)
+
+    def _matches(self, data):
+        for field, op, value in self._filters:
+            if field not in data:
+                return False
+            try:
+                if not _OPERATORS[op](data[field], value):
+                    return False
+            except TypeError:
+                return False
+        return True
+
+    def _results(self):
+        """Documents correspondants, triés et paginés : liste de (doc_id, données)"""
+        with self._client._lock:
+            docs = [(doc_id, copy.deepcopy(data))
+                    for doc_id, data in self._client._collection(self._collection_name).items()
+                    if self._matches(data)]
+        # Comme Firestore, un tri exclut les documents sans le champ trié
+        for field, _ in self._orders:
+            docs = [(doc_id, data) for doc_id, data in docs if field in data]
+        docs.sort(key=lambda item: item[0])
+        for field, direction in reversed(self._orders):
+            docs.sort(key=lambda item: _type_order(item[1][field]), reverse=direction == Query.DESCENDING)
+        if self._start_after is not None:
+            ids = [doc_id for doc_id, _ in docs]
+            if self._start_after.id in ids:
+                docs = docs[ids.index(self._start_after.id) + 1:]
+        if self._limit is not None:
+            docs = docs[:self._limit]
+        if self._fields is not None:
+            docs = [(doc_id, {f: data[f] for f in self._fields if f in data}) for doc_id, data in docs]
+        return docs
+
+    def stream(self, transaction=None, timeout=None, retry=None):
+        results = self._results()
+        with self._client._lock:
+            self._client.reads += len(results)
+        for doc_id, data in results:
+            yield DocumentSnapshot(DocumentReference(self._client, self._collection_name, doc_id), data)
+
+    def get(self, transaction=None, timeout=None, retry=None):
+        return list(self.stream(timeout=timeout))
+
+    def on_snapshot(self, callback):
+        return Watch(self, callback)
+
+class CollectionReference(Query):
+    def __init__(self, client, name):
+        super().__init__(client, name)
+        self.id = name
+
+    def document(self, document_id=None):
+        return DocumentReference(self._client, self._collection_name, document_id or new_id())
+
+    def add(self, data):
+        ref = self.document()
+        ref.set(data)
+        return datetime.now(timezone.utc), ref
+
+class WriteBatch:
+    def __init__(self, client):
+        self._client = client
+        self._writes = []
+
+    def set(self, reference, data, merge=False):
+        self._writes.append(('set', reference, data, merge))
+
+    def update(self, reference, data):
+        self._writes.append(('update', reference, data, False))
+
+    def delete(self, reference):
+        self._writes.append(('delete', reference, None, False))
+
+    def commit(self, timeout=None, retry=None):
+        """Applique toutes les écritures de façon atomique"""
+        if len(self._writes) > MAX_BATCH_WRITES:
+            raise InvalidArgument(f"maximum {MAX_BATCH_WRITES} writes allowed per request")
+        client = self._client
+        with client._lock:
+            for op, reference, _, _ in self._writes:
+                if op == 'update' and reference.id not in client._collection(reference._collection):
+                    raise KeyError(f"Document introuvable: {reference.path}")
+            touched = set()
+            for op, reference, data, merge in self._writes:
+                docs = client._collection(reference._collection)
+                if op == 'delete':
+                    docs.pop(reference.id, None)
+                elif op == 'update':
+                    _update(docs[reference.id], data)
+                elif merge:
+                    _merge(docs.setdefault(reference.id, {}), data)
+                else:
+                    docs[reference.id] = _apply_value(None, data)
+                touched.add(reference._collection)
+            client.writes += len(self._writes)
+            self._writes = []
+        client._notify(touched)
+        return []
+
+class Watch:
+    """Listener en mémoire : les callbacks sont appelés depuis un thread dédié, dans l'ordre"""
+
+    def __init__(self, query, callback):
+        self._query = query
+        self._callback = callback
+        self._docs = None
+        self.is_active = True
+        query._client._register(self)
+
+    def _refresh(self):
+        if not self.is_active:
+            return
+        client = self._query._client
+        current = dict(self._query._results())
+        previous = self._docs or {}
+        changes = []
+        for doc_id, data in current.items():
+            if doc_id not in previous:
+                changes.append((ChangeType.ADDED, doc_id, data))
+            elif previous[doc_id] != data:
+                changes.append((ChangeType.MODIFIED, doc_id, data))
+        for doc_id in previous.keys() - current.keys():
+            changes.append((ChangeType.REMOVED, doc_id, previous[doc_id]))
+        if self._docs is not None and not changes:
+            return
+        self._docs = current
+        with client._lock:
+            client.reads += len(changes) or 1
+
+        def snapshot(doc_id, data):
+            return DocumentSnapshot(DocumentReference(client, self._query._collection_name, doc_id), data)
+
+        self._callback([snapshot(doc_id, data) for doc_id, data in current.items()],
+                       [DocumentChange(kind, snapshot(doc_id, data)) for kind, doc_id, data in changes],
+                       datetime.now(timezone.utc))
+
+    def unsubscribe(self):
+        self.is_active = False
+        self._query._client._unregister(self)
+
+class MemoryClient:
+    """
+    Client en mémoire : {collection: {doc_id: données}}
+
+    Les compteurs reads / writes suivent la facturation Firestore
+    (une lecture par document renvoyé, une écriture par opération).
+    """
+
+    def __init__(self):
+        self._data = {}
+        self._lock = threading.RLock()
+        self._watches = []
+        self._events = queue.Queue()
+        self._dispatcher = None
+        self.reads = 0
+        self.writes = 0
+
+    def _collection(self, name):
+        return self._data.setdefault(name, {})
+
+    def collection(self, name):
+        return CollectionReference(self, name)
+
+    def document(self, path):
+        collection, doc_id = path.split('/', 1)
+        return DocumentReference(self, collection, doc_id)
+
+    def batch(self):
+        return WriteBatch(self)
+
+    def get_all(self, references, field_paths=None, transaction=None, timeout=None):
+        for reference in references:
+            yield reference.get()
+
+    def seed(self, collection, records, id_prefix='doc'):
+        """Insère des documents sans compter d'écritures (préparation des données)"""
+        counter = itertools.count(len(self._collection(collection)))
+        with self._lock:
+            docs = self._collection(collection)
+            for record in records:
+                docs[f"{id_prefix}{next(counter):09d}"] = record
+
+    # ===== LISTENERS =====
+
+    def _register(self, watch):
+        with self._lock:
+            self._watches.append(watch)
+            if self._dispatcher is None:
+                self._dispatcher = threading.Thread(target=self._dispatch, name='memory-backend-watch',
+                                                    daemon=True)
+                self._dispatcher.start()
+        self._events.put(watch)
+
+    def _unregister(self, watch):
+        with self._lock:
+            if watch in self._watches:
+                self._watches.remove(watch)
+
+    def _notify(self, collections):
+        with self._lock:
+            watches = [w for w in self._watches if w._query._collection_name in collections]
+        for watch in watches:
+            self._events.put(watch)
+
+    def _dispatch(self):
+        while True:
+            watch = self._events.get()
+            try:
+                watch._refresh()
+            except Exception:
+                pass
+
+def new_id():
+    """Identifiant aléatoire au format Firestore (20 caractères)"""
+    return ''.join(secrets.choice(_ID_ALPHABET) for _ in range(20))
@@ -0,0 +1,104 @@
+"""
+Chargement parallèle des données d'une page
+Les lectures indépendantes sont lancées ensemble dans un pool de threads
+partagé : la latence de la page tend vers celle de la lecture la plus lente
+au lieu de la somme des allers-retours.
+
+Les fonctions chargées ne doivent appeler ni st.* ni st.session_state :
+les threads du pool n'ont pas de contexte Streamlit. La page lit les
+résultats dans le contexte retourné, puis met à jour la session elle-même.
+"""
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+
+import streamlit as st
+
+from instrumentation import attributed_to, current_session_id
+
+logger = logging.getLogger(__name__)
+
+# Lectures simultanées, toutes sessions confondues
+LOADER_WORKERS = 8
+# Au-delà, la page s'affiche avec les valeurs par défaut des lectures en retard
+PAGE_LOAD_TIMEOUT_SECONDS = 10
+
+class PageContext:
+    """
+    Résultats d'un chargement de page
+
+    Chaque lecture est accessible par son nom (context.expenses). Les lectures
+    en erreur ou en retard valent leur valeur par défaut et sont listées dans
+    context.errors ; context.timings donne la durée de chacune (secondes).
+    """
+
+    def __init__(self, values, errors, timings, elapsed):
+        self._values = values
+        self.errors = errors
+        self.timings = timings
+        self.elapsed = elapsed
+
+    def __getattr__(self, name):
+        try:
+            return self.__dict__['_values'][name]
+        except KeyError:
+            raise AttributeError(name) from None
+
+    def __contains__(self, name):
+        return name in self._values
+
+    def get(self, name, default=None):
+        return self._values.get(name, default)
+
+@st.cache_resource
+def _get_executor():
+    """Pool de threads partagé par toutes les sessions du processus"""
+    return ThreadPoolExecutor(max_workers=LOADER_WORKERS, thread_name_prefix='page-loader')
+
+def _run(name, function, session_id):
+    started = time.perf_counter()
+    # Les appels Firestore du thread sont comptés pour la session qui charge la page
+    with attributed_to(session_id):
+        value = function()
+    return value, time.perf_counter() - started
+
+def load_page_context(loaders, defaults=None, timeout=PAGE_LOAD_TIMEOUT_SECONDS):
+    """
+    Exécute en parallèle des lectures indépendantes
+
+    Args:
+        loaders: Dictionnaire {nom: fonction sans argument}; None pour ignorer une lecture
+        defaults: Valeurs {nom: valeur} utilisées si une lecture échoue ou dépasse le délai
+        timeout: Délai maximal d'attente de l'ensemble (secondes)
+
+    Returns:
+        PageContext
+    """
+    defaults = defaults or {}
+    loaders = {name: function for name, function in loaders.items() if function is not None}
+    session_id = current_session_id()
+    started = time.perf_counter()
+
+    executor = _get_executor()
+    futures = {name: executor.submit(_run, name, function, session_id)
+               for name, function in loaders.items()}
+    wait(futures.values(), timeout=timeout)
+
+    values, errors, timings = {}, {}, {}
+    for name, future in futures.items():
+        if not future.done():
+            errors[name] = TimeoutError(f"{name}: plus de {timeout} s")
+        elif future.exception() is not None:
+            errors[name] = future.exception()
+        else:
+            values[name], timings[name] = future.result()
+            continue
+        values[name] = defaults.get(name)
+        logger.warning("Chargement de '%s' impossible: %s", name, errors[name])
+
+    return PageContext(values, errors, timings, time.perf_counter() - started)
+
+def prefetch(function):
+    """Lance une lecture en arrière-plan pour le rerun suivant, retourne un Future de sa valeur"""
+    session_id = current_session_id()
+    return _get_executor().submit(lambda: _run(None, function, session_id)[0])
@@ -1,32 +1,32 @@
-from firebase_admin import firestore
+import logging
 import time
+from firestore_client import DATA_ERRORS, get_data_access
+from user_context import invalidate_user_context, load_user_context
+
+logger = logging.getLogger(__name__)
 
 def get_db():
-    """Retourne l'instance Firestore"""
-    try:
-        return firestore.client()
-    except:
-        return None
+    """Retourne l'instance Firestore partagée"""
+    return get_data_access().get_client()
 
 # ===== GESTION DES UTILISATEURS =====
 
 def get_all_users():
     """Récupère la liste de tous les utilisateurs"""
-    db = get_db()
-    if not db:
+    context = load_user_context()
+    if not context:
         return ['Margaux', 'Souliman']  # Valeurs par défaut
     
     try:
-        config_ref = db.collection('config').document('users')
-        doc = config_ref.get()
-        
-        if doc.exists:
-            return doc.to_dict().get('list', ['Margaux', 'Souliman'])
+        if context['users'] is not None:
+            return context['users'].get('list', ['Margaux', 'Souliman'])
         else:
             # Créer la configuration initiale
-            config_ref.set({'list': ['Margaux', 'Souliman']})
+            get_db().collection('config').document('users').set({'list': ['Margaux', 'Souliman']})
+            invalidate_user_context()
             return ['Margaux', 'Souliman']
-    except:
+    except DATA_ERRORS as e:
+        logger.warning("Lecture des utilisateurs impossible: %s", e)
         return ['Margaux', 'Souliman']
 
 def add_user(username):
@@ -46,12 +46,14 @@ def add_user(username):
             profile_ref = db.collection('user_profiles').document(username)
             profile_ref.set({
                 'created_at': time.time(),
-                'profile_image': None
+                'profile_image_hash': None
             })
+            invalidate_user_context()
             
             return True
         return False
-    except:
+    except DATA_ERRORS as e:
+        logger.warning("Ajout de l'utilisateur %s impossible: %s", username, e)
         return False
 
 def delete_user(username):
@@ -69,31 +71,32 @@ def delete_user(username):
             
             # Optionnel: supprimer le profil utilisateur
             # db.collection('user_profiles').document(username).delete()
+            invalidate_user_context()
             
             return True
         return False
-    except:
+    except DATA_ERRORS as e:
+        logger.warning("Suppression de l'utilisateur %s impossible: %s", username, e)
         return False
 
 # ===== GESTION NOM DE FAMILLE =====
 
 def get_family_name():
     """Récupère le nom de famille"""
-    db = get_db()
-    if not db:
+    context = load_user_context()
+    if not context:
         return "Famille Duriez"
     
     try:
-        config_ref = db.collection('config').document('family')
-        doc = config_ref.get()
-        
-        if doc.exists:
-            return doc.to_dict().get('name', 'Famille Duriez')
+        if context['family'] is not None:
+            return context['family'].get('name', 'Famille Duriez')
         else:
             # Créer la configuration initiale
-            config_ref.set({'name': 'Famille Duriez'})
+            get_db().collection('config').document('family').set({'name': 'Famille Duriez'})
+            invalidate_user_context()
             return 'Famille Duriez'
-    except:
+    except DATA_ERRORS as e:
+        logger.warning("Lecture du nom de famille impossible: %s", e)
         return "Famille Duriez"
 
 def set_family_name(name):
@@ -105,8 +108,10 @@ def set_family_name(name):
     try:
         config_ref = db.collection('config').document('family')
         config_ref.set({'name': name})
+        invalidate_user_context()
         return True
-    except:
+    except DATA_ERRORS as e:
+        logger.warning("Enregistrement du nom de famille impossible: %s", e)
         return False
 
 # ===== GESTION CATÉGORIES BUDGET =====
@@ -131,24 +136,23 @@ DEFAULT_REVENUE_SOURCES = [
 
 def get_expense_categories():
     """Récupère les catégories de dépenses"""
-    db = get_db()
-    if not db:
-        return DEFAULT_EXPENSE_CATEGORIES
+    context = load_user_context()
+    if not context:
+        return list(DEFAULT_EXPENSE_CATEGORIES)
     
     try:
-        config_ref = db.collection('config').document('budget')
-        doc = config_ref.get()
-        
-        if doc.exists:
-            return doc.to_dict().get('expense_categories', DEFAULT_EXPENSE_CATEGORIES)
+        if context['budget'] is not None:
+            return context['budget'].get('expense_categories', list(DEFAULT_EXPENSE_CATEGORIES))
         else:
             # Créer la configuration initiale
-            config_ref.set({
+            get_db().collection('config').document('budget').set({
                 'expense_categories': DEFAULT_EXPENSE_CATEGORIES,
                 'revenue_sources': DEFAULT_REVENUE_SOURCES
             })
-            return DEFAULT_EXPENSE_CATEGORIES
-    except:
+            invalidate_user_context()
+            return list(DEFAULT_EXPENSE_CATEGORIES)
+    except DATA_ERRORS as e:
+        logger.warning("Lecture des catégories de dépenses impossible: %s", e)
         return DEFAULT_EXPENSE_CATEGORIES
 
 def add_expense_category(category):
@@ -163,9 +167,11 @@ def add_expense_category(category):
             categories.append(category)
             config_ref = db.collection('config').document('budget')
             config_ref.update({'expense_categories': categories})
+            invalidate_user_context()
             return True
         return False
-    except:
+    except DATA_ERRORS as e:
+        logger.warning("Ajout de la catégorie %s impossible: %s", category, e)
         return False
 
 def delete_expense_category(category):
@@ -180,26 +186,26 @@ def delete_expense_category(category):
             categories.remove(category)
             config_ref = db.collection('config').document('budget')
             config_ref.update({'expense_categories': categories})
+            invalidate_user_context()
             return True
         return False
-    except:
+    except DATA_ERRORS as e:
+        logger.warning("Suppression de la catégorie %s impossible: %s", category, e)
         return False
 
 def get_revenue_sources():
     """Récupère les sources de revenus"""
-    db = get_db()
-    if not db:
-        return DEFAULT_REVENUE_SOURCES
+    context = load_user_context()
+    if not context:
+        return list(DEFAULT_REVENUE_SOURCES)
     
     try:
-        config_ref = db.collection('config').document('budget')
-        doc = config_ref.get()
-        
-        if doc.exists:
-            return doc.to_dict().get('revenue_sources', DEFAULT_REVENUE_SOURCES)
+        if context['budget'] is not None:
+            return context['budget'].get('revenue_sources', list(DEFAULT_REVENUE_SOURCES))
         else:
-            return DEFAULT_REVENUE_SOURCES
-    except:
+            return list(DEFAULT_REVENUE_SOURCES)
+    except DATA_ERRORS as e:
+        logger.warning("Lecture des sources de revenus impossible: %s", e)
         return DEFAULT_REVENUE_SOURCES
 
 def add_revenue_source(source):
@@ -214,9 +220,11 @@ def add_revenue_source(source):
             sources.append(source)
             config_ref = db.collection('config').document('budget')
             config_ref.update({'revenue_sources': sources})
+            invalidate_user_context()
             return True
         return False
-    except:
+    except DATA_ERRORS as e:
+        logger.warning("Ajout de la source %s impossible: %s", source, e)
         return False
 
 def delete_revenue_source(source):
@@ -231,31 +239,32 @@ def delete_revenue_source(source):
             sources.remove(source)
             config_ref = db.collection('config').document('budget')
             config_ref.update({'revenue_sources': sources})
+            invalidate_user_context()
             return True
         return False
-    except:
+    except DATA_ERRORS as e:
+        logger.warning("Suppression de la source %s impossible: %s", source, e)
         return False
 
 # ===== GESTION THÈMES =====
 
 def get_user_theme(user):
     """Récupère le thème de l'utilisateur"""
-    db = get_db()
-    if not db:
+    context = load_user_context(user)
+    if not context:
         return {'mode': 'dark', 'palette': 'Violet'}
     
     try:
-        theme_ref = db.collection('user_themes').document(user)
-        doc = theme_ref.get()
-        
-        if doc.exists:
-            return doc.to_dict()
+        if context['theme'] is not None:
+            return context['theme']
         else:
             # Thème par défaut
             default_theme = {'mode': 'dark', 'palette': 'Violet'}
-            theme_ref.set(default_theme)
+            get_db().collection('user_themes').document(user).set(default_theme)
+            invalidate_user_context(user)
             return default_theme
-    except:
+    except DATA_ERRORS as e:
+        logger.warning("Lecture du thème de %s impossible: %s", user, e)
         return {'mode': 'dark', 'palette': 'Violet'}
 
 def save_user_theme(user, mode, palette):
@@ -271,6 +280,78 @@ def save_user_theme(user, mode, palette):
             'palette': palette,
             'updated_at': time.time()
         })
+        invalidate_user_context(user)
+        return True
+    except DATA_ERRORS as e:
+        logger.warning("Enregistrement du thème de %s impossible: %s", user, e)
+        return False
+
+# ===== RÈGLES D'IMPORT BANCAIRE =====
+
+def get_import_rules():
+    """Récupère les règles de catégorisation des relevés bancaires"""
+    from import_service import DEFAULT_IMPORT_RULES
+    context = load_user_context()
+    if not context:
+        return list(DEFAULT_IMPORT_RULES)
+
+    try:
+        if context['budget'] and context['budget'].get('import_rules'):
+            return [(r['keyword'], r['category']) for r in context['budget']['import_rules']]
+        return list(DEFAULT_IMPORT_RULES)
+    except DATA_ERRORS as e:
+        logger.warning("Lecture des règles d'import impossible: %s", e)
+        return list(DEFAULT_IMPORT_RULES)
+
+def unknown_rule_categories(rules):
+    """Catégories des règles d'import qui ne sont pas des catégories de dépenses du budget"""
+    from budget_service import CATEGORIES_DEPENSES
+    return sorted({category for _, category in rules} - set(CATEGORIES_DEPENSES))
+
+def save_import_rules(rules):
+    """Sauvegarde les règles de catégorisation (liste de couples mot-clé, catégorie)"""
+    db = get_db()
+    if not db or unknown_rule_categories(rules):
+        return False
+
+    try:
+        config_ref = db.collection('config').document('budget')
+        config_ref.set({
+            'import_rules': [{'keyword': k, 'category': c} for k, c in rules]
+        }, merge=True)
+        invalidate_user_context()
+        return True
+    except DATA_ERRORS as e:
+        logger.warning("Enregistrement des règles d'import impossible: %s", e)
+        return False
+
+# ===== RÉTENTION DES NOTIFICATIONS =====
+
+DEFAULT_NOTIFICATION_POLICY = {
+    'ttl_days': 90,            # Suppression automatique (TTL Firestore sur 'expire_at')
+    'compact_after_days': 14   # Les notifications lues plus anciennes sont résumées
+}
+
+def get_notification_policy():
+    """Récupère la politique de rétention des notifications"""
+    context = load_user_context()
+    if not context or not context['notifications']:
+        return dict(DEFAULT_NOTIFICATION_POLICY)
+    return {**DEFAULT_NOTIFICATION_POLICY, **context['notifications']}
+
+def save_notification_policy(ttl_days, compact_after_days):
+    """Sauvegarde la politique de rétention des notifications"""
+    db = get_db()
+    if not db:
+        return False
+
+    try:
+        db.collection('config').document('notifications').set({
+            'ttl_days': int(ttl_days),
+            'compact_after_days': int(compact_after_days)
+        }, merge=True)
+        invalidate_user_context()
         return True
-    except:
+    except DATA_ERRORS as e:
+        logger.warning("Enregistrement de la politique des notifications impossible: %s", e)
         return False
@@ -0,0 +1,99 @@
+"""
+Dépenses récurrentes du module Budget
+Une règle par dépense mensuelle ou annuelle : les occurrences sont calculées
+à la demande pour la période affichée, sans créer de documents.
+"""
+import numpy as np
+import pandas as pd
+
+from ledger_store import MOIS, SUMMARY_COLUMNS, TYPE_DEPENSE, summary_frame
+
+# Nombre de mois entre deux occurrences
+RECURRENCE_STEPS = {'Mensuel': 1, 'Annuel': 12}
+
+# Index de mois au-delà de toute période affichée (règle sans fin)
+OPEN_END = np.iinfo(np.int32).max
+
+OCCURRENCE_COLUMNS = ['doc_id', 'rule_id', 'Type', 'Catégories', 'Montant', 'Mois', 'Année',
+                      'Utilisateur', 'Fréquence', 'Description']
+
+def month_index(year, month):
+    """Numéro absolu d'un mois (année * 12 + rang du mois)"""
+    return int(year) * 12 + MOIS.index(month)
+
+def _rule_arrays(rules):
+    """Convertit les règles en colonnes NumPy (mois de début, de fin et pas)"""
+    rules = [r for r in rules if r.get('Fréquence') in RECURRENCE_STEPS]
+    start = np.array([month_index(r['AnnéeDébut'], r['MoisDébut']) for r in rules], dtype=np.int32)
+    end = np.array([month_index(r['AnnéeFin'], r['MoisFin']) if r.get('AnnéeFin') else OPEN_END
+                    for r in rules], dtype=np.int32)
+    step = np.array([RECURRENCE_STEPS[r['Fréquence']] for r in rules], dtype=np.int32)
+    return rules, start, end, step
+
+def expand_rules(rules, start_year, end_year=None, months=None):
+    """
+    Calcule les occurrences des règles sur une période, sans boucle par occurrence
+
+    La période est une grille (règles x mois) : une occurrence existe là où le
+    mois est dans l'intervalle de la règle et tombe sur son pas.
+
+    Args:
+        rules: Règles (documents 'recurring_expenses', avec 'doc_id')
+        start_year: Première année de la période
+        end_year: Dernière année (start_year si None)
+        months: Mois à inclure (tous si None)
+
+    Returns:
+        DataFrame d'une ligne par occurrence (colonnes OCCURRENCE_COLUMNS)
+    """
+    rules, start, end, step = _rule_arrays(rules)
+    end_year = start_year if end_year is None else end_year
+    window = np.arange(int(start_year) * 12, (int(end_year) + 1) * 12, dtype=np.int32)
+    if months:
+        window = window[np.isin(window % 12, [MOIS.index(m) for m in months])]
+    if not rules or window.size == 0:
+        return pd.DataFrame(columns=OCCURRENCE_COLUMNS)
+
+    grid = window[np.newaxis, :]
+    mask = ((grid >= start[:, np.newaxis]) & (grid <= end[:, np.newaxis])
+            & ((grid - start[:, np.newaxis]) % step[:, np.newaxis] == 0))
+    rule_pos, window_pos = np.nonzero(mask)
+    occurrence = window[window_pos]
+
+    def column(field, default=''):
+        return np.array([r.get(field, default) for r in rules], dtype=object)[rule_pos]
+
+    rule_ids = column('doc_id')
+    years = occurrence // 12
+    df = pd.DataFrame({
+        # Identifiant stable d'une occurrence : '<règle>:<AAAA>-<MM>'
+        'doc_id': (pd.Series(rule_ids, dtype=object) + ':' + pd.Series(years).astype(str)
+                   + '-' + pd.Series(occurrence % 12 + 1).astype(str).str.zfill(2)),
+        'rule_id': rule_ids,
+        'Type': TYPE_DEPENSE,
+        'Catégories': column('Catégories'),
+        'Montant': np.array([float(r.get('Montant', 0)) for r in rules])[rule_pos],
+        'Mois': pd.Categorical.from_codes(occurrence % 12, categories=MOIS, ordered=True),
+        'Année': years.astype('int16'),
+        'Utilisateur': column('Utilisateur'),
+        'Fréquence': column('Fréquence'),
+        'Description': column('Description')
+    }, columns=OCCURRENCE_COLUMNS)
+    return df
+
+def recurring_summary(rules, year):
+    """
+    Résumé (mois, catégorie, utilisateur) des occurrences d'une année
+
+    Returns:
+        DataFrame aux colonnes SUMMARY_COLUMNS, à concaténer au résumé annuel
+    """
+    occurrences = expand_rules(rules, year)
+    if occurrences.empty:
+        return summary_frame({})
+    grouped = occurrences.groupby(['Mois', 'Catégories', 'Utilisateur'], observed=True)['Montant']
+    df = grouped.agg(expense_total='sum', expense_count='count').reset_index()
+    df['Mois'] = df['Mois'].astype(str)
+    df['revenue_total'] = 0.0
+    df['revenue_count'] = 0
+    return df[SUMMARY_COLUMNS]
@@ -2,6 +2,9 @@
 Gestionnaire de thème global pour Famileasy
 Applique le thème (clair/sombre + palette) sur toute l'application
 """
+import re
+from functools import lru_cache
+
 import streamlit as st
 
 # Palettes de couleurs disponibles
@@ -38,9 +41,240 @@ PALETTES = {
     }
 }
 
+# Couleurs de chaque mode d'affichage
+MODES = {
+    'dark': {
+        'bg': '#1a1d24',
+        'text': '#e0e0e0',
+        'card-bg': 'linear-gradient(135deg, #2d3142 0%, #1f2230 100%)',
+        'card-hover': 'linear-gradient(135deg, #3d4152 0%, #2d3142 100%)',
+        'input-bg': '#2d3142',
+        'border': '#3d4152',
+        'text-secondary': '#a0a0a0'
+    },
+    'light': {
+        'bg': '#f7fafc',
+        'text': '#2d3748',
+        'card-bg': 'linear-gradient(135deg, #ffffff 0%, #f7fafc 100%)',
+        'card-hover': 'linear-gradient(135deg, #edf2f7 0%, #e2e8f0 100%)',
+        'input-bg': '#ffffff',
+        'border': '#e2e8f0',
+        'text-secondary': '#718096'
+    }
+}
+
+# Feuille de style commune à tous les thèmes : les couleurs sont lues dans
+# des variables CSS définies par get_theme_variables_css()
+THEME_STYLESHEET = """
+    /* ===== CONFIGURATION GLOBALE ===== */
+    .stApp {
+        background-color: var(--fe-bg) !important;
+        color: var(--fe-text) !important;
+    }
+    
+    /* Titres */
+    h1, h2, h3, h4, h5, h6 {
+        color: var(--fe-text) !important;
+    }
+    
+    /* Texte */
+    p, span, div {
+        color: var(--fe-text);
+    }
+    
+    /* ===== CARTES ===== */
+    .metric-card {
+        background: var(--fe-card-bg) !important;
+        padding: 20px;
+        border-radius: 15px;
+        box-shadow: 0 4px 6px rgba(0, 0, 0, 0.3);
+        margin-bottom: 20px;
+    }
+    
+    .module-card {
+        background: var(--fe-card-bg) !important;
+        padding: 25px;
+        border-radius: 20px;
+        box-shadow: 0 4px 20px rgba(0, 0, 0, 0.3);
+        transition: all 0.3s cubic-bezier(0.68, -0.55, 0.265, 1.55);
+        cursor: pointer;
+        height: 180px;
+        border: 2px solid transparent;
+    }
+    
+    .module-card:hover {
+        transform: translateY(-8px) scale(1.02);
+        box-shadow: 0 12px 40px var(--fe-primary-glow);
+        border: 2px solid var(--fe-primary);
+        background: var(--fe-card-hover) !important;
+    }
+    
+    /* ===== HEADER ===== */
+    .dashboard-header {
+        background: var(--fe-gradient) !important;
+        padding: 30px;
+        border-radius: 20px;
+        margin-bottom: 30px;
+        box-shadow: 0 8px 32px rgba(0, 0, 0, 0.4);
+    }
+    
+    /* ===== BOUTONS ===== */
+    .stButton > button {
+        background: var(--fe-gradient) !important;
+        color: white !important;
+        border: none !important;
+        border-radius: 10px;
+        padding: 10px 20px;
+        font-weight: 500;
+        transition: all 0.3s ease;
+    }
+    
+    .stButton > button:hover {
+        opacity: 0.9;
+        box-shadow: 0 4px 12px var(--fe-primary-shadow);
+        transform: translateY(-2px);
+    }
+    
+    /* ===== FORMULAIRES ===== */
+    .stTextInput > div > div > input,
+    .stSelectbox > div > div > select,
+    .stNumberInput > div > div > input,
+    .stTextArea > div > div > textarea {
+        background-color: var(--fe-input-bg) !important;
+        color: var(--fe-text) !important;
+        border: 1px solid var(--fe-border) !important;
+        border-radius: 8px;
+    }
+    
+    .stTextInput label, .stSelectbox label, .stNumberInput label {
+        color: var(--fe-text) !important;
+    }
+    
+    /* ===== TABS ===== */
+    .stTabs [data-baseweb="tab-list"] {
+        gap: 10px;
+        background-color: var(--fe-bg);
+    }
+    
+    .stTabs [data-baseweb="tab"] {
+        background-color: var(--fe-input-bg) !important;
+        color: var(--fe-text) !important;
+        border-radius: 10px 10px 0 0;
+        padding: 10px 20px;
+    }
+    
+    .stTabs [aria-selected="true"] {
+        background: var(--fe-gradient) !important;
+        color: white !important;
+    }
+    
+    /* ===== MÉTRIQUES ===== */
+    [data-testid="stMetricValue"] {
+        font-size: 28px;
+        color: var(--fe-text) !important;
+    }
+    
+    [data-testid="stMetricLabel"] {
+        color: var(--fe-text-secondary) !important;
+    }
+    
+    [data-testid="stMetricDelta"] {
+        color: var(--fe-text-secondary) !important;
+    }
+    
+    /* ===== DATAFRAMES ===== */
+    .dataframe {
+        background-color: var(--fe-input-bg) !important;
+        color: var(--fe-text) !important;
+    }
+    
+    .dataframe th {
+        background-color: var(--fe-primary) !important;
+        color: white !important;
+    }
+    
+    /* ===== EXPANDER ===== */
+    .streamlit-expanderHeader {
+        background-color: var(--fe-input-bg) !important;
+        color: var(--fe-text) !important;
+    }
+    
+    /* ===== SIDEBAR ===== */
+    [data-testid="stSidebar"] {
+        background-color: var(--fe-input-bg) !important;
+    }
+    
+    [data-testid="stSidebar"] .stMarkdown {
+        color: var(--fe-text) !important;
+    }
+    
+    /* ===== ALERT BOXES ===== */
+    .stAlert {
+        background-color: var(--fe-input-bg) !important;
+        color: var(--fe-text) !important;
+        border-left: 4px solid var(--fe-primary);
+    }
+    
+    /* ===== RADIO BUTTONS ===== */
+    .stRadio > label {
+        color: var(--fe-text) !important;
+    }
+    
+    /* ===== PRÉVISUALISATION COULEUR ===== */
+    .color-preview {
+        width: 100%;
+        height: 60px;
+        border-radius: 10px;
+        background: var(--fe-gradient);
+        display: flex;
+        align-items: center;
+        justify-content: center;
+        color: white;
+        font-weight: bold;
+        margin: 10px 0;
+    }
+    
+    /* ===== SPINNER ===== */
+    .stSpinner > div {
+        border-top-color: var(--fe-primary) !important;
+    }
+"""
+
+def _minify_css(css):
+    """Supprime commentaires et espaces superflus d'une feuille de style"""
+    css = re.sub(r'/\*.*?\*/', '', css, flags=re.S)
+    css = re.sub(r'\s+', ' ', css)
+    css = re.sub(r'\s*([{}:;,>])\s*', r'\1', css)
+    return css.replace(';}', '}').strip()
+
+# Minifiée une seule fois, à l'import
+BASE_CSS = f"<style>{_minify_css(THEME_STYLESHEET)}</style>"
+
+@lru_cache(maxsize=None)
+def get_theme_variables_css(mode='dark', palette_name='Violet'):
+    """
+    Retourne le bloc de variables CSS d'un thème (quelques centaines d'octets)
+    
+    Args:
+        mode: 'dark' ou 'light'
+        palette_name: Nom de la palette dans PALETTES
+    """
+    palette = PALETTES.get(palette_name, PALETTES['Violet'])
+    colors = MODES.get(mode, MODES['light'])
+    variables = {
+        **colors,
+        'primary': palette['primary'],
+        'primary-glow': f"{palette['primary']}80",
+        'primary-shadow': f"{palette['primary']}66",
+        'gradient': palette['gradient']
+    }
+    declarations = ';'.join(f"--fe-{name}:{value}" for name, value in variables.items())
+    return f"<style>:root{{{declarations}}}</style>"
+
+@lru_cache(maxsize=None)
 def get_theme_css(mode='dark', palette_name='Violet'):
     """
-    Génère le CSS complet selon le thème choisi
+    Retourne le CSS complet selon le thème choisi (mémorisé par mode et palette)
     
     Args:
         mode: 'dark' ou 'light'
@@ -49,203 +283,7 @@ def get_theme_css(mode='dark', palette_name='Violet'):
     Returns:
         String contenant le CSS à appliquer
     """
-    
-    palette = PALETTES.get(palette_name, PALETTES['Violet'])
-    
-    # Couleurs selon le mode
-    if mode == 'dark':
-        bg_color = '#1a1d24'
-        text_color = '#e0e0e0'
-        card_bg = 'linear-gradient(135deg, #2d3142 0%, #1f2230 100%)'
-        card_hover = 'linear-gradient(135deg, #3d4152 0%, #2d3142 100%)'
-        input_bg = '#2d3142'
-        border_color = '#3d4152'
-        text_secondary = '#a0a0a0'
-    else:  # light
-        bg_color = '#f7fafc'
-        text_color = '#2d3748'
-        card_bg = 'linear-gradient(135deg, #ffffff 0%, #f7fafc 100%)'
-        card_hover = 'linear-gradient(135deg, #edf2f7 0%, #e2e8f0 100%)'
-        input_bg = '#ffffff'
-        border_color = '#e2e8f0'
-        text_secondary = '#718096'
-    
-    return f"""
-    <style>
-        /* ===== CONFIGURATION GLOBALE ===== */
-        .stApp {{
-            background-color: {bg_color} !important;
-            color: {text_color} !important;
-        }}
-        
-        /* Titres */
-        h1, h2, h3, h4, h5, h6 {{
-            color: {text_color} !important;
-        }}
-        
-        /* Texte */
-        p, span, div {{
-            color: {text_color};
-        }}
-        
-        /* ===== CARTES ===== */
-        .metric-card {{
-            background: {card_bg} !important;
-            padding: 20px;
-            border-radius: 15px;
-            box-shadow: 0 4px 6px rgba(0, 0, 0, 0.3);
-            margin-bottom: 20px;
-        }}
-        
-        .module-card {{
-            background: {card_bg} !important;
-            padding: 25px;
-            border-radius: 20px;
-            box-shadow: 0 4px 20px rgba(0, 0, 0, 0.3);
-            transition: all 0.3s cubic-bezier(0.68, -0.55, 0.265, 1.55);
-            cursor: pointer;
-            height: 180px;
-            border: 2px solid transparent;
-        }}
-        
-        .module-card:hover {{
-            transform: translateY(-8px) scale(1.02);
-            box-shadow: 0 12px 40px {palette['primary']}80;
-            border: 2px solid {palette['primary']};
-            background: {card_hover} !important;
-        }}
-        
-        /* ===== HEADER ===== */
-        .dashboard-header {{
-            background: {palette['gradient']} !important;
-            padding: 30px;
-            border-radius: 20px;
-            margin-bottom: 30px;
-            box-shadow: 0 8px 32px rgba(0, 0, 0, 0.4);
-        }}
-        
-        /* ===== BOUTONS ===== */
-        .stButton > button {{
-            background: {palette['gradient']} !important;
-            color: white !important;
-            border: none !important;
-            border-radius: 10px;
-            padding: 10px 20px;
-            font-weight: 500;
-            transition: all 0.3s ease;
-        }}
-        
-        .stButton > button:hover {{
-            opacity: 0.9;
-            box-shadow: 0 4px 12px {palette['primary']}66;
-            transform: translateY(-2px);
-        }}
-        
-        /* ===== FORMULAIRES ===== */
-        .stTextInput > div > div > input,
-        .stSelectbox > div > div > select,
-        .stNumberInput > div > div > input,
-        .stTextArea > div > div > textarea {{
-            background-color: {input_bg} !important;
-            color: {text_color} !important;
-            border: 1px solid {border_color} !important;
-            border-radius: 8px;
-        }}
-        
-        .stTextInput label, .stSelectbox label, .stNumberInput label {{
-            color: {text_color} !important;
-        }}
-        
-        /* ===== TABS ===== */
-        .stTabs [data-baseweb="tab-list"] {{
-            gap: 10px;
-            background-color: {bg_color};
-        }}
-        
-        .stTabs [data-baseweb="tab"] {{
-            background-color: {input_bg} !important;
-            color: {text_color} !important;
-            border-radius: 10px 10px 0 0;
-            padding: 10px 20px;
-        }}
-        
-        .stTabs [aria-selected="true"] {{
-            background: {palette['gradient']} !important;
-            color: white !important;
-        }}
-        
-        /* ===== MÉTRIQUES ===== */
-        [data-testid="stMetricValue"] {{
-            font-size: 28px;
-            color: {text_color} !important;
-        }}
-        
-        [data-testid="stMetricLabel"] {{
-            color: {text_secondary} !important;
-        }}
-        
-        [data-testid="stMetricDelta"] {{
-            color: {text_secondary} !important;
-        }}
-        
-        /* ===== DATAFRAMES ===== */
-        .dataframe {{
-            background-color: {input_bg} !important;
-            color: {text_color} !important;
-        }}
-        
-        .dataframe th {{
-            background-color: {palette['primary']} !important;
-            color: white !important;
-        }}
-        
-        /* ===== EXPANDER ===== */
-        .streamlit-expanderHeader {{
-            background-color: {input_bg} !important;
-            color: {text_color} !important;
-        }}
-        
-        /* ===== SIDEBAR ===== */
-        [data-testid="stSidebar"] {{
-            background-color: {input_bg} !important;
-        }}
-        
-        [data-testid="stSidebar"] .stMarkdown {{
-            color: {text_color} !important;
-        }}
-        
-        /* ===== ALERT BOXES ===== */
-        .stAlert {{
-            background-color: {input_bg} !important;
-            color: {text_color} !important;
-            border-left: 4px solid {palette['primary']};
-        }}
-        
-        /* ===== RADIO BUTTONS ===== */
-        .stRadio > label {{
-            color: {text_color} !important;
-        }}
-        
-        /* ===== PRÉVISUALISATION COULEUR ===== */
-        .color-preview {{
-            width: 100%;
-            height: 60px;
-            border-radius: 10px;
-            background: {palette['gradient']};
-            display: flex;
-            align-items: center;
-            justify-content: center;
-            color: white;
-            font-weight: bold;
-            margin: 10px 0;
-        }}
-        
-        /* ===== SPINNER ===== */
-        .stSpinner > div {{
-            border-top-color: {palette['primary']} !important;
-        }}
-    </style>
-    """
+    return get_theme_variables_css(mode, palette_name) + BASE_CSS
 
 def apply_theme(user_profile=None):
     """
@@ -274,9 +312,9 @@ def apply_theme(user_profile=None):
         mode = 'dark'
         palette = 'Violet'
     
-    # Générer et appliquer le CSS
-    css = get_theme_css(mode, palette)
-    st.markdown(css, unsafe_allow_html=True)
+    # Feuille de style commune puis bloc de variables propre au thème
+    st.markdown(BASE_CSS, unsafe_allow_html=True)
+    st.markdown(get_theme_variables_css(mode, palette), unsafe_allow_html=True)
     
     return mode, palette
 
@@ -0,0 +1,147 @@
+"""
+Contexte utilisateur de Famileasy
+Profil, thème, préférences et configuration chargés en une seule lecture
+groupée, mémorisés par processus avec une durée de vie limitée.
+"""
+import copy
+import logging
+import threading
+import time
+
+from firestore_client import get_data_access, get_db
+from local_store import get_local_store
+
+logger = logging.getLogger(__name__)
+
+CONTEXT_TTL_SECONDS = 60
+
+# Documents propres à l'utilisateur et documents de configuration partagés
+USER_DOCUMENTS = {
+    'profile': 'user_profiles',
+    'theme': 'user_themes',
+    'preferences': 'user_preferences'
+}
+CONFIG_DOCUMENTS = {
+    'users': 'users',
+    'family': 'family',
+    'budget': 'budget',
+    'notifications': 'notifications'
+}
+
+_lock = threading.Lock()
+_contexts = {}
+
+def load_user_context(user=None):
+    """
+    Charge le contexte d'un utilisateur (ou la configuration seule si user est None)
+
+    Returns:
+        Dictionnaire {'profile', 'theme', 'preferences', 'users', 'family', 'budget',
+        'notifications'}
+        dont les valeurs sont les documents Firestore (None si absents).
+        Si Firestore est indisponible, la dernière copie locale est retournée
+        (None si aucune n'existe).
+    """
+    cached = _contexts.get(user)
+    if cached and time.time() - cached[0] < CONTEXT_TTL_SECONDS:
+        return copy.deepcopy(cached[1])
+
+    paths = {key: ('config', doc_id) for key, doc_id in CONFIG_DOCUMENTS.items()}
+    if user is not None:
+        paths.update({key: (collection, user) for key, collection in USER_DOCUMENTS.items()})
+
+    db = get_db()
+    if not db:
+        return _load_local_context(paths)
+
+    refs = {key: db.collection(collection).document(doc_id)
+            for key, (collection, doc_id) in paths.items()}
+    try:
+        with get_data_access().track('load_user_context'):
+            # get_all ne garantit pas l'ordre : on associe par chemin
+            snapshots = {snap.reference.path: snap for snap in db.get_all(list(refs.values()))}
+    except Exception as e:
+        logger.warning("Chargement du contexte de %s impossible: %s", user, e)
+        return _load_local_context(paths)
+
+    context = {key: None for key in USER_DOCUMENTS}
+    store = get_local_store()
+    for key, ref in refs.items():
+        snap = snapshots.get(ref.path)
+        context[key] = snap.to_dict() if snap is not None and snap.exists else None
+        # Copie locale servie quand Firestore est injoignable
+        store.put_snapshot(*paths[key], context[key])
+
+    loaded_at = time.time()
+    with _lock:
+        _contexts[user] = (loaded_at, context)
+        if user is not None:
+            # La configuration partagée est rafraîchie au passage
+            _contexts[None] = (loaded_at, {**{key: None for key in USER_DOCUMENTS},
+                                           **{key: context[key] for key in CONFIG_DOCUMENTS}})
+    return copy.deepcopy(context)
+
+def load_user_profiles(users):
+    """
+    Charge les profils de plusieurs utilisateurs en une seule lecture groupée
+
+    Les profils des contextes encore valides sont repris sans lecture.
+
+    Returns:
+        Dictionnaire {utilisateur: profil ou None}
+    """
+    now = time.time()
+    profiles = {}
+    for user in users:
+        cached = _contexts.get(user)
+        if cached and now - cached[0] < CONTEXT_TTL_SECONDS:
+            profiles[user] = copy.deepcopy(cached[1]['profile'])
+    missing = [user for user in users if user not in profiles]
+    if not missing:
+        return profiles
+
+    store = get_local_store()
+    collection = USER_DOCUMENTS['profile']
+    db = get_db()
+    if not db:
+        profiles.update({user: store.get(collection, user) for user in missing})
+        return profiles
+
+    refs = {user: db.collection(collection).document(user) for user in missing}
+    try:
+        with get_data_access().track('load_user_profiles'):
+            snapshots = {snap.reference.path: snap for snap in db.get_all(list(refs.values()))}
+    except Exception as e:
+        logger.warning("Chargement des profils impossible: %s", e)
+        profiles.update({user: store.get(collection, user) for user in missing})
+        return profiles
+
+    for user, ref in refs.items():
+        snap = snapshots.get(ref.path)
+        profiles[user] = snap.to_dict() if snap is not None and snap.exists else None
+        store.put_snapshot(collection, user, profiles[user])
+    return profiles
+
+def _load_local_context(paths):
+    """Construit le contexte depuis la copie locale (None si elle est vide)"""
+    store = get_local_store()
+    context = {key: None for key in USER_DOCUMENTS}
+    for key, (collection, doc_id) in paths.items():
+        context[key] = store.get(collection, doc_id)
+    if all(value is None for value in context.values()):
+        return None
+    return context
+
+def invalidate_user_context(user=None):
+    """
+    Oublie le contexte mémorisé
+
+    Args:
+        user: Utilisateur dont le profil, le thème ou les préférences ont changé.
+            None après une modification de la configuration partagée.
+    """
+    with _lock:
+        if user is None:
+            _contexts.clear()
+        else:
+            _contexts.pop(user, None)
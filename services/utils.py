@@ -1,5 +1,6 @@
 import streamlit as st
-from firebase import get_unread_notifications_count
+from firebase import get_unread_notifications_count, unread_badge
+from instrumentation import debug_panel_enabled, get_call_recorder
 
 def format_currency(amount):
     """Formate un montant en euros"""
@@ -48,7 +49,7 @@ def create_sidebar_navigation():
         try:
             unread = get_unread_notifications_count()
             if unread > 0:
-                st.info(f"🔔 {unread} notification(s)")
+                st.info(f"🔔 {unread_badge(unread)} notification(s)")
         except:
             pass
 
@@ -58,6 +59,51 @@ def create_sidebar_navigation():
             st.session_state.authenticated = False
             st.switch_page("streamlit_app.py")
 
+def render_debug_sidebar():
+    """Affiche le coût Firestore dans la barre latérale si FAMILEASY_DEBUG est défini (en fin de page)"""
+    if debug_panel_enabled():
+        with st.sidebar:
+            render_firestore_debug_panel()
+
+def render_firestore_debug_panel():
+    """Affiche les appels Firestore du rerun et les totaux de la session"""
+    recorder = get_call_recorder()
+    current, previous = recorder.rerun_report()
+    rows, reruns = recorder.session_report()
+
+    with st.expander("🐞 Coût Firestore"):
+        if current is None:
+            st.caption("Aucun appel Firestore dans cette session")
+            return
+
+        st.caption(f"Rerun en cours ({current['page'] or 'page inconnue'}), jusqu'ici")
+        col1, col2, col3 = st.columns(3)
+        col1.metric("Lectures", current['reads'])
+        col2.metric("Écritures", current['writes'])
+        col3.metric("Latence", f"{current['latency'] * 1000:.0f} ms")
+
+        if previous is not None:
+            st.caption(f"Rerun précédent ({previous['page'] or 'page inconnue'}) : "
+                       f"{previous['count']} appels, {previous['reads']} lectures, "
+                       f"{previous['writes']} écritures, {previous['latency'] * 1000:.0f} ms")
+
+        calls = current['calls'] or (previous['calls'] if previous else [])
+        if calls:
+            st.dataframe(
+                [{'Opération': c['op'], 'Collection': c['collection'], 'Docs': c['docs'],
+                  'Lectures': c['reads'], 'ms': c['latency_ms'], 'Appelant': c['caller']} for c in calls],
+                hide_index=True, use_container_width=True
+            )
+
+        st.caption(f"Session : {reruns} rerun(s), {sum(r['reads'] for r in rows)} lectures, "
+                   f"{sum(r['writes'] for r in rows)} écritures")
+        st.dataframe(
+            [{'Appelant': r['caller'], 'Opération': r['op'], 'Collection': r['collection'],
+              'Appels': r['calls'], 'Lectures': r['reads'], 'Écritures': r['writes'],
+              'ms': round(r['latency'] * 1000, 1)} for r in rows],
+            hide_index=True, use_container_width=True
+        )
+
 def check_user_authentication():
     """Vérifie si l'utilisateur est connecté"""
     if 'user_profile' not in st.session_state or st.session_state.user_profile is None:
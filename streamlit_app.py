@@ -14,9 +14,11 @@ sys.path.insert(0, str(services_dir))
 
 # Imports avec gestion d'erreur
 try:
-    from firebase import init_firebase, load_profile_image
+    from firebase import init_firebase, load_profile_image, start_notification_maintenance
     from parametres_service import get_all_users, get_family_name
+    from user_context import load_user_context
     from theme_manager import apply_theme
+    from utils import render_debug_sidebar
     SERVICES_OK = True
 except ImportError as e:
     SERVICES_OK = False
@@ -29,17 +31,27 @@ st.set_page_config(
     initial_sidebar_state="collapsed"
 )
 
+def load_home_data(user):
+    """Contexte (une lecture groupée : profil, thème, préférences et configuration), puis image de profil"""
+    context = load_user_context(user)
+    return load_profile_image(user) if user is not None and context else None
+
 # Initialiser Firebase
 if SERVICES_OK:
     init_firebase()
+    # Une seule lecture groupée (utilisateurs, famille, thème viennent du même contexte)
+    user_image = load_home_data(st.session_state.get('user_profile'))
+    # Échéances manquantes et compactage des notifications, en arrière-plan (une fois par jour)
+    start_notification_maintenance()
     
-# Charger les utilisateurs et le nom de famille
+# Charger les utilisateurs et le nom de famille (depuis le contexte déjà chargé)
 if SERVICES_OK:
     users_list = get_all_users()
     family_name = get_family_name()
 else:
     users_list = ['Margaux', 'Souliman']
     family_name = "Famille Duriez"
+    user_image = None
 
 # Appliquer le thème de l'utilisateur si connecté
 if SERVICES_OK and 'user_profile' in st.session_state and st.session_state.user_profile is not None:
@@ -115,8 +127,6 @@ if 'user_profile' not in st.session_state or st.session_state.user_profile is No
 
 # --- DASHBOARD PRINCIPAL ---
 # Afficher l'image de profil de l'utilisateur connecté
-user_image = load_profile_image(st.session_state.user_profile) if SERVICES_OK else None
-
 col_avatar, col_header, col_settings = st.columns([1, 5, 1])
 
 with col_avatar:
@@ -357,3 +367,7 @@ st.markdown(f"""
 if st.button("🚪 Changer de profil", key="logout_footer"):
     st.session_state.user_profile = None
     st.rerun()
+
+# Coût Firestore du rerun (FAMILEASY_DEBUG=1), une fois tous les appels de la page faits
+if SERVICES_OK:
+    render_debug_sidebar()
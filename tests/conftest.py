@@ -0,0 +1,29 @@
+"""
+Configuration commune des tests
+Les services sont importés comme les pages les importent (dossier services
+dans sys.path) ; chaque test utilise le backend mémoire et une base locale
+temporaire.
+"""
+import os
+import sys
+from pathlib import Path
+
+import pytest
+
+ROOT = Path(__file__).parent.parent
+sys.path.insert(0, str(ROOT / "services"))
+os.environ.setdefault('FAMILEASY_BACKEND', 'memory')
+
+import local_store  # noqa: E402
+from firestore_client import get_data_access  # noqa: E402
+from memory_backend import MemoryClient  # noqa: E402
+
+@pytest.fixture(autouse=True)
+def client(tmp_path, monkeypatch):
+    """Client Firestore en mémoire et base locale vides pour chaque test"""
+    monkeypatch.setenv('FAMILEASY_BACKEND', 'memory')
+    monkeypatch.setattr(local_store, '_store', local_store.LocalStore(tmp_path / "famileasy.sqlite3"))
+    memory_client = MemoryClient()
+    get_data_access().set_client(memory_client, backend='memory')
+    yield memory_client
+    get_data_access().set_client(None)
@@ -0,0 +1,34 @@
+"""Les erreurs d'accès aux données sont journalisées au lieu d'être masquées"""
+import logging
+
+import pytest
+from google.api_core.exceptions import ServiceUnavailable
+
+import budget_service
+from budget_service import get_year_summary, query_expenses
+
+@pytest.fixture
+def unavailable(client, monkeypatch):
+    """Client dont chaque accès à une collection échoue comme un Firestore injoignable"""
+    def collection(name):
+        raise ServiceUnavailable(f"{name} indisponible")
+    monkeypatch.setattr(client, 'collection', collection)
+    monkeypatch.setattr(budget_service, '_summary_cache', {})
+    return client
+
+def test_failed_query_is_logged(unavailable, caplog):
+    with caplog.at_level(logging.WARNING, logger='budget_service'):
+        assert query_expenses(year=2026) == []
+    assert "Lecture des dépenses (2026) impossible" in caplog.text
+
+def test_failed_summary_is_logged(unavailable, caplog):
+    with caplog.at_level(logging.WARNING, logger='budget_service'):
+        assert get_year_summary(2026) == {}
+    assert "Lecture du résumé 2026 impossible" in caplog.text
+
+def test_programming_errors_are_not_swallowed(client, monkeypatch):
+    def collection(name):
+        raise RuntimeError("bug")
+    monkeypatch.setattr(client, 'collection', collection)
+    with pytest.raises(RuntimeError):
+        query_expenses(year=2026)
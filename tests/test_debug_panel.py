@@ -0,0 +1,30 @@
+"""Panneau de coût Firestore (FAMILEASY_DEBUG)"""
+from streamlit.testing.v1 import AppTest
+
+from conftest import ROOT
+
+PANEL_LABEL = "🐞 Coût Firestore"
+
+def run_budget_page():
+    app = AppTest.from_file(str(ROOT / "pages" / "budget_page.py"), default_timeout=30)
+    app.session_state['user_profile'] = 'Margaux'
+    app.run()
+    assert not app.exception
+    return app
+
+def sidebar_expanders(app):
+    return [expander.label for expander in app.sidebar.expander]
+
+def test_panel_rendered_in_sidebar_when_debug_enabled(monkeypatch, client):
+    monkeypatch.setenv('FAMILEASY_DEBUG', '1')
+    client.seed('expenses', [{'Année': 2026, 'Mois': 'Janvier', 'Catégories': 'Loyer', 'Montant': 500.0,
+                              'Utilisateur': 'Margaux', 'Timestamp': 1.7e9}])
+    app = run_budget_page()
+    assert PANEL_LABEL in sidebar_expanders(app)
+    # Le chargement de la page a fait des lectures, comptées pour ce rerun
+    assert any(metric.label == "Lectures" and int(metric.value) > 0 for metric in app.sidebar.metric)
+
+def test_panel_hidden_by_default(monkeypatch):
+    monkeypatch.delenv('FAMILEASY_DEBUG', raising=False)
+    app = run_budget_page()
+    assert PANEL_LABEL not in sidebar_expanders(app)
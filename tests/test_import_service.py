@@ -0,0 +1,113 @@
+"""Import de relevés bancaires : lecture et dédoublonnage"""
+from datetime import date
+
+import pytest
+
+from import_service import (import_transactions, iter_csv_transactions, iter_ofx_transactions,
+                            statement_date_range, transaction_hash)
+
+CSV_STATEMENT = [
+    "Date opération;Libellé;Montant\n",
+    "02/03/2026;CB CAFE DU PORT;-2,50\n",
+    "02/03/2026;CB CAFE DU PORT;-2,50\n",
+    "03/03/2026;CB CARREFOUR;-45,10\n",
+    "04/03/2026;VIR SALAIRE;1500,00\n",
+]
+
+def ofx_statement(transactions):
+    lines = ["OFXHEADER:100\n<OFX><BANKTRANLIST>\n"]
+    for fitid, day, amount, name in transactions:
+        lines.append(f"<STMTTRN>\n<DTPOSTED>{day}\n<TRNAMT>{amount}\n<FITID>{fitid}\n<NAME>{name}\n</STMTTRN>\n")
+    lines.append("</BANKTRANLIST></OFX>\n")
+    return lines
+
+def run_import(transactions, known_hashes, chunk_size=500):
+    """Importe avec une base d'empreintes en mémoire, complétée par le writer"""
+    written = []
+
+    def writer(rows):
+        written.extend(rows)
+        known_hashes.update(row['ImportHash'] for row in rows)
+        return rows
+
+    stats = import_transactions(transactions, [('CARREFOUR', 'Courses')],
+                                lambda hashes: known_hashes & hashes, writer, chunk_size)
+    return stats, written
+
+def test_identical_purchases_in_one_statement_are_all_imported():
+    stats, rows = run_import(iter_csv_transactions(CSV_STATEMENT), set())
+    assert stats == {'read': 4, 'imported': 3, 'duplicates': 0, 'ignored': 1}
+    coffees = [row for row in rows if row['Description'] == 'CB CAFE DU PORT']
+    assert len(coffees) == 2
+    assert coffees[0]['ImportHash'] != coffees[1]['ImportHash']
+
+def test_reimporting_a_statement_skips_every_line():
+    known = set()
+    _, first = run_import(iter_csv_transactions(CSV_STATEMENT), known)
+    stats, second = run_import(iter_csv_transactions(CSV_STATEMENT), {row['ImportHash'] for row in first})
+    assert not second
+    assert stats['duplicates'] == 3
+
+def test_first_occurrence_keeps_hash_of_earlier_imports():
+    # Empreinte calculée avant la numérotation des occurrences
+    legacy = transaction_hash(date(2026, 3, 2), 2.5, 'CB CAFE DU PORT')
+    stats, rows = run_import(iter_csv_transactions(CSV_STATEMENT), {legacy})
+    assert stats['duplicates'] == 1
+    assert [row['Description'] for row in rows] == ['CB CAFE DU PORT', 'CB CARREFOUR']
+
+def test_ofx_transactions_are_identified_by_fitid():
+    statement = ofx_statement([('A1', '20260302', '-2.50', 'CAFE DU PORT'),
+                               ('A2', '20260302', '-2.50', 'CAFE DU PORT'),
+                               ('A2', '20260302', '-2.50', 'CAFE DU PORT')])
+    assert [t['fitid'] for t in iter_ofx_transactions(statement)] == ['A1', 'A2', 'A2']
+    stats, rows = run_import(iter_ofx_transactions(statement), set())
+    # Le même FITID répété est un doublon, deux FITID distincts sont deux achats
+    assert (stats['imported'], stats['duplicates']) == (2, 1)
+
+    stats, _ = run_import(iter_ofx_transactions(statement), {row['ImportHash'] for row in rows})
+    assert stats['imported'] == 0
+
+def test_statement_date_range():
+    assert statement_date_range(iter_csv_transactions(CSV_STATEMENT)) == (date(2026, 3, 2), date(2026, 3, 4))
+    assert statement_date_range(iter_csv_transactions(CSV_STATEMENT[:1])) is None
+
+def test_duplicates_are_found_across_chunks():
+    statement = ofx_statement([('A1', '20260302', '-2.50', 'CAFE DU PORT'),
+                               ('A2', '20260302', '-2.50', 'CAFE DU PORT'),
+                               ('A1', '20260302', '-2.50', 'CAFE DU PORT')])
+    stats, _ = run_import(iter_ofx_transactions(statement), set(), chunk_size=1)
+    assert (stats['imported'], stats['duplicates']) == (2, 1)
+    stats, rows = run_import(iter_csv_transactions(CSV_STATEMENT), set(), chunk_size=1)
+    assert stats['imported'] == 3 and len({row['ImportHash'] for row in rows}) == 3
+
+def test_statements_sorted_newest_first_are_accepted():
+    header, *lines = CSV_STATEMENT
+    stats, _ = run_import(iter_csv_transactions([header] + lines[::-1]), set())
+    assert stats['imported'] == 3
+
+def test_unsorted_statement_is_rejected():
+    header, first, second, third, fourth = CSV_STATEMENT
+    with pytest.raises(ValueError, match="trié"):
+        run_import(iter_csv_transactions([header, first, third, second, fourth]), set())
+
+def test_imported_hashes_are_looked_up_in_the_local_store(client):
+    from budget_service import find_imported_hashes, sync_statement_years
+
+    client.seed('expenses', [
+        {'Année': 2026, 'Mois': 'Mars', 'Montant': 2.5, 'ImportHash': 'h2026', 'Timestamp': 1.7e9},
+        {'Année': 2024, 'Mois': 'Mars', 'Montant': 2.5, 'ImportHash': 'h2024', 'Timestamp': 1.7e9},
+    ])
+    sync_statement_years(date(2026, 1, 5), date(2026, 3, 4))
+    assert find_imported_hashes({'h2026', 'h2024', 'inconnue'}) == {'h2026'}
+    # Années déjà synchronisées : seuls les changements sont relus
+    client.reads = 0
+    sync_statement_years(date(2026, 1, 5), date(2026, 3, 4))
+    assert client.reads <= 1
+
+def test_import_rules_must_use_budget_categories(client):
+    from parametres_service import get_import_rules, save_import_rules, unknown_rule_categories
+
+    assert unknown_rule_categories([('CARREFOUR', 'Courses'), ('AMAZON', 'Achats en ligne')]) == ['Achats en ligne']
+    assert not save_import_rules([('AMAZON', 'Achats en ligne')])
+    assert save_import_rules([('CARREFOUR', 'Courses')])
+    assert get_import_rules() == [('CARREFOUR', 'Courses')]
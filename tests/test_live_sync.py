@@ -0,0 +1,77 @@
+"""Listeners temps réel : partage entre sessions et compteur de non lues"""
+import time
+
+import pytest
+
+import budget_service
+import firebase
+from budget_service import get_live_notifications, start_live_sync, stop_live_sync
+from firebase import count_unread_notifications, notification_data
+from instrumentation import attributed_to
+
+def wait_for(condition, timeout=2.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if condition():
+            return True
+        time.sleep(0.01)
+    return False
+
+@pytest.fixture(autouse=True)
+def no_listeners():
+    yield
+    with budget_service._sync_lock:
+        budget_service._live_sessions.clear()
+        budget_service._release_listeners(time.time())
+
+def live_keys():
+    return set(budget_service._listeners)
+
+def test_listeners_are_shared_and_closed_with_the_last_session():
+    with attributed_to('session-a'):
+        start_live_sync(2026)
+    with attributed_to('session-b'):
+        start_live_sync(2025)
+    assert live_keys() == {('expenses', 2026), ('revenues', 2026),
+                           ('expenses', 2025), ('revenues', 2025), ('notifications', None)}
+
+    with attributed_to('session-a'):
+        stop_live_sync()
+    assert live_keys() == {('expenses', 2025), ('revenues', 2025), ('notifications', None)}
+
+    with attributed_to('session-b'):
+        stop_live_sync()
+    assert live_keys() == set()
+
+def test_changing_year_releases_the_previous_one():
+    with attributed_to('session-a'):
+        start_live_sync(2025)
+        start_live_sync(2026)
+    assert ('expenses', 2025) not in live_keys()
+    assert ('expenses', 2026) in live_keys()
+
+def test_sessions_that_stop_renewing_are_released(monkeypatch):
+    with attributed_to('closed-tab'):
+        start_live_sync(2026)
+    monkeypatch.setattr(budget_service, 'LIVE_SESSION_TIMEOUT_SECONDS', -1)
+    budget_service.release_idle_live_sync()
+    assert live_keys() == set()
+
+def test_notifications_listener_counts_household_unread_notifications(client, monkeypatch):
+    monkeypatch.setattr(budget_service, 'UNREAD_BADGE_LIMIT', 3)
+    monkeypatch.setattr(firebase, 'UNREAD_BADGE_LIMIT', 3)
+    for i in range(2):
+        client.collection('notifications').document(f'a{i}').set(notification_data('t', 'm', 'alice'))
+    client.collection('notifications').document('b').set(notification_data('t', 'm', 'bob'))
+
+    with attributed_to('session-a'):
+        start_live_sync(2026)
+    # Les notifications de tous les membres, comme le panneau
+    assert wait_for(lambda: get_live_notifications()[0] == 3)
+    assert count_unread_notifications() == 3
+
+    # Listener et comptage s'arrêtent à UNREAD_BADGE_LIMIT + 1 documents
+    for i in range(2, 6):
+        client.collection('notifications').document(f'a{i}').set(notification_data('t', 'm', 'alice'))
+    assert wait_for(lambda: get_live_notifications()[0] == 4)
+    assert count_unread_notifications() == 4
@@ -0,0 +1,180 @@
+"""Backend mémoire : comportement attendu de Firestore"""
+import threading
+from datetime import datetime
+
+import pytest
+from google.api_core.exceptions import InvalidArgument
+from google.cloud.firestore_v1.transforms import DELETE_FIELD, SERVER_TIMESTAMP, Increment
+
+from memory_backend import MAX_BATCH_WRITES, ChangeType, MemoryClient, Query
+
+@pytest.fixture
+def memory():
+    client = MemoryClient()
+    client.seed('expenses', [
+        {'Année': 2025, 'Montant': 30.0, 'Mois': 'Mars'},
+        {'Année': 2026, 'Montant': 10.0, 'Mois': 'Janvier'},
+        {'Année': 2026, 'Montant': 20.0, 'Mois': 'Février'},
+        {'Année': 2026, 'Montant': 20.0},
+        {'Année': 2026, 'Mois': 'Avril'},
+    ])
+    return client
+
+def amounts(snapshots):
+    return [snap.get('Montant') for snap in snapshots]
+
+# ===== REQUÊTES =====
+
+def test_order_by_excludes_documents_without_field(memory):
+    docs = memory.collection('expenses').where('Année', '==', 2026).order_by('Montant').get()
+    assert amounts(docs) == [10.0, 20.0, 20.0]
+
+def test_order_by_descending_breaks_ties_by_id(memory):
+    docs = memory.collection('expenses').order_by('Montant', direction=Query.DESCENDING).get()
+    assert amounts(docs) == [30.0, 20.0, 20.0, 10.0]
+    assert [snap.id for snap in docs[1:3]] == ['doc000000002', 'doc000000003']
+
+def test_order_by_mixed_types_follows_firestore_type_order(memory):
+    memory.seed('mixed', [{'Timestamp': 5.0}, {'Timestamp': datetime(2026, 1, 1)}, {'Timestamp': 'a'},
+                          {'Timestamp': None}, {'Timestamp': 1}])
+    docs = memory.collection('mixed').order_by('Timestamp').get()
+    assert [snap.get('Timestamp') for snap in docs] == [None, 1, 5.0, datetime(2026, 1, 1), 'a']
+
+def test_limit_and_start_after_paginate_without_overlap(memory):
+    query = memory.collection('expenses').order_by('Montant')
+    first = query.limit(2).get()
+    second = query.start_after(first[-1]).limit(2).get()
+    assert amounts(first) == [10.0, 20.0]
+    assert amounts(second) == [20.0, 30.0]
+    assert not query.start_after(second[-1]).limit(2).get()
+
+def test_where_operators_and_type_mismatch(memory):
+    collection = memory.collection('expenses')
+    assert len(collection.where('Mois', 'in', ['Mars', 'Avril']).get()) == 2
+    assert amounts(collection.where('Montant', '>', 15).order_by('Montant').get()) == [20.0, 20.0, 30.0]
+    # Comme Firestore, un filtre d'inégalité ne compare que des valeurs du même type
+    assert not collection.where('Montant', '>=', datetime(2020, 1, 1)).get()
+
+def test_select_count_and_read_billing(memory):
+    collection = memory.collection('expenses')
+    memory.reads = 0
+    docs = collection.where('Année', '==', 2026).select(['Mois']).get()
+    assert all(set(snap.to_dict()) <= {'Mois'} for snap in docs)
+    assert memory.reads == 4
+    result = collection.count(alias='total').get()
+    assert result[0][0].value == 5
+    # Une lecture par tranche de 1000 entrées d'index
+    assert memory.reads == 5
+
+# ===== ÉCRITURES =====
+
+def test_set_merge_is_recursive_and_applies_transforms(memory):
+    ref = memory.collection('summaries').document('2026')
+    ref.set({'cells': {'a': {'total': 10, 'count': 1}}, 'note': 'x'})
+    ref.set({'cells': {'a': {'total': Increment(5)}, 'b': {'count': Increment(1)}},
+             'note': DELETE_FIELD, 'updated_at': SERVER_TIMESTAMP}, merge=True)
+    data = ref.get().to_dict()
+    assert data['cells'] == {'a': {'total': 15, 'count': 1}, 'b': {'count': 1}}
+    assert 'note' not in data
+    assert isinstance(data['updated_at'], datetime)
+
+def test_set_without_merge_replaces_document(memory):
+    ref = memory.collection('expenses').document('doc000000001')
+    ref.set({'Montant': 1.0})
+    assert ref.get().to_dict() == {'Montant': 1.0}
+
+def test_update_uses_field_paths_and_requires_document(memory):
+    ref = memory.collection('config').document('users')
+    ref.set({'prefs': {'theme': 'dark', 'lang': 'fr'}})
+    ref.update({'prefs.theme': 'light', 'prefs.lang': DELETE_FIELD, 'visits': Increment(2)})
+    assert ref.get().to_dict() == {'prefs': {'theme': 'light'}, 'visits': 2}
+    with pytest.raises(KeyError):
+        memory.collection('config').document('absent').update({'a': 1})
+
+def test_batch_is_atomic_and_counts_writes(memory):
+    batch = memory.batch()
+    batch.set(memory.collection('expenses').document('new'), {'Montant': 1.0})
+    batch.update(memory.collection('expenses').document('absent'), {'Montant': 2.0})
+    memory.writes = 0
+    with pytest.raises(KeyError):
+        batch.commit()
+    assert not memory.collection('expenses').document('new').get().exists
+    assert memory.writes == 0
+
+    batch = memory.batch()
+    batch.set(memory.collection('expenses').document('new'), {'Montant': 1.0})
+    batch.delete(memory.collection('expenses').document('doc000000000'))
+    batch.commit()
+    assert memory.writes == 2
+    assert not memory.collection('expenses').document('doc000000000').get().exists
+
+def test_batch_rejects_more_than_500_writes(memory):
+    batch = memory.batch()
+    for i in range(MAX_BATCH_WRITES + 1):
+        batch.set(memory.collection('expenses').document(f'bulk{i}'), {'Montant': 1.0})
+    with pytest.raises(InvalidArgument):
+        batch.commit()
+    assert not memory.collection('expenses').document('bulk0').get().exists
+
+def test_stored_data_is_isolated_from_callers(memory):
+    data = {'tags': ['a']}
+    ref = memory.collection('expenses').document('iso')
+    ref.set(data)
+    data['tags'].append('b')
+    snapshot = ref.get().to_dict()
+    snapshot['tags'].append('c')
+    assert ref.get().to_dict() == {'tags': ['a']}
+
+# ===== LISTENERS =====
+
+def watch_events(query):
+    """Démarre un listener, retourne (watch, fonction qui attend le prochain appel)"""
+    events = []
+    received = threading.Condition()
+
+    def callback(docs, changes, read_time):
+        with received:
+            events.append(({snap.id for snap in docs},
+                           sorted((change.type, change.document.id) for change in changes)))
+            received.notify_all()
+
+    def next_event():
+        with received:
+            assert received.wait_for(lambda: events, timeout=5)
+            return events.pop(0)
+
+    return query.on_snapshot(callback), next_event
+
+def test_watch_reports_added_modified_and_removed(memory):
+    watch, next_event = watch_events(memory.collection('expenses').where('Année', '==', 2026))
+    docs, changes = next_event()
+    assert len(docs) == 4
+    assert {kind for kind, _ in changes} == {ChangeType.ADDED}
+
+    expenses = memory.collection('expenses')
+    expenses.document('doc000000001').update({'Montant': 11.0})
+    assert next_event()[1] == [(ChangeType.MODIFIED, 'doc000000001')]
+
+    expenses.document('new').set({'Année': 2026})
+    assert next_event()[1] == [(ChangeType.ADDED, 'new')]
+
+    # Sortir du filtre de la requête vaut une suppression
+    expenses.document('doc000000002').update({'Année': 2025})
+    assert next_event()[1] == [(ChangeType.REMOVED, 'doc000000002')]
+
+    expenses.document('new').delete()
+    docs, changes = next_event()
+    assert changes == [(ChangeType.REMOVED, 'new')]
+    assert 'new' not in docs
+
+    watch.unsubscribe()
+    assert not watch.is_active
+
+def test_watch_ignores_writes_outside_query(memory):
+    watch, next_event = watch_events(memory.collection('expenses').where('Année', '==', 2026))
+    next_event()
+    memory.collection('expenses').document('old').set({'Année': 2020})
+    memory.collection('expenses').document('later').set({'Année': 2026})
+    # Le premier événement reçu concerne le document de la requête
+    assert next_event()[1] == [(ChangeType.ADDED, 'later')]
+    watch.unsubscribe()
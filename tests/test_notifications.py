@@ -0,0 +1,59 @@
+"""Maintenance des notifications : échéances manquantes et compactage"""
+import time
+from datetime import datetime, timedelta, timezone
+
+import firebase
+from firebase import backfill_notification_expiry, compact_notifications, notification_data
+
+DAY = 86400
+
+def add_legacy_notification(client, doc_id, age_days, read=False):
+    """Notification écrite avant la mise en place du TTL (sans 'expire_at')"""
+    client.collection('notifications').document(doc_id).set({
+        'title': doc_id, 'message': '', 'user': 'alice', 'module': 'budget',
+        'timestamp': time.time() - age_days * DAY, 'read': read
+    })
+
+def test_backfill_sets_expire_at_from_notification_date(client, monkeypatch):
+    monkeypatch.setattr(firebase, 'BACKFILL_BATCH_SIZE', 2)
+    for i in range(5):
+        add_legacy_notification(client, f'old{i}', age_days=10 + i)
+    client.collection('notifications').document('new').set(notification_data('t', 'm', 'alice'))
+    new_expiry = client.collection('notifications').document('new').get().to_dict()['expire_at']
+
+    assert backfill_notification_expiry() == 5
+
+    old = client.collection('notifications').document('old0').get().to_dict()
+    created = datetime.fromtimestamp(old['timestamp'], timezone.utc)
+    assert old['expire_at'] == created + timedelta(days=90)
+    assert client.collection('notifications').document('new').get().to_dict()['expire_at'] == new_expiry
+    assert client.collection('config').document('notifications').get().to_dict()['expiry_backfilled']
+
+def test_backfill_runs_only_once(client):
+    add_legacy_notification(client, 'old', age_days=1)
+    assert backfill_notification_expiry() == 1
+    add_legacy_notification(client, 'older', age_days=2)
+    assert backfill_notification_expiry() == 0
+
+def test_compaction_replaces_old_read_notifications_with_digests(client):
+    add_legacy_notification(client, 'old_read', age_days=30, read=True)
+    add_legacy_notification(client, 'old_unread', age_days=30)
+    add_legacy_notification(client, 'recent_read', age_days=1, read=True)
+
+    assert compact_notifications() == 1
+
+    remaining = {doc.id for doc in client.collection('notifications').stream()}
+    assert remaining == {'old_unread', 'recent_read'}
+    digests = [doc.to_dict() for doc in client.collection('notification_digests').stream()]
+    assert len(digests) == 1
+    assert digests[0]['count'] == 1 and digests[0]['modules'] == {'budget': 1}
+    assert 'expire_at' in digests[0]
+
+def test_maintenance_starts_one_background_thread(monkeypatch):
+    monkeypatch.setattr(firebase, '_maintenance_loop', lambda: time.sleep(0.5))
+    monkeypatch.setattr(firebase, '_maintenance_thread', None)
+    firebase.start_notification_maintenance()
+    thread = firebase._maintenance_thread
+    firebase.start_notification_maintenance()
+    assert firebase._maintenance_thread is thread
+    assert thread.daemon and thread.name == 'famileasy-notifications'
@@ -0,0 +1,66 @@
+"""Réplication de la base locale vers Firestore"""
+import threading
+import time
+
+import budget_service
+from budget_service import add_expense, add_expenses_bulk, delete_expense, pending_writes, push_outbox, update_expense
+
+def test_concurrent_pushes_apply_summary_deltas_once(client, monkeypatch):
+    # Pas de thread de réplication : les deux envois sont lancés par le test
+    monkeypatch.setattr(budget_service, 'start_replication', lambda: None)
+    add_expense('Essence', 60.0, 'Ponctuelle', 'Plein', 'Mars', 2026, 'alice')
+
+    # Relecture lente : sans sérialisation, les deux envois liraient le même lot
+    get_all = client.get_all
+    def slow_get_all(references, *args, **kwargs):
+        time.sleep(0.1)
+        return list(get_all(references, *args, **kwargs))
+    monkeypatch.setattr(client, 'get_all', slow_get_all)
+
+    threads = [threading.Thread(target=push_outbox) for _ in range(2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert pending_writes() == 0
+    cells = client.collection('budget_summaries').document('2026').get().to_dict()['cells']
+    assert [cell['expense_count'] for cell in cells.values()] == [1]
+    assert [cell['expense_total'] for cell in cells.values()] == [60.0]
+    assert len(list(client.collection('expenses').stream())) == 1
+
+def test_tombstones_only_for_deletions_and_year_moves(client, monkeypatch):
+    monkeypatch.setattr(budget_service, 'start_replication', lambda: None)
+    doc_id = add_expense('Essence', 60.0, 'Ponctuelle', 'Plein', 'Mars', 2026, 'alice')['doc_id']
+    push_outbox()
+    tombstones = client.collection('expenses_tombstones')
+
+    # Modification dans la même année : relue par la synchronisation incrémentale
+    update_expense(doc_id, 'Essence', 70.0, 'Ponctuelle', 'Plein', 'Mars', 2026, 'alice')
+    push_outbox()
+    assert list(tombstones.stream()) == []
+
+    # Changement d'année : l'ancienne année ne relit plus le document
+    update_expense(doc_id, 'Essence', 70.0, 'Ponctuelle', 'Plein', 'Mars', 2025, 'alice')
+    push_outbox()
+    assert [t.id for t in tombstones.stream()] == [doc_id]
+
+    tombstones.document(doc_id).delete()
+    delete_expense(doc_id, 'alice', 'Essence', 70.0)
+    push_outbox()
+    assert [t.id for t in tombstones.stream()] == [doc_id]
+
+def test_full_bulk_chunk_is_split_within_firestore_batch_limit(client, monkeypatch):
+    monkeypatch.setattr(budget_service, 'start_replication', lambda: None)
+    rows = [{'Catégories': 'Courses', 'Montant': 1.0, 'Mois': 'Mars', 'Année': 2026}
+            for _ in range(budget_service.OUTBOX_BATCH_SIZE)]
+    add_expenses_bulk(rows, 'alice')
+
+    # 500 documents + notification + résumé : deux batchs de 500 opérations au plus
+    assert push_outbox() == 499
+    assert push_outbox() == 1
+    assert pending_writes() == 0
+    assert len(list(client.collection('expenses').stream())) == 500
+    assert len(list(client.collection('notifications').stream())) == 1
+    cells = client.collection('budget_summaries').document('2026').get().to_dict()['cells']
+    assert [cell['expense_count'] for cell in cells.values()] == [500]
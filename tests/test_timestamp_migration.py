@@ -0,0 +1,35 @@
+"""Conversion des 'Timestamp' numériques écrits avant SERVER_TIMESTAMP"""
+import time
+from datetime import datetime, timezone
+
+from budget_service import get_transactions_page, migrate_legacy_timestamps
+
+def expense(description, timestamp):
+    return {'Catégories': 'Essence', 'Montant': 10.0, 'Mois': 'Mars', 'Année': 2026,
+            'Utilisateur': 'alice', 'Description': description, 'Timestamp': timestamp}
+
+def test_legacy_timestamps_are_converted_once(client):
+    legacy = time.time() - 3600
+    client.collection('expenses').document('old').set(expense('ancienne', legacy))
+    client.collection('expenses').document('new').set(expense('récente', datetime.now(timezone.utc)))
+    client.collection('expenses_tombstones').document('gone').set({'doc_id': 'gone', 'Timestamp': legacy})
+
+    assert migrate_legacy_timestamps() == 2
+
+    old = client.collection('expenses').document('old').get().to_dict()
+    assert old['Timestamp'] == datetime.fromtimestamp(legacy, timezone.utc)
+    tombstone = client.collection('expenses_tombstones').document('gone').get().to_dict()
+    assert isinstance(tombstone['Timestamp'], datetime) and 'expire_at' in tombstone
+    assert client.collection('config').document('budget').get().to_dict()['server_timestamps']
+
+    client.collection('expenses').document('older').set(expense('oubliée', legacy))
+    assert migrate_legacy_timestamps() == 0
+
+def test_converted_documents_sort_with_new_ones(client):
+    client.collection('expenses').document('old').set(expense('ancienne', time.time() - 3600))
+    client.collection('expenses').document('new').set(expense('récente', datetime.now(timezone.utc)))
+    client.collection('expenses').document('older').set(expense('plus ancienne', time.time() - 7200))
+    migrate_legacy_timestamps()
+
+    records, _ = get_transactions_page('expenses', 2026, sort='recent')
+    assert [data['doc_id'] for data in records] == ['new', 'old', 'older']
@@ -0,0 +1,56 @@
+"""Tables paginées des dépenses et revenus"""
+import itertools
+import json
+
+import pytest
+
+import memory_backend
+from budget_service import TRANSACTION_SORTS, get_transactions_page
+from conftest import ROOT
+from local_store import get_local_store
+
+FILTERS = {'expenses': ['Catégories', 'Mois', 'Utilisateur'],
+           'revenues': ['Source', 'Mois', 'Utilisateur']}
+
+def declared_indexes():
+    """(collection, champs d'égalité, (champ trié, direction)) de chaque index composite"""
+    indexes = json.loads((ROOT / "firestore.indexes.json").read_text(encoding='utf-8'))['indexes']
+    return {(index['collectionGroup'], frozenset(f['fieldPath'] for f in index['fields'][:-1]),
+             (index['fields'][-1]['fieldPath'], index['fields'][-1]['order']))
+            for index in indexes}
+
+@pytest.mark.parametrize('collection', sorted(FILTERS))
+def test_every_filter_combination_has_a_composite_index(collection):
+    indexes = declared_indexes()
+    for count in range(len(FILTERS[collection]) + 1):
+        for combo in itertools.combinations(FILTERS[collection], count):
+            for field, direction in TRANSACTION_SORTS.values():
+                key = (collection, frozenset(('Année',) + combo), (field, direction))
+                assert key in indexes, f"index manquant : {key}"
+
+def seed_expenses(client, count):
+    records = []
+    for i in range(count):
+        data = {'Catégories': 'Essence', 'Montant': float(i), 'Mois': 'Mars', 'Année': 2026,
+                'Utilisateur': 'alice', 'Description': f'plein {i}', 'Timestamp': 1000.0 + i}
+        client.collection('expenses').document(f'e{i:03d}').set(data)
+        records.append({**data, 'doc_id': f'e{i:03d}'})
+    get_local_store().merge_remote('expenses', records, year=2026, complete=True)
+
+def test_pagination_continues_locally_when_firestore_fails(client, monkeypatch, caplog):
+    seed_expenses(client, 7)
+    first, cursor = get_transactions_page('expenses', 2026, category='Essence', month='Mars',
+                                          page_size=3)
+    assert [data['doc_id'] for data in first] == ['e006', 'e005', 'e004']
+
+    def failing_stream(self, *args, **kwargs):
+        raise RuntimeError("index manquant")
+    monkeypatch.setattr(memory_backend.Query, 'stream', failing_stream)
+
+    second, cursor = get_transactions_page('expenses', 2026, category='Essence', month='Mars',
+                                           page_size=3, start_after=cursor)
+    assert [data['doc_id'] for data in second] == ['e003', 'e002', 'e001']
+    third, cursor = get_transactions_page('expenses', 2026, category='Essence', month='Mars',
+                                          page_size=3, start_after=cursor)
+    assert [data['doc_id'] for data in third] == ['e000'] and cursor is None
+    assert "page lue dans la base locale" in caplog.text